@@ -209,6 +209,12 @@ def cloud_index():
     import alltheitems.cloud
     return alltheitems.cloud.index()
 
+@application.route('/cloud/floor/<y:int>')
+def cloud_floor(y):
+    """The table for one Cloud floor, loaded by the Cloud page."""
+    import alltheitems.cloud
+    return alltheitems.cloud.floor_page(y)
+
 @application.route('/cloud/todo')
 def cloud_todo():
     """A page listing Cloud chests which are incomplete or not full, by priority."""
@@ -283,9 +289,9 @@ def show_item_by_tag(plugin, item_id, tag_value):
 
 @application.route('/stats')
 def stats_page():
-    """A page listing block and item frequencies on the main world."""
+    """A page listing block and item frequencies on the main world, optionally with the changes since the snapshot given by the since query parameter."""
     import alltheitems.stats
-    return alltheitems.stats.index()
+    return alltheitems.stats.index(since=bottle.request.query.since or None)
 
 if __name__ == '__main__':
     bottle.run(app=application, host='0.0.0.0', port=8081)
@@ -2,13 +2,23 @@ import alltheitems.__main__ as ati
 
 import bottle
 import collections
+import concurrent.futures
 import contextlib
 import datetime
+import functools
+import hashlib
 import itertools
 import json
+import numpy
+import os
 import pathlib
 import random
 import re
+import sqlite3
+import threading
+import time
+import traceback
+import types
 import xml.sax.saxutils
 
 import alltheitems.item
@@ -101,6 +111,128 @@ TORCH_FACINGS = {
     5: 'below'
 }
 
+SLAB_VARIANTS = {
+    0: 'stone',
+    1: 'sandstone',
+    2: 'fake wood',
+    3: 'cobblestone',
+    4: 'brick',
+    5: 'stone brick',
+    6: 'Nether brick',
+    7: 'quartz'
+}
+
+STONEBRICK_VARIANTS = {
+    0: 'regular',
+    1: 'mossy',
+    2: 'cracked',
+    3: 'chiseled'
+}
+
+STAIRS_FACINGS = {
+    0: 'west',
+    1: 'east',
+    2: 'south',
+    3: 'north'
+}
+
+# The following tables are keyed by the layer coords of a block in the SmartChest schematic. Where the expected value depends on the wall, it is given as a tuple (left wall, right wall).
+
+COMPARATOR_FACINGS = {
+    (5, -7, 2): (0x2, 0x2), # south
+    (5, -5, 2): (0x2, 0x2), # south
+    (7, -3, 4): (0x0, 0x0), # north
+    (0, -1, 1): (0x0, 0x0), # north
+    (1, -1, 2): (0x0, 0x0), # north
+    (2, 0, 2): (0x1, 0x3), # east / west
+    (2, 0, 3): (0x2, 0x2), # south
+    (4, 0, 2): (0x1, 0x3), # east / west
+    (4, 0, 3): (0x2, 0x2) # south
+}
+
+COMPARATOR_MODES = { # True for subtraction mode
+    (5, -7, 2): False, # compare
+    (5, -5, 2): False, # compare
+    (7, -3, 4): False, # compare
+    (0, -1, 1): False, # compare
+    (1, -1, 2): True, # subtract
+    (2, 0, 2): True, # subtract
+    (2, 0, 3): False, # compare
+    (4, 0, 2): True, #subtract
+    (4, 0, 3): False # compare
+}
+
+REPEATER_FACINGS = {
+    (1, -8, 2): (0x0, 0x0), # north
+    (3, -8, 3): (0x3, 0x1), # west / east
+    (6, -6, 2): (0x0, 0x0), # north
+    (7, -5, 5): (0x2, 0x2), # south
+    (3, -3, 1): (0x1, 0x3) # east / west
+}
+
+REPEATER_DELAYS = { # in game ticks
+    (1, -8, 2): 4,
+    (3, -8, 3): 2,
+    (6, -6, 2): 2,
+    (7, -5, 5): 2,
+    (3, -3, 1): 2
+}
+
+REDSTONE_TORCH_FACINGS = {
+    (3, -8, 1): (1, 2), # west / east
+    (2, -7, 1): (3, 3), # north
+    (4, -6, 1): (2, 1), # east / west
+    (4, -6, 2): (3, 3), # north
+    (4, -5, 1): (1, 2), # west / east
+    (4, -5, 3): (4, 4), # south
+    (7, -5, 3): (3, 3), # north
+    (1, -4, 2): (4, 4), # south
+    (1, -3, 3): (3, 3), # north
+    (1, -1, 4): (4, 4), # south
+    (5, -1, 1): (2, 1), # east / west
+    (3, 0, 3): (4, 4) # south
+}
+
+FURNACE_SIGNALS = {
+    (0, -6, 4): 0,
+    (0, -6, 5): 0,
+    (0, -6, 6): 0,
+    (0, -6, 7): 0,
+    (0, -1, 0): 8,
+    (7, -1, 1): 0,
+    (7, -1, 2): 0,
+    (7, -1, 3): 0,
+    (7, -1, 4): 0,
+    (2, 0, 4): 1,
+    (4, 0, 4): 5
+}
+
+STORAGE_HOPPERS = { # schematic symbol: layer coords of the hoppers with that symbol which are part of the item storage
+    '<': {
+        (5, -7, 4),
+        (6, -5, 4)
+    },
+    '>': {
+        (3, -7, 3),
+        (3, -4, 2)
+    },
+    '^': {
+        (3, -5, 3),
+        (6, -5, 3),
+        (7, -4, 3),
+        (5, -3, 2),
+        (6, -3, 2)
+    },
+    'v': {
+        (3, -7, 4),
+        (4, -7, 4),
+        (2, -6, 3)
+    },
+    'x': {
+        (5, -1, 2)
+    }
+}
+
 HTML_COLORS = {
     'cyan': '#0ff',
     'cyan2': '#0ff',
@@ -110,103 +242,866 @@ HTML_COLORS = {
     'yellow': '#ff0',
     'white': '#fff',
     'white2': '#fff',
+    'pending': '#ccc',
     None: 'transparent'
 }
 
-def hopper_chain_connected(start_coords, end_coords, *, world=None, chunk_cache=None, block_at=None):
-    if world is None:
-        world = alltheitems.world.World()
-    if chunk_cache is None:
-        chunk_cache = {}
-    if block_at is None:
-        block_at=world.block_at
-    visited_coords = set()
-    x, y, z = start_coords
-    while (x, y, z) != end_coords:
-        if (x, y, z) in visited_coords:
-            return False, 'hopper chain points into itself at {} {} {}'.format(x, y, z)
-        visited_coords.add((x, y, z))
-        block = block_at(x, y, z, chunk_cache=chunk_cache)
-        if block['id'] != 'minecraft:hopper':
-            return False, 'block at {} {} {} is not a <a href="/block/minecraft/hopper">hopper</a>'.format(x, y, z, *end_coords)
-        if block['damage'] & 0x7 == 0:
-            y -= 1 # down
-        elif block['damage'] & 0x7 == 2:
-            z -= 1 # north
-        elif block['damage'] & 0x7 == 3:
-            z += 1 # south
-        elif block['damage'] & 0x7 == 4:
-            x -= 1 # west
-        elif block['damage'] & 0x7 == 5:
-            x += 1 # east
+INPUT_CHAIN_START = 14, 61, 32 # the first hopper after the buffer elevator
+INPUT_CHAIN_END = -1, 25, 52 # the half of the uppermost overflow chest into which the input hopper chain is pointing
+OVERFLOW_CHAIN_END = -35, 6, 38 # position of the dropper leading into the Smelting Center's item elevator
+
+HOPPER_OFFSETS = {
+    0: (0, -1, 0), # down
+    2: (0, 0, -1), # north
+    3: (0, 0, 1), # south
+    4: (-1, 0, 0), # west
+    5: (1, 0, 0) # east
+}
+
+class HopperGraph:
+    """The hoppers of a world, each mapped to the block it points into, with memoized reachability.
+
+    Blocks are read lazily while following hopper chains and are never read again, so a graph should only be used for one pass over the Cloud. Since hopper chains share long common suffixes, following a chain usually stops at the first hopper whose result for the same end is already known.
+
+    When a result is looked up, the chunk sections read to follow the chain are added to the world's active recordings, even if the result was memoized.
+    """
+
+    def __init__(self, world=None):
+        if world is None:
+            world = alltheitems.world.World()
+        self.world = world
+        self._nodes = {} # maps coords to (target coords or None if the block is not a hopper, exception for an unknown facing or None, sections read)
+        self._results = {} # maps end coords to dicts mapping coords to (is_connected, coords where the chain breaks, message, sections read), where is_connected is None if message is an exception
+
+    def _node(self, coords):
+        node = self._nodes.get(coords)
+        if node is None:
+            sections = {}
+            with self.world.recording(sections):
+                block = self.world.block_at(*coords)
+            if block['id'] != 'minecraft:hopper':
+                node = None, None, sections
+            elif block['damage'] & 0x7 in HOPPER_OFFSETS:
+                x, y, z = coords
+                offset_x, offset_y, offset_z = HOPPER_OFFSETS[block['damage'] & 0x7]
+                node = (x + offset_x, y + offset_y, z + offset_z), None, sections
+            else:
+                node = None, ValueError('Unknown hopper facing {} at {}'.format(block['damage'] & 0x7, coords)), sections
+            self._nodes[coords] = node
+        return node
+
+    def _resolve(self, start_coords, end_coords):
+        results = self._results.setdefault(end_coords, {})
+        path = []
+        path_indexes = {}
+        coords = start_coords
+        while coords not in results:
+            if coords == end_coords:
+                results[coords] = True, None, None, {}
+                break
+            if coords in path_indexes:
+                # cycle detected, every hopper on the cycle reports itself as the point where the chain points into itself
+                cycle = path[path_indexes[coords]:]
+                del path[path_indexes[coords]:]
+                sections = {}
+                for node_coords in cycle:
+                    sections.update(self._node(node_coords)[2])
+                for node_coords in cycle:
+                    results[node_coords] = False, node_coords, 'hopper chain points into itself at {} {} {}'.format(*node_coords), sections
+                break
+            target, error, sections = self._node(coords)
+            if target is None:
+                if error is None:
+                    results[coords] = False, coords, 'block at {} {} {} is not a <a href="/block/minecraft/hopper">hopper</a>'.format(*coords), sections
+                else:
+                    results[coords] = None, coords, error, sections
+                break
+            path_indexes[coords] = len(path)
+            path.append(coords)
+            coords = target
+        # propagate the result back along the chain
+        for node_coords in reversed(path):
+            is_connected, break_coords, message, target_sections = results[self._node(node_coords)[0]]
+            node_sections = self._node(node_coords)[2]
+            if not node_sections.keys() <= target_sections.keys():
+                target_sections = {**node_sections, **target_sections}
+            results[node_coords] = is_connected, break_coords, message, target_sections
+        return results[start_coords]
+
+    def connected(self, start_coords, end_coords):
+        """Returns a tuple (is_connected, message) like hopper_chain_connected."""
+        is_connected, _, message, sections = self._resolve(start_coords, end_coords)
+        self.world.record(sections)
+        if is_connected is None:
+            raise message
+        return is_connected, message
+
+    def broken_hoppers(self, starts, end_coords):
+        """Follows the hopper chains from each of the given start coords to end_coords. Returns a dict mapping the coords of each block where at least one of the chains breaks to the reason."""
+        result = {}
+        for start_coords in starts:
+            is_connected, break_coords, message, _ = self._resolve(start_coords, end_coords)
+            if not is_connected:
+                result[break_coords] = message if is_connected is False else str(message)
+        return result
+
+def hopper_chain_connected(start_coords, end_coords, *, world=None):
+    return HopperGraph(world).connected(start_coords, end_coords)
+
+def broken_hoppers(*, hopper_graph=None):
+    """Returns a dict mapping the coords of every block where the input hopper chain or the overflow hopper chain of a chest breaks to the reason, following each hopper only once."""
+    if hopper_graph is None:
+        hopper_graph = HopperGraph()
+    result = hopper_graph.broken_hoppers([INPUT_CHAIN_START], INPUT_CHAIN_END)
+    result.update(hopper_graph.broken_hoppers((chest.overflow_chain_start for chest in cloud_layout().chests), OVERFLOW_CHAIN_END))
+    return result
+
+def parse_smart_chest_schematic(smart_chest_layers):
+    """Parses the SmartChest schematic from an open file. Returns a sorted list of (layer_y, rows) tuples, where each row is a string of block symbols indexed by layer_z, and the rows are indexed by layer_x."""
+    layers = {}
+    current_y = None
+    current_layer = None
+    for line in smart_chest_layers:
+        if line == '\n':
+            continue
+        match = re.fullmatch('layer (-?[0-9]+)\n', line)
+        if match:
+            # new layer
+            if current_y is not None:
+                layers[current_y] = tuple(current_layer)
+            current_y = int(match.group(1))
+            current_layer = []
         else:
-            raise ValueError('Unknown hopper facing {} at {}'.format(block['damage'] & 0x7, (x, y, z)))
-    return True, None
+            current_layer.append(line.rstrip('\r\n'))
+    if current_y is not None:
+        layers[current_y] = tuple(current_layer)
+    return sorted(layers.items())
+
+class SmartChestProgram:
+    """The compiled SmartChest schematic for one wall.
+
+    instructions is a list of tuples (offset_x, offset_y, offset_z, check) in schematic order, where the offset is relative to the base coordinate of the chest and check is a function called with the block at that position, its exact x, y, and z coordinates, and the Chest being checked. It returns an error message, or None if the block is correct. Blocks marked as “any block” in the schematic are left out.
+
+    The remaining attributes are arrays with one entry per instruction, describing the blocks which are known to pass their check, see _compile_block_check. They are compared against the SmartChest's bounding box all at once, so only the remaining blocks need to be checked in Python.
+    """
+
+    def __init__(self, instructions, templates):
+        self.instructions = instructions
+        offsets = numpy.array([instruction[:3] for instruction in instructions]).reshape(-1, 3)
+        self.min_offset = tuple(int(offset) for offset in offsets.min(axis=0))
+        self.max_offset = tuple(int(offset) for offset in offsets.max(axis=0))
+        size_x, size_y, size_z = (max_offset - min_offset + 1 for min_offset, max_offset in zip(self.min_offset, self.max_offset))
+        local_x, local_y, local_z = (offsets - self.min_offset).T
+        self.indexes = (local_y * size_z + local_z) * size_x + local_x
+        max_block_ids = max((len(template[0]) for template in templates if template is not None), default=1)
+        self.block_ids = numpy.zeros((len(instructions), max_block_ids), dtype=numpy.uint16)
+        self.damage_masks = numpy.zeros(len(instructions), dtype=numpy.uint8)
+        self.damage_values = numpy.zeros(len(instructions), dtype=numpy.uint8)
+        self.always_check = numpy.zeros(len(instructions), dtype=bool)
+        for i, template in enumerate(templates):
+            if template is None:
+                self.always_check[i] = True
+            else:
+                block_ids, damage_mask, damage_value = template
+                codes = sorted(alltheitems.world.PALETTE.code(block_id) for block_id in block_ids)
+                self.block_ids[i] = codes + codes[:1] * (max_block_ids - len(codes)) # pad by repeating an allowed ID
+                self.damage_masks[i] = damage_mask
+                self.damage_values[i] = damage_value
+
+    def suspects(self, box):
+        """Returns the indexes of the instructions whose blocks in the given Box need to be checked in Python, in order. The box must span exactly from base + min_offset to base + max_offset."""
+        ids = box.ids[self.indexes]
+        damage = box.damage[self.indexes]
+        passed = (ids[:, None] == self.block_ids).any(axis=1) & (damage & self.damage_masks == self.damage_values)
+        return numpy.flatnonzero(~passed | self.always_check)
+
+    def verify(self, world, chest):
+        """Returns the error message for the first incorrect block of the SmartChest of the given Chest, or None if all blocks are correct."""
+        base_x, base_y, base_z = chest.base_x, chest.base_y, chest.base_z
+        min_x, min_y, min_z = self.min_offset
+        max_x, max_y, max_z = self.max_offset
+        box = world.box(base_x + min_x, base_y + min_y, base_z + min_z, base_x + max_x, base_y + max_y, base_z + max_z)
+        instructions = self.instructions
+        for i in self.suspects(box):
+            offset_x, offset_y, offset_z, check = instructions[i]
+            exact_x, exact_y, exact_z = base_x + offset_x, base_y + offset_y, base_z + offset_z
+            message = check(box[exact_x, exact_y, exact_z], exact_x, exact_y, exact_z, chest)
+            if message is not None:
+                return message
+
+def compile_smart_chest_schematic(schematic):
+    """Compiles a parsed SmartChest schematic. Returns a tuple (left wall program, right wall program) of SmartChestProgram objects, so the program for a chest can be looked up using z % 2."""
+    programs = []
+    for left_wall in (True, False):
+        instructions = []
+        templates = []
+        for layer_y, layer in schematic:
+            for layer_x, row in enumerate(layer):
+                for layer_z, block_symbol in enumerate(row):
+                    compiled = _compile_block_check(block_symbol, layer_x, layer_y, layer_z, left_wall)
+                    if compiled is not None:
+                        check, template = compiled
+                        instructions.append((5 - layer_x if left_wall else layer_x - 5, layer_y, 3 - layer_z, check))
+                        templates.append(template)
+        programs.append(SmartChestProgram(instructions, templates))
+    return tuple(programs)
+
+@functools.lru_cache()
+def _smart_chest_cache(document_root):
+    schematic = alltheitems.util.FileCache(document_root / 'static' / 'smartchest.txt', load=parse_smart_chest_schematic)
+    return schematic, schematic.derive(compile_smart_chest_schematic)
 
 def smart_chest_schematic(document_root=ati.document_root):
-    layers = {}
-    with (document_root / 'static' / 'smartchest.txt').open() as smart_chest_layers:
-        current_y = None
-        current_layer = None
-        for line in smart_chest_layers:
-            if line == '\n':
-                continue
-            match = re.fullmatch('layer (-?[0-9]+)\n', line)
-            if match:
-                # new layer
-                if current_y is not None:
-                    layers[current_y] = current_layer
-                current_y = int(match.group(1))
-                current_layer = []
+    return _smart_chest_cache(document_root)[0]()
+
+def smart_chest_program(document_root=ati.document_root):
+    """Returns the compiled SmartChest schematic, see compile_smart_chest_schematic. It is only recompiled when the schematic file changes."""
+    return _smart_chest_cache(document_root)[1]()
+
+def _block_check(block_ids, description, damage_checks=(), *, storage=None, not_implemented=None):
+    """Returns a check function for a block which does not depend on the chest it's part of.
+
+    Required arguments:
+    block_ids -- A collection of the allowed block IDs.
+    description -- How the expected block is called in the error message if the block ID is wrong.
+
+    Optional arguments:
+    damage_checks -- An iterable of (mask, value, message) tuples. The check fails if the block's damage value bitwise and mask is not value. message is a function called with the damage value and the exact coordinates which returns the error message.
+
+    Keyword-only arguments:
+    storage -- If given, the block is a container which must not contain items other than the chest's item, and this is how the container is called in the error message.
+    not_implemented -- If given, a format string for an error message which is returned if all other checks pass, formatted with the exact coordinates.
+
+    Returns:
+    A tuple (check, template) as described in _compile_block_check.
+    """
+    block_ids = frozenset(block_ids)
+    damage_checks = tuple(damage_checks)
+
+    def check(block, exact_x, exact_y, exact_z, chest):
+        if block['id'] not in block_ids:
+            return 'Block at {} {} {} should be {}, is {}.'.format(exact_x, exact_y, exact_z, description, block['id'])
+        if damage_checks:
+            damage = block['damage']
+            for mask, value, message in damage_checks:
+                if damage & mask != value:
+                    return message(damage, exact_x, exact_y, exact_z)
+        if storage is not None:
+            slot = chest.item.first_mismatched_slot(block['tileEntity']['Items'])
+            if slot is not None:
+                return '{} at {} {} {} contains items of the wrong kind: {}.'.format(storage, exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot).link_text())
+        if not_implemented is not None:
+            return not_implemented.format(exact_x, exact_y, exact_z)
+
+    if storage is not None or not_implemented is not None:
+        return check, None
+    damage_mask = damage_value = 0
+    for mask, value, message in damage_checks:
+        if mask & damage_mask or value & ~mask:
+            return check, None # the damage checks can't be combined into a single mask
+        damage_mask |= mask
+        damage_value |= value
+    return check, (block_ids, damage_mask, damage_value)
+
+def _hopper_check(facing, facing_name, layer_coords, block_symbol):
+    return _block_check({'minecraft:hopper'}, 'a hopper', [
+        (0x7, facing, lambda damage, exact_x, exact_y, exact_z: 'Hopper at {} {} {} should be pointing {}, is {}.'.format(exact_x, exact_y, exact_z, facing_name, HOPPER_FACINGS[damage]))
+    ], storage='Storage hopper' if layer_coords in STORAGE_HOPPERS.get(block_symbol, ()) else None)
+
+STONE_TEMPLATE = frozenset({'minecraft:stone'}), 0xff, 0
+
+def _stone_check(block, exact_x, exact_y, exact_z, chest):
+    if block['id'] != 'minecraft:stone':
+        return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
+    if block['damage'] != 0:
+        return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], STONE_VARIANTS[block['damage']])
+
+def _stone_or_bedrock_check(block, exact_x, exact_y, exact_z, chest):
+    if block['id'] != 'minecraft:stone':
+        if exact_y < 5:
+            if block['id'] != 'minecraft:bedrock':
+                return 'Block at {} {} {} should be stone or bedrock, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
+        else:
+            return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
+    if block['damage'] != 0:
+        return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], STONE_VARIANTS[block['damage']])
+
+def _overflow_hopper_check(facing, facing_name, air_message):
+    def check(block, exact_x, exact_y, exact_z, chest):
+        if block['id'] == 'minecraft:hopper':
+            if block['damage'] != facing:
+                return 'Overflow hopper at {} {} {} should be pointing {}, is {}.'.format(exact_x, exact_y, exact_z, facing_name, HOPPER_FACINGS[block['damage']])
+        elif block['id'] == 'minecraft:air':
+            pass # also allow air because some overflow hopper chains don't start on the first floor
+        else:
+            return air_message.format(exact_x, exact_y, exact_z, block['id'])
+
+    return check
+
+def _compile_block_check(block_symbol, layer_x, layer_y, layer_z, left_wall):
+    """Compiles one block of the SmartChest schematic.
+
+    Returns:
+    None if any block is allowed. Otherwise, a tuple (check, template). check is a function as described in compile_smart_chest_schematic. template is a tuple (block_ids, damage_mask, damage_value) such that a block whose ID is in block_ids and whose damage value bitwise and damage_mask is damage_value is known to pass the check, or None if the check always has to be run, e.g. for containers whose items need to be checked.
+    """
+    layer_coords = layer_x, layer_y, layer_z
+    air_check, air_template = _block_check({'minecraft:air'}, 'air')
+    if block_symbol == ' ':
+        # air
+        return air_check, air_template
+    elif block_symbol == '!':
+        # sign
+        return _block_check({'minecraft:wall_sign'}, 'a sign', [
+            (0xff, 4 if left_wall else 5, lambda damage, exact_x, exact_y, exact_z: 'Sign at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z))
+        ])
+    elif block_symbol == '#':
+        # chest
+        return _block_check({'minecraft:chest'}, 'a chest', storage='Storage chest')
+    elif block_symbol == '<':
+        # hopper facing south
+        return _hopper_check(3, 'south', layer_coords, block_symbol)
+    elif block_symbol == '>':
+        # hopper facing north
+        hopper_check, hopper_template = _hopper_check(2, 'north', layer_coords, block_symbol)
+        if layer_y == -7 and layer_x == 0:
+            def check(block, exact_x, exact_y, exact_z, chest):
+                if chest.z < 8:
+                    # the first few chests get ignored because their overflow points in the opposite direction
+                    return #TODO introduce special checks for them
+                return hopper_check(block, exact_x, exact_y, exact_z, chest)
+
+            return check, hopper_template
+        return hopper_check, hopper_template
+    elif block_symbol == '?':
+        # any block
+        return None
+    elif block_symbol == 'C':
+        # comparator
+        damage_checks = []
+        not_implemented = None
+        if layer_coords in COMPARATOR_FACINGS:
+            damage_checks.append((0x3, COMPARATOR_FACINGS[layer_coords][0 if left_wall else 1], lambda damage, exact_x, exact_y, exact_z: 'Comparator at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z)))
+            if layer_coords in COMPARATOR_MODES:
+                subtract = COMPARATOR_MODES[layer_coords]
+                damage_checks.append((0x4, 0x4 if subtract else 0x0, lambda damage, exact_x, exact_y, exact_z: 'Comparator at {} {} {} is in {} mode, should be in {} mode.'.format(exact_x, exact_y, exact_z, 'subtraction' if damage & 0x4 else 'comparison', 'subtraction' if subtract else 'comparison')))
             else:
-                current_layer.append(line.rstrip('\r\n'))
-        if current_y is not None:
-            layers[current_y] = current_layer
-    return sorted(layers.items())
+                not_implemented = 'Mode check for comparator at {{}} {{}} {{}} (relative coords: {} {} {}) not yet implemented.'.format(*layer_coords)
+        else:
+            not_implemented = 'Direction check for comparator at {{}} {{}} {{}} (relative coords: {} {} {}) not yet implemented.'.format(*layer_coords)
+        return _block_check({'minecraft:unpowered_comparator'}, 'a comparator', damage_checks, not_implemented=not_implemented)
+    elif block_symbol == 'D':
+        # dropper facing up
+        return _block_check({'minecraft:dropper'}, 'a dropper', [
+            (0x7, 1, lambda damage, exact_x, exact_y, exact_z: 'Dropper at {} {} {} should be facing up, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[damage])) # up
+        ], storage='Dropper')
+    elif block_symbol == 'F':
+        # furnace
+        quartz_slab_check, _ = _compile_block_check('Q', layer_x, layer_y, layer_z, left_wall)
+        stonebrick_check, _ = _block_check({'minecraft:stonebrick'}, 'stone bricks', [
+            (0xff, 0, lambda damage, exact_x, exact_y, exact_z: 'Block at {} {} {} should be <a href="/block/minecraft/stonebrick/0">regular stone bricks</a>, is <a href="/block/minecraft/stonebrick/{}">{} stone bricks</a>.'.format(exact_x, exact_y, exact_z, damage, STONEBRICK_VARIANTS[damage]))
+        ])
+
+        def check(block, exact_x, exact_y, exact_z, chest):
+            x, y, z, corridor_length = chest.x, chest.y, chest.z, chest.corridor_length
+            if layer_y == -6 and layer_x == 0 and z < 2:
+                # the first few chests get ignored because their overflow points in the opposite direction
+                pass #TODO introduce special checks for them
+            elif layer_y == -1 and layer_x == 7 and layer_z == 1 and (z == corridor_length - 1 or z == corridor_length - 2 and left_wall):
+                # the floor ends with a quartz slab instead of a furnace here
+                return quartz_slab_check(block, exact_x, exact_y, exact_z, chest)
+            elif x == 0 and y == 6 and layer_y == -1 and layer_x == 7:
+                # the central corridor on the 6th floor uses stone bricks instead of furnaces for the floor
+                return stonebrick_check(block, exact_x, exact_y, exact_z, chest)
+            else:
+                if block['id'] != 'minecraft:furnace':
+                    return 'Block at {} {} {} should be a furnace, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
+                signal = alltheitems.item.comparator_signal(block)
+                if layer_coords in FURNACE_SIGNALS:
+                    if FURNACE_SIGNALS[layer_coords] != signal:
+                        return 'Furnace at {} {} {} has a fill level of {}, should be {}.'.format(exact_x, exact_y, exact_z, signal, FURNACE_SIGNALS[layer_coords])
+                else:
+                    return 'Fill level check for furnace at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
+
+        return check, None
+    elif block_symbol == 'G':
+        # glowstone
+        return _block_check({'minecraft:glowstone'}, 'glowstone')
+    elif block_symbol == 'H':
+        # hopper, any facing
+        return _block_check({'minecraft:hopper'}, 'a hopper')
+    elif block_symbol == 'N':
+        # overflow hopper chain pointing north
+        overflow_hopper_check = _overflow_hopper_check(2, 'north', 'Block at {} {} {} should be a hopper, is {}.')
+
+        def check(block, exact_x, exact_y, exact_z, chest):
+            if chest.y > 1 and (chest.z == 0 or chest.z == 1):
+                return overflow_hopper_check(block, exact_x, exact_y, exact_z, chest)
+            return air_check(block, exact_x, exact_y, exact_z, chest)
+
+        return check, air_template # air is allowed either way
+    elif block_symbol == 'P':
+        # upside-down oak stairs
+        facing = 0x1 if left_wall else 0x0
+        return _block_check({'minecraft:oak_stairs'}, 'oak stairs', [
+            (0x3, facing, lambda damage, exact_x, exact_y, exact_z: 'Stairs at {} {} {} should be facing {}, is {}.'.format(exact_x, exact_y, exact_z, STAIRS_FACINGS[facing], STAIRS_FACINGS[damage & 0x3])),
+            (0x4, 0x4, lambda damage, exact_x, exact_y, exact_z: 'Stairs at {} {} {} should be upside-down.'.format(exact_x, exact_y, exact_z))
+        ])
+    elif block_symbol == 'Q':
+        # quartz top slab
+        return _block_check({'minecraft:stone_slab'}, 'a quartz slab', [
+            (0x7, 0x7, lambda damage, exact_x, exact_y, exact_z: 'Block at {} {} {} should be a <a href="/block/minecraft/stone_slab/7">quartz slab</a>, is a <a href="/block/minecraft/stone_slab/{}">{} slab</a>.'.format(exact_x, exact_y, exact_z, damage & 0x7, SLAB_VARIANTS[damage & 0x7])),
+            (0x8, 0x8, lambda damage, exact_x, exact_y, exact_z: 'Quartz slab at {} {} {} should be a top slab, is a bottom slab.'.format(exact_x, exact_y, exact_z))
+        ])
+    elif block_symbol == 'R':
+        # repeater
+        damage_checks = []
+        not_implemented = None
+        if layer_coords in REPEATER_FACINGS:
+            damage_checks.append((0x3, REPEATER_FACINGS[layer_coords][0 if left_wall else 1], lambda damage, exact_x, exact_y, exact_z: 'Repeater at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z)))
+            if layer_coords in REPEATER_DELAYS:
+                delay = REPEATER_DELAYS[layer_coords]
+
+                def delay_message(damage, exact_x, exact_y, exact_z):
+                    delay_ticks = 2 * (damage >> 2) + 2
+                    return 'Repeater at {} {} {} has a delay of {} game tick{}, should be {}.'.format(exact_x, exact_y, exact_z, delay_ticks, '' if delay_ticks == 1 else 's', delay)
+
+                damage_checks.append((0xfc, (delay - 2) // 2 << 2, delay_message))
+            else:
+                not_implemented = 'Delay check for repeater at {{}} {{}} {{}} (relative coords: {} {} {}) not yet implemented.'.format(*layer_coords)
+        else:
+            not_implemented = 'Direction check for repeater at {{}} {{}} {{}} (relative coords: {} {} {}) not yet implemented.'.format(*layer_coords)
+        return _block_check({'minecraft:unpowered_repeater', 'minecraft:powered_repeater'}, 'a repeater', damage_checks, not_implemented=not_implemented)
+    elif block_symbol == 'S':
+        # stone top slab
+        return _block_check({'minecraft:stone_slab'}, 'a stone slab', [
+            (0x7, 0x0, lambda damage, exact_x, exact_y, exact_z: 'Block at {} {} {} should be a <a href="/block/minecraft/stone_slab/0">stone slab</a>, is a <a href="/block/minecraft/stone_slab/{}">{} slab</a>.'.format(exact_x, exact_y, exact_z, damage & 0x7, SLAB_VARIANTS[damage & 0x7])),
+            (0x8, 0x8, lambda damage, exact_x, exact_y, exact_z: 'Quartz slab at {} {} {} should be a top slab.'.format(exact_x, exact_y, exact_z))
+        ])
+    elif block_symbol == 'T':
+        # redstone torch attached to the side of a block
+        if layer_coords in REDSTONE_TORCH_FACINGS:
+            facing = REDSTONE_TORCH_FACINGS[layer_coords][0 if left_wall else 1]
+            return _block_check({'minecraft:unlit_redstone_torch', 'minecraft:redstone_torch'}, 'a redstone torch', [
+                (0xff, facing, lambda damage, exact_x, exact_y, exact_z: 'Redstone torch at {} {} {} attached to the block {}, should be attached to the block {}.'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[damage], TORCH_FACINGS[facing]))
+            ])
+        return _block_check({'minecraft:unlit_redstone_torch', 'minecraft:redstone_torch'}, 'a redstone torch', not_implemented='Facing check for redstone torch at {{}} {{}} {{}} (relative coords: {} {} {}) not yet implemented.'.format(*layer_coords))
+    elif block_symbol == 'W':
+        # back wall
+        def check(block, exact_x, exact_y, exact_z, chest):
+            if chest.z == chest.corridor_length - 1 or chest.z == chest.corridor_length - 2 and left_wall:
+                return _stone_check(block, exact_x, exact_y, exact_z, chest)
+
+        return check, STONE_TEMPLATE # regular stone is allowed either way
+    elif block_symbol == 'X':
+        # overflow hopper chain pointing down
+        overflow_hopper_check = _overflow_hopper_check(0, 'down', 'Block at {} {} {} should be air or a hopper, is {}.')
+
+        def check(block, exact_x, exact_y, exact_z, chest):
+            y, z = chest.y, chest.z
+            if layer_y < -7 and y < 6 and (z == 4 or z == 5) or layer_y > -7 and y > 1 and (z == 0 or z == 1):
+                return overflow_hopper_check(block, exact_x, exact_y, exact_z, chest)
+            return air_check(block, exact_x, exact_y, exact_z, chest)
 
-def chest_iter():
-    """Returns an iterator yielding tuples (x, corridor, y, floor, z, chest)."""
-    with (ati.assets_root / 'json' / 'cloud.json').open() as cloud_json:
-        cloud_data = json.load(cloud_json)
+        return check, air_template # air is allowed either way
+    elif block_symbol == '^':
+        # hopper facing outward
+        return _hopper_check(5 if left_wall else 4, 'east' if left_wall else 'west', layer_coords, block_symbol)
+    elif block_symbol in 'cp':
+        # crafting table or oak planks, replaced with stone in some places
+        stone_layer_y = -7 if block_symbol == 'c' else -8
+        if block_symbol == 'c':
+            block_check, _ = _block_check({'minecraft:crafting_table'}, 'a crafting table')
+        else:
+            block_check, _ = _block_check({'minecraft:planks'}, 'oak planks') #TODO check material
+
+        def check(block, exact_x, exact_y, exact_z, chest):
+            y, z = chest.y, chest.z
+            if layer_y == stone_layer_y and (y == 6 or z < 4 or z < 6 and layer_z > 1):
+                return _stone_check(block, exact_x, exact_y, exact_z, chest)
+            return block_check(block, exact_x, exact_y, exact_z, chest)
+
+        return check, None
+    elif block_symbol == 'i':
+        # torch attached to the top of a block
+        return _block_check({'minecraft:torch'}, 'a torch', [
+            (0xff, 5, lambda damage, exact_x, exact_y, exact_z: 'Torch at {} {} {} should be attached to the block below, is attached to the block {}'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[damage])) # attached to the block below
+        ])
+    elif block_symbol == 'r':
+        # redstone dust
+        return _block_check({'minecraft:redstone_wire'}, 'redstone')
+    elif block_symbol == 's':
+        # stone
+        return _stone_or_bedrock_check, STONE_TEMPLATE # bedrock is checked in Python
+    elif block_symbol == 't':
+        # redstone torch attached to the top of a block
+        return _block_check({'minecraft:unlit_redstone_torch', 'minecraft:redstone_torch'}, 'a redstone torch', [
+            (0xff, 5, lambda damage, exact_x, exact_y, exact_z: 'Redstone torch at {} {} {} should be attached to the block below, is attached to the block {}'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[damage])) # attached to the block below
+        ])
+    elif block_symbol == 'v':
+        # hopper facing inwards
+        return _hopper_check(4 if left_wall else 5, 'west' if left_wall else 'east', layer_coords, block_symbol)
+    elif block_symbol == 'x':
+        # hopper facing down
+        return _hopper_check(0, 'down', layer_coords, block_symbol)
+    elif block_symbol == '~':
+        # hopper chain
+        return _block_check({'minecraft:hopper', 'minecraft:air'}, 'a hopper or air') #TODO check facing, alignment, and hopper chain integrity
+    else:
+        def check(block, exact_x, exact_y, exact_z, chest):
+            return 'Not yet implemented: block at {} {} {} should be {}.'.format(exact_x, exact_y, exact_z, block_symbol)
+
+        return check, None
+
+CLOUD_JSON = alltheitems.util.FileCache(ati.assets_root / 'json' / 'cloud.json')
+
+def chest_iter(cloud_data=None):
+    """Returns an iterator yielding tuples (x, corridor, y, floor, z, chest). Uses the current cloud.json unless parsed cloud data is given."""
+    if cloud_data is None:
+        cloud_data = CLOUD_JSON()
     for y, floor in enumerate(cloud_data):
         for x, corridor in sorted(((int(x), corridor) for x, corridor in floor.items()), key=lambda tup: tup[0]):
             for z, chest in enumerate(corridor):
                 yield x, corridor, y, floor, z, chest
 
-def chest_coords(item, *, include_meta=False):
-    if not isinstance(item, alltheitems.item.Item):
-        item = alltheitems.item.Item(item)
-    for x, corridor, y, _, z, chest in chest_iter():
-        if item == chest:
-            if include_meta:
-                return (x, y, z), len(corridor), None if isinstance(chest, str) else chest.get('name'), None if isinstance(chest, str) else chest.get('sorter')
+def chest_info(chest):
+    """Splits a chest from cloud.json into a tuple (item_stub, item_name, pre_sorter). item_name and pre_sorter are None if not specified."""
+    if isinstance(chest, str):
+        return {'id': chest}, None, None
+    item_stub = chest.copy()
+    item_name = item_stub.pop('name', None)
+    pre_sorter = item_stub.pop('sorter', None)
+    return item_stub, item_name, pre_sorter
+
+class Chest:
+    """A chest in the Cloud, as listed in cloud.json.
+
+    Besides the Cloud coordinates and the fields from cloud.json, a chest has a base coordinate (the position of the north half of the access chest) and is on the left wall if z is even. Chests are shared by all Cloud code through cloud_layout, so they must not be modified.
+    """
+
+    __slots__ = ('x', 'y', 'z', 'corridor_length', 'item_stub', 'item_name', 'pre_sorter', 'left_wall', 'base_x', 'base_y', 'base_z', '_item', '_filler_item')
+
+    def __init__(self, x, y, z, corridor_length, item_stub, item_name=None, pre_sorter=None):
+        if isinstance(item_stub, str):
+            item_stub = {'id': item_stub}
+        self.x = x
+        self.y = y
+        self.z = z
+        self.corridor_length = corridor_length
+        self.item_stub = item_stub
+        self.item_name = item_name
+        self.pre_sorter = pre_sorter
+        self.left_wall = z % 2 == 0
+        self.base_x = 15 * x + 2 if self.left_wall else 15 * x - 3
+        self.base_y = 73 - 10 * y
+        self.base_z = 28 + 10 * y + 4 * (z // 2)
+        self._item = None
+        self._filler_item = None, None
+
+    @classmethod
+    def from_json(cls, x, y, z, corridor_length, chest):
+        """Creates a Chest from a chest as it appears in cloud.json."""
+        return cls(x, y, z, corridor_length, *chest_info(chest))
+
+    def __repr__(self):
+        return 'alltheitems.cloud.Chest({!r}, {!r}, {!r}, {!r}, {!r}, {!r}, {!r})'.format(self.x, self.y, self.z, self.corridor_length, self.item_stub, self.item_name, self.pre_sorter)
+
+    @property
+    def coords(self):
+        return self.x, self.y, self.z
+
+    @property
+    def item(self):
+        if self._item is None:
+            self._item = alltheitems.item.Item(self.item_stub)
+        return self._item
+
+    @property
+    def filler_item(self):
+        """The item used to fill up the sorting hoppers. Determined once per version of items.json."""
+        version, filler_item = self._filler_item
+        items_version = alltheitems.item.ITEMS_DATA.versioned()[0]
+        if version != items_version:
+            item = self.item
+            if item == 'minecraft:crafting_table' or item.info().get('stackable', True) and item.max_stack_size < 64:
+                filler_item = alltheitems.item.Item('minecraft:crafting_table')
             else:
-                return x, y, z
+                filler_item = alltheitems.item.Item('minecraft:ender_pearl')
+            self._filler_item = items_version, filler_item
+        return filler_item
+
+    @property
+    def overflow_chain_start(self):
+        """The coordinates of the first hopper of the overflow hopper chain."""
+        return self.base_x + 5 if self.left_wall else self.base_x - 5, self.base_y - 7, self.base_z - 1
+
+    def layer_coords(self, layer_x, layer_y, layer_z):
+        """Converts coordinates relative to the SmartChest schematic (see parse_smart_chest_schematic) into exact coordinates."""
+        if self.left_wall:
+            exact_x = self.base_x + 5 - layer_x
+        else:
+            exact_x = self.base_x - 5 + layer_x
+        return exact_x, self.base_y + layer_y, self.base_z + 3 - layer_z
+
+class CloudLayout:
+    """The chests from cloud.json as Chest records.
+
+    chests is a tuple of all chests in chest_iter order. floors maps each floor's y coordinate to a dict mapping the x coordinates of its corridors to tuples of their chests. index maps the stub_key of each item to its chest.
+    """
+
+    __slots__ = ('chests', 'floors', 'index')
+
+    def __init__(self, cloud_data):
+        chests = []
+        floors = {}
+        index = {}
+        for x, corridor, y, _, z, chest in chest_iter(cloud_data):
+            record = Chest.from_json(x, y, z, len(corridor), chest)
+            chests.append(record)
+            floors.setdefault(y, {}).setdefault(x, []).append(record)
+            index.setdefault(alltheitems.item.stub_key(record.item_stub), record)
+        self.chests = tuple(chests)
+        self.floors = {y: {x: tuple(corridor) for x, corridor in floor.items()} for y, floor in floors.items()}
+        self.index = index
+
+@CLOUD_JSON.derive
+def cloud_layout(cloud_data):
+    """Returns the CloudLayout of the current cloud.json. It is only rebuilt when cloud.json changes."""
+    return CloudLayout(cloud_data)
+
+def chest_coords(item, *, include_meta=False):
+    """Returns the coords of the chest for the given item, or None if it's not in the Cloud. With include_meta, returns a tuple (coords, corridor_length, item_name, pre_sorter) instead, which is (None, 0, None, None) if the item is not in the Cloud."""
+    chest = cloud_layout().index.get(alltheitems.item.stub_key(item))
     if include_meta:
-        return None, 0, None, None
+        return (None, 0, None, None) if chest is None else (chest.coords, chest.corridor_length, chest.item_name, chest.pre_sorter)
+    elif chest is not None:
+        return chest.coords
+
+class ChestStore:
+    """Stores the results of chest_error_checks and global_error_checks in an SQLite database.
+
+    Every result is written in its own transaction, and the database is in write-ahead logging mode, so readers in other threads and processes never see a partial write. If the parent directory of the database doesn't exist, nothing is stored.
+
+    Results are (error_message, timestamp) tuples, where timestamp is a naive datetime in UTC. A chest's result can also have a footprint: a dict mapping the keys of the chunk sections read by the check, as recorded by alltheitems.world.World.recording, to their chunk timestamps. It is stored along with the check's sources, a string identifying the versions of the files the check depends on, see chest_check_sources.
+
+    The store also holds the CloudSnapshot published by the CloudRefresher, so that every worker process of the web server can read it.
+    """
+
+    TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def __reduce__(self):
+        # connections can't be pickled, worker processes open their own
+        return self.__class__, (self.path,)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        if not self.path.parent.exists():
+            return None
+        connection = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('CREATE TABLE IF NOT EXISTS chests (y INTEGER, x INTEGER, z INTEGER, error_message TEXT, timestamp TEXT NOT NULL, sources TEXT, PRIMARY KEY (y, x, z))')
+            if 'sources' not in {column_info[1] for column_info in connection.execute('PRAGMA table_info(chests)')}:
+                connection.execute('ALTER TABLE chests ADD COLUMN sources TEXT')
+            connection.execute('CREATE TABLE IF NOT EXISTS footprints (y INTEGER, x INTEGER, z INTEGER, dimension INTEGER, chunk_x INTEGER, chunk_y INTEGER, chunk_z INTEGER, timestamp INTEGER, PRIMARY KEY (y, x, z, dimension, chunk_x, chunk_y, chunk_z))')
+            connection.execute('CREATE TABLE IF NOT EXISTS global_checks (name TEXT PRIMARY KEY, error_message TEXT, timestamp TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS cloud_states (y INTEGER, x INTEGER, z INTEGER, color TEXT, message TEXT, stack_size INTEGER, total_items INTEGER, max_slots INTEGER, is_smart_chest INTEGER, timestamp TEXT NOT NULL, PRIMARY KEY (y, x, z))')
+            connection.execute('CREATE TABLE IF NOT EXISTS cloud_snapshot (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL, timestamp TEXT NOT NULL, complete INTEGER NOT NULL)')
+            self._migrate(connection)
+        self._local.connection = connection
+        self._local.pid = os.getpid() # connections must not be shared with forked processes
+        return connection
+
+    def _migrate(self, connection):
+        """Imports the JSON files which were used to cache check results before this store existed, and renames them so they're only imported once."""
+        chests_path = self.path.parent / 'cloud-chests.json'
+        if chests_path.exists():
+            try:
+                with chests_path.open() as cache_f:
+                    cache = json.load(cache_f)
+            except ValueError:
+                pass # cache JSON is corrupted, probably because of a full disk, start over
+            else:
+                connection.executemany('INSERT OR IGNORE INTO chests (y, x, z, error_message, timestamp) VALUES (?, ?, ?, ?, ?)', (
+                    (int(y), int(x), int(z), result['errorMessage'], result['timestamp'])
+                    for y, floor in cache.items()
+                    for x, corridor in floor.items()
+                    for z, result in corridor.items()
+                ))
+            chests_path.rename(chests_path.with_name('cloud-chests.json.migrated'))
+        globals_path = self.path.parent / 'cloud-globals.json'
+        if globals_path.exists():
+            try:
+                with globals_path.open() as cache_f:
+                    message = json.load(cache_f)
+            except ValueError:
+                pass
+            else:
+                connection.execute('INSERT OR IGNORE INTO global_checks (name, error_message, timestamp) VALUES (?, ?, ?)', ('global', message, datetime.datetime.utcfromtimestamp(globals_path.stat().st_mtime).strftime(self.TIMESTAMP_FORMAT)))
+            globals_path.rename(globals_path.with_name('cloud-globals.json.migrated'))
+
+    def _result(self, row):
+        if row is None:
+            return None
+        error_message, timestamp = row
+        return error_message, datetime.datetime.strptime(timestamp, self.TIMESTAMP_FORMAT)
+
+    def chest(self, x, y, z):
+        """Returns the stored result for the chest at the given Cloud coordinates, or None."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        return self._result(connection.execute('SELECT error_message, timestamp FROM chests WHERE y = ? AND x = ? AND z = ?', (y, x, z)).fetchone())
+
+    def chest_footprint(self, x, y, z, sources=None):
+        """Returns the footprint stored with the result for the chest at the given Cloud coordinates, or None. If sources is given, None is also returned if the result was stored with different sources."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        if sources is not None:
+            row = connection.execute('SELECT sources FROM chests WHERE y = ? AND x = ? AND z = ?', (y, x, z)).fetchone()
+            if row is None or row[0] != sources:
+                return None
+        rows = connection.execute('SELECT dimension, chunk_x, chunk_y, chunk_z, timestamp FROM footprints WHERE y = ? AND x = ? AND z = ?', (y, x, z)).fetchall()
+        if len(rows) == 0:
+            return None
+        return {(dimension, chunk_x, chunk_y, chunk_z): timestamp for dimension, chunk_x, chunk_y, chunk_z, timestamp in rows}
+
+    def set_chest(self, x, y, z, error_message, timestamp=None, *, footprint=None, sources=None):
+        """Stores the result for the chest at the given Cloud coordinates, replacing its previous result, footprint, and sources."""
+        connection = self._connection()
+        if connection is None:
+            return
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('INSERT OR REPLACE INTO chests (y, x, z, error_message, timestamp, sources) VALUES (?, ?, ?, ?, ?, ?)', (y, x, z, error_message, timestamp.strftime(self.TIMESTAMP_FORMAT), sources))
+            connection.execute('DELETE FROM footprints WHERE y = ? AND x = ? AND z = ?', (y, x, z))
+            if footprint is not None:
+                connection.executemany('INSERT INTO footprints (y, x, z, dimension, chunk_x, chunk_y, chunk_z, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                    (y, x, z, dimension, chunk_x, chunk_y, chunk_z, section_timestamp)
+                    for (dimension, chunk_x, chunk_y, chunk_z), section_timestamp in footprint.items()
+                ))
+
+    def global_check(self, name='global'):
+        """Returns the stored result for the global check with the given name, or None."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        return self._result(connection.execute('SELECT error_message, timestamp FROM global_checks WHERE name = ?', (name,)).fetchone())
+
+    def set_global_check(self, error_message, timestamp=None, name='global'):
+        connection = self._connection()
+        if connection is None:
+            return
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        connection.execute('INSERT OR REPLACE INTO global_checks (name, error_message, timestamp) VALUES (?, ?, ?)', (name, error_message, timestamp.strftime(self.TIMESTAMP_FORMAT)))
+
+    def snapshot_info(self):
+        """Returns a tuple (version, timestamp, complete) describing the published CloudSnapshot, where version changes whenever a snapshot is published, or None if no snapshot has been published."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        row = connection.execute('SELECT version, timestamp, complete FROM cloud_snapshot WHERE id = 0').fetchone()
+        if row is None:
+            return None
+        version, timestamp, complete = row
+        return version, datetime.datetime.strptime(timestamp, self.TIMESTAMP_FORMAT), bool(complete)
+
+    def snapshot(self):
+        """Returns the published CloudSnapshot, or None if no snapshot has been published."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        with connection:
+            connection.execute('BEGIN') # read the states and the snapshot info consistently
+            info = self.snapshot_info()
+            if info is None:
+                return None
+            _, timestamp, complete = info
+            states = {}
+            for y, x, z, color, message, stack_size, total_items, max_slots, is_smart_chest, state_timestamp in connection.execute('SELECT y, x, z, color, message, stack_size, total_items, max_slots, is_smart_chest, timestamp FROM cloud_states'):
+                fill_level = None if stack_size is None else FillLevel(stack_size, total_items, max_slots, is_smart_chest=bool(is_smart_chest))
+                states[x, y, z] = color, message, fill_level, datetime.datetime.strptime(state_timestamp, self.TIMESTAMP_FORMAT)
+        return CloudSnapshot(states, timestamp, complete=complete)
+
+    def publish_states(self, states, *, complete=None, replace=False):
+        """Publishes chest states in a single transaction. states maps chest coords to tuples (color, message, fill_level, timestamp) as in CloudSnapshot.states. With replace, the states of all other chests are removed. complete defaults to the value of the previously published snapshot, or False."""
+        connection = self._connection()
+        if connection is None:
+            return
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if replace:
+                connection.execute('DELETE FROM cloud_states')
+            connection.executemany('INSERT OR REPLACE INTO cloud_states (y, x, z, color, message, stack_size, total_items, max_slots, is_smart_chest, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                (y, x, z, color, message) + ((None, None, None, None) if fill_level is None else (fill_level.stack_size, fill_level.total_items, fill_level.max_slots, fill_level.is_smart_chest)) + (timestamp.strftime(self.TIMESTAMP_FORMAT),)
+                for (x, y, z), (color, message, fill_level, timestamp) in states.items()
+            ))
+            row = connection.execute('SELECT version, complete FROM cloud_snapshot WHERE id = 0').fetchone()
+            version, previously_complete = (0, False) if row is None else row
+            connection.execute('INSERT OR REPLACE INTO cloud_snapshot (id, version, timestamp, complete) VALUES (0, ?, ?, ?)', (version + 1, datetime.datetime.utcnow().strftime(self.TIMESTAMP_FORMAT), bool(previously_complete) if complete is None else complete))
+
+CHEST_STORE = ChestStore(ati.cache_root / 'cloud.sqlite3')
+
+CHECK_FLIGHTS = alltheitems.util.SingleFlight(ati.cache_root / 'cloud.lock') # coalesces concurrent rechecks of the same chest or global check
+
+FOOTPRINT_MAX_AGE = datetime.timedelta(days=1) # chests are rechecked after this time even if neither their footprint nor their sources have changed
+
+def chest_check_sources(document_root=ati.document_root):
+    """Returns a string identifying the versions of the files chest_error_checks depends on besides the world: cloud.json, items.json, and the SmartChest schematic. It changes whenever one of them is modified, in any process."""
+    mtimes = []
+    for path in (CLOUD_JSON.path, alltheitems.item.ITEMS_DATA.path, document_root / 'static' / 'smartchest.txt'):
+        try:
+            mtimes.append(str(path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            mtimes.append('')
+    return ':'.join(mtimes)
 
-def global_error_checks(*, chunk_cache=None, block_at=alltheitems.world.World().block_at):
-    cache_path = ati.cache_root / 'cloud-globals.json'
+def global_error_checks(*, world=None, store=CHEST_STORE, hopper_graph=None):
     max_age = datetime.timedelta(hours=1, minutes=random.randrange(0, 60)) # use a random value between 1 and 2 hours for the cache expiration
-    if cache_path.exists() and datetime.datetime.utcfromtimestamp(cache_path.stat().st_mtime) > datetime.datetime.utcnow() - max_age:
-        # cached check results are recent enough
-        with cache_path.open() as cache_f:
-            cache = json.load(cache_f)
-        return cache
-    # cached check results are too old, recheck
-    if chunk_cache is None:
-        chunk_cache = {}
-    # error check: input hopper chain
-    start = 14, 61, 32 # the first hopper after the buffer elevator
-    end = -1, 25, 52 # the half of the uppermost overflow chest into which the hopper chain is pointing
-    is_connected, message = hopper_chain_connected(start, end, chunk_cache=chunk_cache, block_at=block_at)
-    if not is_connected:
-        return 'Input hopper chain at {} is not connected to the unsorted overflow at {}: {}.'.format(start, end, message)
-    if ati.cache_root.exists():
-        with cache_path.open('w') as cache_f:
-            json.dump(message, cache_f, sort_keys=True, indent=4)
-
-def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists, stackable, durability, has_smart_chest, has_sorter, has_overflow, filler_item, sorting_hopper, missing_overflow_hoppers, north_half, south_half, corridor_length, pre_sorter, layer_coords, block_at, items_data, chunk_cache, document_root):
+
+    def cached():
+        result = store.global_check()
+        if result is not None and result[1] > datetime.datetime.utcnow() - max_age:
+            # cached check results are recent enough
+            return result[0]
+        return alltheitems.util.MISSING
+
+    def check():
+        nonlocal hopper_graph
+        # error check: input hopper chain
+        if hopper_graph is None:
+            hopper_graph = HopperGraph(world)
+        is_connected, message = hopper_graph.connected(INPUT_CHAIN_START, INPUT_CHAIN_END)
+        if not is_connected:
+            return 'Input hopper chain at {} is not connected to the unsorted overflow at {}: {}.'.format(INPUT_CHAIN_START, INPUT_CHAIN_END, message)
+        store.set_global_check(message)
+
+    message = cached()
+    if message is not alltheitems.util.MISSING:
+        return message
+    # cached check results are too old, recheck unless another thread or process is already doing so
+    return CHECK_FLIGHTS.run(('global',), check, recheck=cached)
+
+def chest_error_checks(chest, item_name, exists, stackable, durability, has_smart_chest, has_sorter, has_overflow, sorting_hopper, missing_overflow_hoppers, north_half, south_half, world, document_root, hopper_graph):
+    x, y, z = chest.coords
+    base_x, base_y, base_z = chest.base_x, chest.base_y, chest.base_z
+    item = chest.item
+    filler_item = chest.filler_item
+    pre_sorter = chest.pre_sorter
+    layer_coords = chest.layer_coords
+    matches_item = item.slot_matcher
+    matches_filler = filler_item.slot_matcher
     if stackable and has_sorter:
         # error check: overflow exists
         if not has_overflow:
@@ -215,14 +1110,14 @@ def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists,
             elif len(missing_overflow_hoppers) > 1:
                 return 'Overflow hoppers at x={} do not exist.'.format(missing_overflow_hoppers)
             elif len(missing_overflow_hoppers) == 1:
-                return 'Overflow hopper at x={} does not exist, is {}.'.format(next(iter(missing_overflow_hoppers)), block_at(next(iter(missing_overflow_hoppers)), base_y - 7, base_z - 1)['id'])
+                return 'Overflow hopper at x={} does not exist, is {}.'.format(next(iter(missing_overflow_hoppers)), world.block_at(next(iter(missing_overflow_hoppers)), base_y - 7, base_z - 1)['id'])
             else:
                 return 'Missing overflow.'
         # error check: pre-sorter for lower floors
         if y > 4:
             if pre_sorter is None:
                 return 'Preliminary sorter coordinate missing from cloud.json.'
-            pre_sorting_hopper = block_at(pre_sorter, 30, 52, chunk_cache=chunk_cache)
+            pre_sorting_hopper = world.block_at(pre_sorter, 30, 52)
             if pre_sorting_hopper['id'] != 'minecraft:hopper':
                 return 'Preliminary sorter is missing (should be at {} 30 52).'.format(pre_sorter)
             if pre_sorting_hopper['damage'] != 3:
@@ -231,11 +1126,11 @@ def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists,
             for slot in pre_sorting_hopper['tileEntity']['Items']:
                 empty_slots.remove(slot['Slot'])
                 if slot['Slot'] == 0:
-                    if not item.matches_slot(slot):
-                        return 'Preliminary sorting hopper is sorting the wrong item: {}.'.format(alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
+                    if not matches_item(slot):
+                        return 'Preliminary sorting hopper is sorting the wrong item: {}.'.format(alltheitems.item.Item.from_slot(slot).link_text())
                 else:
-                    if not filler_item.matches_slot(slot):
-                        return 'Preliminary sorting hopper has wrong filler item in slot {}: {} (should be {}).'.format(slot['Slot'], alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text(), filler_item.link_text())
+                    if not matches_filler(slot):
+                        return 'Preliminary sorting hopper has wrong filler item in slot {}: {} (should be {}).'.format(slot['Slot'], alltheitems.item.Item.from_slot(slot).link_text(), filler_item.link_text())
                     if slot['Count'] > 1:
                         return 'Preliminary sorting hopper: too much {} in slot {}.'.format(filler_item.link_text(), slot['Slot'])
             if len(empty_slots) > 0:
@@ -253,11 +1148,11 @@ def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists,
         for slot in sorting_hopper['tileEntity']['Items']:
             empty_slots.remove(slot['Slot'])
             if slot['Slot'] == 0 and stackable:
-                if not item.matches_slot(slot) and not filler_item.matches_slot(slot):
-                    return 'Sorting hopper is sorting the wrong item: {}.'.format(alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
+                if not matches_item(slot) and not matches_filler(slot):
+                    return 'Sorting hopper is sorting the wrong item: {}.'.format(alltheitems.item.Item.from_slot(slot).link_text())
             else:
-                if not filler_item.matches_slot(slot):
-                    return 'Sorting hopper has wrong filler item in slot {}: {} (should be {}).'.format(slot['Slot'], alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text(), filler_item.link_text())
+                if not matches_filler(slot):
+                    return 'Sorting hopper has wrong filler item in slot {}: {} (should be {}).'.format(slot['Slot'], alltheitems.item.Item.from_slot(slot).link_text(), filler_item.link_text())
                 if slot['Count'] > 1:
                     return 'Sorting hopper: too much {} in slot {}.'.format(filler_item.link_text(), slot['Slot'])
         if len(empty_slots) > 0:
@@ -269,11 +1164,11 @@ def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists,
                 return 'Some slots in the sorting hopper are empty: {}.'.format(alltheitems.util.join(empty_slots))
     if exists:
         # error check: wrong items in access chest
-        for slot in itertools.chain(north_half['tileEntity']['Items'], south_half['tileEntity']['Items']):
-            if not item.matches_slot(slot):
-                return 'Access chest contains items of the wrong kind: {}.'.format(alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
+        slot = item.first_mismatched_slot(itertools.chain(north_half['tileEntity']['Items'], south_half['tileEntity']['Items']))
+        if slot is not None:
+            return 'Access chest contains items of the wrong kind: {}.'.format(alltheitems.item.Item.from_slot(slot).link_text())
         # error check: wrong name on sign
-        sign = block_at(base_x - 1 if z % 2 == 0 else base_x + 1, base_y + 1, base_z + 1, chunk_cache=chunk_cache)
+        sign = world.block_at(base_x - 1 if z % 2 == 0 else base_x + 1, base_y + 1, base_z + 1)
         if sign['id'] != 'minecraft:wall_sign':
             return 'Sign is missing.'
         text = []
@@ -286,490 +1181,56 @@ def chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists,
             return 'Sign has wrong text: should be {!r}, is {!r}.'.format(xml.sax.saxutils.escape(item_name), xml.sax.saxutils.escape(text))
     if has_overflow:
         # error check: overflow hopper chain
-        start = base_x + 5 if z % 2 == 0 else base_x - 5, base_y - 7, base_z - 1
-        end = -35, 6, 38 # position of the dropper leading into the Smelting Center's item elevator
-        is_connected, message = hopper_chain_connected(start, end, chunk_cache=chunk_cache, block_at=block_at)
+        start = chest.overflow_chain_start
+        is_connected, message = hopper_graph.connected(start, OVERFLOW_CHAIN_END)
         if not is_connected:
-            return 'Overflow hopper chain at {} is not connected to the Smelting Center item elevator at {}: {}.'.format(start, end, message)
+            return 'Overflow hopper chain at {} is not connected to the Smelting Center item elevator at {}: {}.'.format(start, OVERFLOW_CHAIN_END, message)
     if exists and has_smart_chest:
         # error check: all blocks
-        for layer_y, layer in smart_chest_schematic(document_root=document_root):
-            for layer_x, row in enumerate(layer):
-                for layer_z, block_symbol in enumerate(row):
-                    # determine the coordinate of the current block
-                    exact_x, exact_y, exact_z = layer_coords(layer_x, layer_y, layer_z)
-                    # determine current block
-                    block = block_at(exact_x, exact_y, exact_z, chunk_cache=chunk_cache)
-                    # check against schematic
-                    if block_symbol == ' ':
-                        # air
-                        if block['id'] != 'minecraft:air':
-                            return 'Block at {} {} {} should be air, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == '!':
-                        # sign
-                        if block['id'] != 'minecraft:wall_sign':
-                            return 'Block at {} {} {} should be a sign, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] != (4 if z % 2 == 0 else 5):
-                            return 'Sign at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z)
-                    elif block_symbol == '#':
-                        # chest
-                        if block['id'] != 'minecraft:chest':
-                            return 'Block at {} {} {} should be a chest, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        for slot in block['tileEntity']['Items']:
-                            if not item.matches_slot(slot):
-                                return 'Storage chest at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == '<':
-                        # hopper facing south
-                        if block['id'] != 'minecraft:hopper':
-                            return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != 3: # south
-                            return 'Hopper at {} {} {} should be pointing south, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                        storage_hoppers = {
-                            (5, -7, 4),
-                            (6, -5, 4)
-                        }
-                        if (layer_x, layer_y, layer_z) in storage_hoppers:
-                            for slot in block['tileEntity']['Items']:
-                                if not item.matches_slot(slot):
-                                    return 'Storage hopper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == '>':
-                        # hopper facing north
-                        if layer_y == -7 and layer_x == 0 and z < 8:
-                            # the first few chests get ignored because their overflow points in the opposite direction
-                            pass #TODO introduce special checks for them
-                        else:
-                            if block['id'] != 'minecraft:hopper':
-                                return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] & 0x7 != 2: # north
-                                return 'Hopper at {} {} {} should be pointing north, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                            storage_hoppers = {
-                                (3, -7, 3),
-                                (3, -4, 2)
-                            }
-                            if (layer_x, layer_y, layer_z) in storage_hoppers:
-                                for slot in block['tileEntity']['Items']:
-                                    if not item.matches_slot(slot):
-                                        return 'Storage hopper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == '?':
-                        # any block
-                        pass
-                    elif block_symbol == 'C':
-                        # comparator
-                        if block['id'] != 'minecraft:unpowered_comparator':
-                            return 'Block at {} {} {} should be a comparator, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        known_facings = {
-                            (5, -7, 2): 0x2, # south
-                            (5, -5, 2): 0x2, # south
-                            (7, -3, 4): 0x0, # north
-                            (0, -1, 1): 0x0, # north
-                            (1, -1, 2): 0x0, # north
-                            (2, 0, 2): 0x1 if z % 2 == 0 else 0x3, # east / west
-                            (2, 0, 3): 0x2, # south
-                            (4, 0, 2): 0x1 if z % 2 == 0 else 0x3, # east / west
-                            (4, 0, 3): 0x2 # south
-                        }
-                        facing = block['damage'] & 0x3
-                        if (layer_x, layer_y, layer_z) in known_facings:
-                            if known_facings[layer_x, layer_y, layer_z] != facing:
-                                return 'Comparator at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z)
-                        else:
-                            return 'Direction check for comparator at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                        known_modes = {
-                            (5, -7, 2): False, # compare
-                            (5, -5, 2): False, # compare
-                            (7, -3, 4): False, # compare
-                            (0, -1, 1): False, # compare
-                            (1, -1, 2): True, # subtract
-                            (2, 0, 2): True, # subtract
-                            (2, 0, 3): False, # compare
-                            (4, 0, 2): True, #subtract
-                            (4, 0, 3): False # compare
-                        }
-                        mode = (block['damage'] & 0x4) == 0x4
-                        if (layer_x, layer_y, layer_z) in known_modes:
-                            if known_modes[layer_x, layer_y, layer_z] != mode:
-                                return 'Comparator at {} {} {} is in {} mode, should be in {} mode.'.format(exact_x, exact_y, exact_z, 'subtraction' if mode else 'comparison', 'subtraction' if known_modes[layer_x, layer_y, layer_z] else 'comparison')
-                        else:
-                            return 'Mode check for comparator at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                    elif block_symbol == 'D':
-                        # dropper facing up
-                        if block['id'] != 'minecraft:dropper':
-                            return 'Block at {} {} {} should be a dropper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != 1: # up
-                            return 'Dropper at {} {} {} should be facing up, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                        for slot in block['tileEntity']['Items']:
-                            if not item.matches_slot(slot):
-                                return 'Dropper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == 'F':
-                        # furnace
-                        if layer_y == -6 and layer_x == 0 and z < 2:
-                            # the first few chests get ignored because their overflow points in the opposite direction
-                            pass #TODO introduce special checks for them
-                        elif layer_y == -1 and layer_x == 7 and layer_z == 1 and (z == corridor_length - 1 or z == corridor_length - 2 and z % 2 == 0):
-                            # the floor ends with a quartz slab instead of a furnace here
-                            if block['id'] != 'minecraft:stone_slab':
-                                return 'Block at {} {} {} should be a quartz slab, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] & 0x7 != 0x7:
-                                slab_variant = {
-                                    0: 'stone',
-                                    1: 'sandstone',
-                                    2: 'fake wood',
-                                    3: 'cobblestone',
-                                    4: 'brick',
-                                    5: 'stone brick',
-                                    6: 'Nether brick',
-                                    7: 'quartz'
-                                }[block['damage'] & 0x7]
-                                return 'Block at {} {} {} should be a <a href="/block/minecraft/stone_slab/7">quartz slab</a>, is a <a href="/block/minecraft/stone_slab/{}">{} slab</a>.'.format(exact_x, exact_y, exact_z, block['damage'] & 0x7, slab_variant)
-                            if block['damage'] & 0x8 != 0x8:
-                                return 'Quartz slab at {} {} {} should be a top slab, is a bottom slab.'.format(exact_x, exact_y, exact_z)
-                        elif x == 0 and y == 6 and layer_y == -1 and layer_x == 7:
-                            # the central corridor on the 6th floor uses stone bricks instead of furnaces for the floor
-                            if block['id'] != 'minecraft:stonebrick':
-                                return 'Block at {} {} {} should be stone bricks, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] != 0:
-                                stonebrick_variant = {
-                                    0: 'regular',
-                                    1: 'mossy',
-                                    2: 'cracked',
-                                    3: 'chiseled'
-                                }[block['damage']]
-                                return 'Block at {} {} {} should be <a href="/block/minecraft/stonebrick/0">regular stone bricks</a>, is <a href="/block/minecraft/stonebrick/{}">{} stone bricks</a>.'.format(exact_x, exact_y, exact_z, block['damage'], stonebrick_variant)
-                        else:
-                            if block['id'] != 'minecraft:furnace':
-                                return 'Block at {} {} {} should be a furnace, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            known_signals = {
-                                (0, -6, 4): 0,
-                                (0, -6, 5): 0,
-                                (0, -6, 6): 0,
-                                (0, -6, 7): 0,
-                                (0, -1, 0): 8,
-                                (7, -1, 1): 0,
-                                (7, -1, 2): 0,
-                                (7, -1, 3): 0,
-                                (7, -1, 4): 0,
-                                (2, 0, 4): 1,
-                                (4, 0, 4): 5
-                            }
-                            signal = alltheitems.item.comparator_signal(block, items_data=items_data)
-                            if (layer_x, layer_y, layer_z) in known_signals:
-                                if known_signals[layer_x, layer_y, layer_z] != signal:
-                                    return 'Furnace at {} {} {} has a fill level of {}, should be {}.'.format(exact_x, exact_y, exact_z, signal, known_signals[layer_x, layer_y, layer_z])
-                            else:
-                                return 'Fill level check for furnace at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                    elif block_symbol == 'G':
-                        # glowstone
-                        if block['id'] != 'minecraft:glowstone':
-                            return 'Block at {} {} {} should be glowstone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == 'H':
-                        # hopper, any facing
-                        if block['id'] != 'minecraft:hopper':
-                            return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == 'N':
-                        # overflow hopper chain pointing north
-                        if y > 1 and (z == 0 or z == 1):
-                            if block['id'] == 'minecraft:hopper':
-                                if block['damage'] != 2: # north
-                                    return 'Overflow hopper at {} {} {} should be pointing north, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                            elif block['id'] == 'minecraft:air':
-                                pass # also allow air because some overflow hopper chains don't start on the first floor
-                            else:
-                                return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        else:
-                            if block['id'] != 'minecraft:air':
-                                return 'Block at {} {} {} should be air, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == 'P':
-                        # upside-down oak stairs
-                        if block['id'] != 'minecraft:oak_stairs':
-                            return 'Block at {} {} {} should be oak stairs, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x3 != (0x1 if z % 2 == 0 else 0x0):
-                            stairs_facings = {
-                                0: 'west',
-                                1: 'east',
-                                2: 'south',
-                                3: 'north'
-                            }
-                            return 'Stairs at {} {} {} should be facing {}, is {}.'.format(exact_x, exact_y, exact_z, stairs_facings[0x1 if z % 2 == 0 else 0x0], stairs_facings[block['damage'] & 0x3])
-                        if block['damage'] & 0x4 != 0x4:
-                            return 'Stairs at {} {} {} should be upside-down.'.format(exact_x, exact_y, exact_z)
-                    elif block_symbol == 'Q':
-                        # quartz top slab
-                        if block['id'] != 'minecraft:stone_slab':
-                            return 'Block at {} {} {} should be a quartz slab, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != 0x7:
-                            slab_variant = {
-                                0: 'stone',
-                                1: 'sandstone',
-                                2: 'fake wood',
-                                3: 'cobblestone',
-                                4: 'brick',
-                                5: 'stone brick',
-                                6: 'Nether brick',
-                                7: 'quartz'
-                            }[block['damage'] & 0x7]
-                            return 'Block at {} {} {} should be a <a href="/block/minecraft/stone_slab/7">quartz slab</a>, is a <a href="/block/minecraft/stone_slab/{}">{} slab</a>.'.format(exact_x, exact_y, exact_z, block['damage'] & 0x7, slab_variant)
-                        if block['damage'] & 0x8 != 0x8:
-                            return 'Quartz slab at {} {} {} should be a top slab, is a bottom slab.'.format(exact_x, exact_y, exact_z)
-                    elif block_symbol == 'R':
-                        # repeater
-                        if block['id'] not in ('minecraft:unpowered_repeater', 'minecraft:powered_repeater'):
-                            return 'Block at {} {} {} should be a repeater, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        known_facings = {
-                            (1, -8, 2): 0x0, # north
-                            (3, -8, 3): 0x3 if z % 2 == 0 else 0x1, # west / east
-                            (6, -6, 2): 0x0, # north
-                            (7, -5, 5): 0x2, # south
-                            (3, -3, 1): 0x1 if z % 2 == 0 else 0x3 # east / west
-                        }
-                        facing = block['damage'] & 0x3
-                        if (layer_x, layer_y, layer_z) in known_facings:
-                            if known_facings[layer_x, layer_y, layer_z] != facing:
-                                return 'Repeater at {} {} {} is facing the wrong way.'.format(exact_x, exact_y, exact_z)
-                        else:
-                            return 'Direction check for repeater at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                        known_delays = { # in game ticks
-                            (1, -8, 2): 4,
-                            (3, -8, 3): 2,
-                            (6, -6, 2): 2,
-                            (7, -5, 5): 2,
-                            (3, -3, 1): 2
-                        }
-                        delay_ticks = 2 * (block['damage'] >> 2) + 2
-                        if (layer_x, layer_y, layer_z) in known_delays:
-                            if known_delays[layer_x, layer_y, layer_z] != delay_ticks:
-                                return 'Repeater at {} {} {} has a delay of {} game tick{}, should be {}.'.format(exact_x, exact_y, exact_z, delay_ticks, '' if delay_ticks == 1 else 's', known_delays[layer_x, layer_y, layer_z])
-                        else:
-                            return 'Delay check for repeater at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                    elif block_symbol == 'S':
-                        # stone top slab
-                        if block['id'] != 'minecraft:stone_slab':
-                            return 'Block at {} {} {} should be a stone slab, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != 0x0:
-                            slab_variant = {
-                                0: 'stone',
-                                1: 'sandstone',
-                                2: 'fake wood',
-                                3: 'cobblestone',
-                                4: 'brick',
-                                5: 'stone brick',
-                                6: 'Nether brick',
-                                7: 'quartz'
-                            }[block['damage'] & 0x7]
-                            return 'Block at {} {} {} should be a <a href="/block/minecraft/stone_slab/0">stone slab</a>, is a <a href="/block/minecraft/stone_slab/{}">{} slab</a>.'.format(exact_x, exact_y, exact_z, block['damage'] & 0x7, slab_variant)
-                        if block['damage'] & 0x8 != 0x8:
-                            return 'Quartz slab at {} {} {} should be a top slab.'.format(exact_x, exact_y, exact_z)
-                    elif block_symbol == 'T':
-                        # redstone torch attached to the side of a block
-                        if block['id'] not in ('minecraft:unlit_redstone_torch', 'minecraft:redstone_torch'):
-                            return 'Block at {} {} {} should be a redstone torch, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        known_facings = {
-                            (3, -8, 1): 1 if z % 2 == 0 else 2, # west / east
-                            (2, -7, 1): 3, # north
-                            (4, -6, 1): 2 if z % 2 == 0 else 1, # east / west
-                            (4, -6, 2): 3, # north
-                            (4, -5, 1): 1 if z % 2 == 0 else 2, # west / east
-                            (4, -5, 3): 4, # south
-                            (7, -5, 3): 3, # north
-                            (1, -4, 2): 4, # south
-                            (1, -3, 3): 3, # north
-                            (1, -1, 4): 4, # south
-                            (5, -1, 1): 2 if z % 2 == 0 else 1, # east / west
-                            (3, 0, 3): 4 # south
-                        }
-                        if (layer_x, layer_y, layer_z) in known_facings:
-                            if known_facings[layer_x, layer_y, layer_z] != block['damage']:
-                                return 'Redstone torch at {} {} {} attached to the block {}, should be attached to the block {}.'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[block['damage']], TORCH_FACINGS[known_facings[layer_x, layer_y, layer_z]])
-                        else:
-                            return 'Facing check for redstone torch at {} {} {} (relative coords: {} {} {}) not yet implemented.'.format(exact_x, exact_y, exact_z, layer_x, layer_y, layer_z)
-                    elif block_symbol == 'W':
-                        # back wall
-                        if z == corridor_length - 1 or z == corridor_length - 2 and z % 2 == 0:
-                            if block['id'] != 'minecraft:stone':
-                                return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] != 0:
-                                stone_variant = {
-                                    0: 'stone',
-                                    1: 'granite',
-                                    2: 'polished granite',
-                                    3: 'diorite',
-                                    4: 'polished diorite',
-                                    5: 'andesite',
-                                    6: 'polished andesite'
-                                }[block['damage']]
-                                return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], stone_variant)
-                    elif block_symbol == 'X':
-                        # overflow hopper chain pointing down
-                        if layer_y < -7 and y < 6 and (z == 4 or z == 5) or layer_y > -7 and y > 1 and (z == 0 or z == 1):
-                            if block['id'] == 'minecraft:hopper':
-                                if block['damage'] != 0: # down
-                                    return 'Overflow hopper at {} {} {} should be pointing down, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                            elif block['id'] == 'minecraft:air':
-                                pass # also allow air because some overflow hopper chains don't start on the first floor
-                            else:
-                                return 'Block at {} {} {} should be air or a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        else:
-                            if block['id'] != 'minecraft:air':
-                                return 'Block at {} {} {} should be air, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == '^':
-                        # hopper facing outward
-                        if block['id'] != 'minecraft:hopper':
-                            return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != (5 if z % 2 == 0 else 4): # east / west
-                            return 'Hopper at {} {} {} should be pointing {}, is {}.'.format(exact_x, exact_y, exact_z, 'east' if z % 2 == 0 else 'west', HOPPER_FACINGS[block['damage']])
-                        storage_hoppers = {
-                            (3, -5, 3),
-                            (6, -5, 3),
-                            (7, -4, 3),
-                            (5, -3, 2),
-                            (6, -3, 2)
-                        }
-                        if (layer_x, layer_y, layer_z) in storage_hoppers:
-                            for slot in block['tileEntity']['Items']:
-                                if not item.matches_slot(slot):
-                                    return 'Storage hopper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == 'c':
-                        # crafting table
-                        if layer_y == -7 and (y == 6 or z < 4 or z < 6 and layer_z > 1):
-                            if block['id'] != 'minecraft:stone':
-                                return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] != 0:
-                                stone_variant = STONE_VARIANTS[block['damage']]
-                                return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], stone_variant)
-                        else:
-                            if block['id'] != 'minecraft:crafting_table':
-                                return 'Block at {} {} {} should be a crafting table, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == 'i':
-                        # torch attached to the top of a block
-                        if block['id'] != 'minecraft:torch':
-                            return 'Block at {} {} {} should be a torch, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] != 5: # attached to the block below
-                            return 'Torch at {} {} {} should be attached to the block below, is attached to the block {}'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[block['damage']])
-                    elif block_symbol == 'p':
-                        # oak planks
-                        if layer_y == -8 and (y == 6 or z < 4 or z < 6 and layer_z > 1):
-                            if block['id'] != 'minecraft:stone':
-                                return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            if block['damage'] != 0:
-                                stone_variant = STONE_VARIANTS[block['damage']]
-                                return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], stone_variant)
-                        else:
-                            if block['id'] != 'minecraft:planks':
-                                return 'Block at {} {} {} should be oak planks, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            pass #TODO check material
-                    elif block_symbol == 'r':
-                        # redstone dust
-                        if block['id'] != 'minecraft:redstone_wire':
-                            return 'Block at {} {} {} should be redstone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                    elif block_symbol == 's':
-                        # stone
-                        if block['id'] != 'minecraft:stone':
-                            if exact_y < 5:
-                                if block['id'] != 'minecraft:bedrock':
-                                    return 'Block at {} {} {} should be stone or bedrock, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                            else:
-                                return 'Block at {} {} {} should be stone, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] != 0:
-                            stone_variant = STONE_VARIANTS[block['damage']]
-                            return 'Block at {} {} {} should be <a href="/block/minecraft/stone/0">regular stone</a>, is <a href="/block/minecraft/stone/{}">{}</a>.'.format(exact_x, exact_y, exact_z, block['damage'], stone_variant)
-                    elif block_symbol == 't':
-                        # redstone torch attached to the top of a block
-                        if block['id'] not in ('minecraft:unlit_redstone_torch', 'minecraft:redstone_torch'):
-                            return 'Block at {} {} {} should be a redstone torch, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] != 5: # attached to the block below
-                            return 'Redstone torch at {} {} {} should be attached to the block below, is attached to the block {}'.format(exact_x, exact_y, exact_z, TORCH_FACINGS[block['damage']])
-                    elif block_symbol == 'v':
-                        # hopper facing inwards
-                        if block['id'] != 'minecraft:hopper':
-                            return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != (4 if z % 2 == 0 else 5): # west / east
-                            return 'Hopper at {} {} {} should be pointing {}, is {}.'.format(exact_x, exact_y, exact_z, 'west' if z % 2 == 0 else 'east', HOPPER_FACINGS[block['damage']])
-                        storage_hoppers = {
-                            (3, -7, 4),
-                            (4, -7, 4),
-                            (2, -6, 3)
-                        }
-                        if (layer_x, layer_y, layer_z) in storage_hoppers:
-                            for slot in block['tileEntity']['Items']:
-                                if not item.matches_slot(slot):
-                                    return 'Storage hopper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == 'x':
-                        # hopper facing down
-                        if block['id'] != 'minecraft:hopper':
-                            return 'Block at {} {} {} should be a hopper, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        if block['damage'] & 0x7 != 0: # down
-                            return 'Hopper at {} {} {} should be pointing down, is {}.'.format(exact_x, exact_y, exact_z, HOPPER_FACINGS[block['damage']])
-                        storage_hoppers = {
-                            (5, -1, 2)
-                        }
-                        if (layer_x, layer_y, layer_z) in storage_hoppers:
-                            for slot in block['tileEntity']['Items']:
-                                if not item.matches_slot(slot):
-                                    return 'Storage hopper at {} {} {} contains items of the wrong kind: {}.'.format(exact_x, exact_y, exact_z, alltheitems.item.Item.from_slot(slot, items_data=items_data).link_text())
-                    elif block_symbol == '~':
-                        # hopper chain
-                        if block['id'] == 'minecraft:hopper':
-                            pass #TODO check facing
-                            pass #TODO check alignment
-                        elif block['id'] == 'minecraft:air':
-                            pass #TODO check alignment
-                        else:
-                            return 'Block at {} {} {} should be a hopper or air, is {}.'.format(exact_x, exact_y, exact_z, block['id'])
-                        pass #TODO check hopper chain integrity
-                    else:
-                        return 'Not yet implemented: block at {} {} {} should be {}.'.format(exact_x, exact_y, exact_z, block_symbol)
+        message = smart_chest_program(document_root=document_root)[z % 2].verify(world, chest)
+        if message is not None:
+            return message
         # error check: items in storage chests but not in access chest
         access_chest_fill_level = alltheitems.item.comparator_signal(north_half, south_half)
-        bottom_dropper_fill_level = alltheitems.item.comparator_signal(block_at(*layer_coords(5, -7, 3), chunk_cache=chunk_cache))
+        bottom_dropper_fill_level = alltheitems.item.comparator_signal(world.block_at(*layer_coords(5, -7, 3)))
         if access_chest_fill_level < 2 and bottom_dropper_fill_level > 2:
             return 'Access chest is {}empty but there are items stuck in the storage dropper at {} {} {}.'.format('' if access_chest_fill_level == 0 else 'almost ', *layer_coords(5, -7, 3))
     if durability and has_smart_chest:
         # error check: damaged or enchanted tools in storage chests
         storage_containers = set(CONTAINERS) - {(5, 0, 2), (5, 0, 3)}
-        for container in storage_containers:
-            for slot in block_at(*layer_coords(*container), chunk_cache=chunk_cache)['tileEntity']['Items']:
+        for container, block in zip(storage_containers, world.blocks_at(layer_coords(*container) for container in storage_containers)):
+            for slot in block['tileEntity']['Items']:
                 if slot.get('Damage', 0) > 0:
                     return 'Item in storage container at {} {} {} is damaged.'.format(*layer_coords(*container))
                 if len(slot.get('tag', {}).get('ench', [])) > 0:
                     return 'Item in storage container at {} {} {} is enchanted.'.format(*layer_coords(*container))
 
-def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=None, *, items_data=None, block_at=alltheitems.world.World().block_at, document_root=ati.document_root, chunk_cache=None, cache=None, allow_cache=True):
-    if items_data is None:
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
-    if chunk_cache is None:
-        chunk_cache = {}
-    if isinstance(item_stub, str):
-        item_stub = {'id': item_stub}
-    item = alltheitems.item.Item(item_stub, items_data=items_data)
+def chest_state(chest, *, world=None, hopper_graph=None, document_root=ati.document_root, store=CHEST_STORE, allow_cache=True):
+    """Returns a tuple (color, message, fill_level) describing the state of the given Chest."""
+    if world is None:
+        world = alltheitems.world.World()
+    if hopper_graph is None:
+        hopper_graph = HopperGraph(world)
+    item = chest.item
+    item_name = chest.item_name
     if item_name is None:
         item_name = item.info()['name']
     state = None, 'This SmartChest is in perfect state.', None
-    x, y, z = coords
-    # determine the base coordinate, i.e. the position of the north half of the access chest
-    if z % 2 == 0:
-        # left wall
-        base_x = 15 * x + 2
-    else:
-        # right wall
-        base_x = 15 * x - 3
-    base_y = 73 - 10 * y
-    base_z = 28 + 10 * y + 4 * (z // 2)
-
-    def layer_coords(layer_x, layer_y, layer_z):
-        if z % 2 == 0:
-            # left wall
-            exact_x = base_x + 5 - layer_x
-        else:
-            # right wall
-            exact_x = base_x - 5 + layer_x
-        exact_y = base_y + layer_y
-        exact_z = base_z + 3 - layer_z
-        return exact_x, exact_y, exact_z
-
+    coords = x, y, z = chest.coords
+    base_x, base_y, base_z = chest.base_x, chest.base_y, chest.base_z
+    layer_coords = chest.layer_coords
+    # fetch the blocks needed to determine the state in one go
+    dropper_coords = [(base_x, dropper_y, base_z) for dropper_y in range(base_y - 7, base_y)]
+    sorting_hopper_coords = base_x - 2 if z % 2 == 0 else base_x + 2, base_y - 3, base_z
+    overflow_coords = [(overflow_x, base_y - 7, base_z - 1) for overflow_x in range(base_x + 3 if z % 2 == 0 else base_x - 3, base_x + 6 if z % 2 == 0 else base_x - 6, 1 if z % 2 == 0 else -1)]
+    state_coords = [(base_x, base_y, base_z), (base_x, base_y, base_z + 1), sorting_hopper_coords] + dropper_coords + overflow_coords
+    footprint = {} # the chunk sections read to determine the state and check for errors
+    with world.recording(footprint):
+        state_blocks = dict(zip(state_coords, world.blocks_at(state_coords)))
     # does the access chest exist?
     exists = False
-    north_half = block_at(base_x, base_y, base_z, chunk_cache=chunk_cache)
-    south_half = block_at(base_x, base_y, base_z + 1, chunk_cache=chunk_cache)
+    north_half = state_blocks[base_x, base_y, base_z]
+    south_half = state_blocks[base_x, base_y, base_z + 1]
     if north_half['id'] != 'minecraft:chest' and south_half['id'] != 'minecraft:chest':
         state = 'gray', 'Access chest does not exist.', None
     elif north_half['id'] != 'minecraft:chest':
@@ -781,9 +1242,8 @@ def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=N
     # does it have a SmartChest?
     has_smart_chest = False
     missing_droppers = set()
-    for dropper_y in range(base_y - 7, base_y):
-        dropper = block_at(base_x, dropper_y, base_z, chunk_cache=chunk_cache)
-        if dropper['id'] != 'minecraft:dropper':
+    for dropper_x, dropper_y, dropper_z in dropper_coords:
+        if state_blocks[dropper_x, dropper_y, dropper_z]['id'] != 'minecraft:dropper':
             missing_droppers.add(dropper_y)
     if len(missing_droppers) == 7:
         if state[0] is None:
@@ -793,7 +1253,7 @@ def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=N
             state = 'orange', 'SmartChest droppers at y={} do not exist.'.format(', y='.join(str(dropper) for dropper in missing_droppers)), None
     elif len(missing_droppers) == 1:
         if state[0] is None:
-            state = 'orange', 'SmartChest dropper at y={} does not exist, is {}.'.format(next(iter(missing_droppers)), block_at(base_x, dropper_y, base_z)['id']), None
+            state = 'orange', 'SmartChest dropper at y={} does not exist, is {}.'.format(next(iter(missing_droppers)), state_blocks[base_x, next(iter(missing_droppers)), base_z]['id']), None
     else:
         has_smart_chest = True
     # is it stackable?
@@ -804,11 +1264,8 @@ def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=N
     durability = 'durability' in item.info()
     # does it have a sorter?
     has_sorter = False
-    if item == 'minecraft:crafting_table' or stackable and item.max_stack_size < 64:
-        filler_item = alltheitems.item.Item('minecraft:crafting_table', items_data=items_data)
-    else:
-        filler_item = alltheitems.item.Item('minecraft:ender_pearl', items_data=items_data)
-    sorting_hopper = block_at(base_x - 2 if z % 2 == 0 else base_x + 2, base_y - 3, base_z, chunk_cache=chunk_cache)
+    filler_item = chest.filler_item
+    sorting_hopper = state_blocks[sorting_hopper_coords]
     if sorting_hopper['id'] != 'minecraft:hopper':
         if state[0] is None:
             state = 'yellow', 'Sorting hopper does not exist, is {}.'.format(sorting_hopper['id']), None
@@ -823,42 +1280,37 @@ def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=N
     # does it have an overflow?
     has_overflow = False
     missing_overflow_hoppers = set()
-    for overflow_x in range(base_x + 3 if z % 2 == 0 else base_x - 3, base_x + 6 if z % 2 == 0 else base_x - 6, 1 if z % 2 == 0 else -1):
-        overflow_hopper = block_at(overflow_x, base_y - 7, base_z - 1, chunk_cache=chunk_cache)
-        if overflow_hopper['id'] != 'minecraft:hopper':
+    for overflow_x, overflow_y, overflow_z in overflow_coords:
+        if state_blocks[overflow_x, overflow_y, overflow_z]['id'] != 'minecraft:hopper':
             missing_overflow_hoppers.add(overflow_x)
     if len(missing_overflow_hoppers) == 0:
         has_overflow = True
     # state determined, check for errors
     if coords == (1, 1, 0): # Ender pearls
-        message = global_error_checks(chunk_cache=chunk_cache, block_at=block_at)
+        message = global_error_checks(world=world, store=store, hopper_graph=hopper_graph)
         if message is not None:
             return 'red', message, None
-    cache_path = ati.cache_root / 'cloud-chests.json'
-    if cache is None:
-        if cache_path.exists():
-            with cache_path.open() as cache_f:
-                cache = json.load(cache_f)
-        else:
-            cache = {}
-    max_age = datetime.timedelta(hours=1, minutes=random.randrange(0, 60)) # use a random value between 1 and 2 hours for the cache expiration
-    if allow_cache and str(y) in cache and str(x) in cache[str(y)] and str(z) in cache[str(y)][str(x)] and cache[str(y)][str(x)][str(z)]['errorMessage'] is None and datetime.datetime.strptime(cache[str(y)][str(x)][str(z)]['timestamp'], '%Y-%m-%d %H:%M:%S') > datetime.datetime.utcnow() - max_age:
-        message = cache[str(y)][str(x)][str(z)]['errorMessage']
-        pass # cached check results are recent enough
-    else:
-        # cached check results are too old, recheck
-        message = chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists, stackable, durability, has_smart_chest, has_sorter, has_overflow, filler_item, sorting_hopper, missing_overflow_hoppers, north_half, south_half, corridor_length, pre_sorter, layer_coords, block_at, items_data, chunk_cache, document_root)
-        if ati.cache_root.exists():
-            if str(y) not in cache:
-                cache[str(y)] = {}
-            if str(x) not in cache[str(y)]:
-                cache[str(y)][str(x)] = {}
-            cache[str(y)][str(x)][str(z)] = {
-                'errorMessage': message,
-                'timestamp': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            with cache_path.open('w') as cache_f:
-                json.dump(cache, cache_f, sort_keys=True, indent=4)
+
+    sources = chest_check_sources(document_root) # read before checking, like the chunk timestamps
+
+    def cached():
+        result = store.chest(x, y, z)
+        cached_footprint = None if result is None or result[1] < datetime.datetime.utcnow() - FOOTPRINT_MAX_AGE else store.chest_footprint(x, y, z, sources=sources)
+        if cached_footprint is not None and world.chunk_timestamps(cached_footprint) == cached_footprint:
+            return result[0] # neither the chunk sections read by the last check nor cloud.json, items.json, or the schematic have changed since
+        return alltheitems.util.MISSING
+
+    def check():
+        with world.recording(footprint):
+            message = chest_error_checks(chest, item_name, exists, stackable, durability, has_smart_chest, has_sorter, has_overflow, sorting_hopper, missing_overflow_hoppers, north_half, south_half, world, document_root, hopper_graph)
+        store.set_chest(x, y, z, message, footprint=footprint, sources=sources)
+        return message
+
+    message = cached() if allow_cache else alltheitems.util.MISSING
+    if message is alltheitems.util.MISSING:
+        # recheck, or use the outdated result if another thread or process is already rechecking this chest
+        result = store.chest(x, y, z) if allow_cache else None
+        message = CHECK_FLIGHTS.run(('chest', x, y, z), check, recheck=cached if allow_cache else None, stale=alltheitems.util.MISSING if result is None else result[0])
     if message is not None:
         return 'red', message, None
     # no errors, determine fill level
@@ -868,39 +1320,297 @@ def chest_state(coords, item_stub, corridor_length, item_name=None, pre_sorter=N
                 (5, 0, 2),
                 (5, 0, 3)
             ]
-            total_items = sum(max(0, sum(slot['Count'] for slot in block_at(*layer_coords(*container), chunk_cache=chunk_cache)['tileEntity']['Items'] if slot.get('Damage', 0) == 0 or not durability) - (4 * item.max_stack_size if container == (5, -7, 3) else 0)) for container in containers) # Don't count the 4 stacks of items that are stuck in the bottom dropper. Don't count damaged tools.
-            max_slots = sum(alltheitems.item.NUM_SLOTS[block_at(*layer_coords(*container), chunk_cache=chunk_cache)['id']] for container in containers) - (0 if state[0] == 'orange' else 4)
+            container_blocks = world.blocks_at(layer_coords(*container) for container in containers)
+            total_items = sum(max(0, sum(slot['Count'] for slot in block['tileEntity']['Items'] if slot.get('Damage', 0) == 0 or not durability) - (4 * item.max_stack_size if container == (5, -7, 3) else 0)) for container, block in zip(containers, container_blocks)) # Don't count the 4 stacks of items that are stuck in the bottom dropper. Don't count damaged tools.
+            max_slots = sum(alltheitems.item.NUM_SLOTS[block['id']] for block in container_blocks) - (0 if state[0] == 'orange' else 4)
             return state[0], state[1], FillLevel(item.max_stack_size, total_items, max_slots, is_smart_chest=state[0] in (None, 'cyan'))
         except:
             # something went wrong determining fill level, re-check errors
-            message = chest_error_checks(x, y, z, base_x, base_y, base_z, item, item_name, exists, stackable, durability, has_smart_chest, has_sorter, has_overflow, filler_item, sorting_hopper, missing_overflow_hoppers, north_half, south_half, corridor_length, g, layer_coords, block_at, items_data, chunk_cache, document_root)
-            if ati.cache_root.exists():
-                if str(y) not in cache:
-                    cache[str(y)] = {}
-                if str(x) not in cache[str(y)]:
-                    cache[str(y)][str(x)] = {}
-                cache[str(y)][str(x)][str(z)] = {
-                    'errorMessage': message,
-                    'timestamp': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                with cache_path.open('w') as cache_f:
-                    json.dump(cache, cache_f, sort_keys=True, indent=4)
+            message = CHECK_FLIGHTS.run(('chest', x, y, z), check)
             if message is None:
                 raise
             else:
                 return 'red', message, None
     return state
 
-def cell_from_chest(coords, item_stub, corridor_length, item_name=None, pre_sorter=None, *, chunk_cache=None, items_data=None, colors_to_explain=None, cache=None, allow_cache=True):
-    color, state_message, fill_level = chest_state(coords, item_stub, corridor_length, item_name, pre_sorter, items_data=items_data, chunk_cache=chunk_cache, cache=cache, allow_cache=allow_cache)
+def cloud_shards():
+    """Splits the Cloud into shards of chests which are checked together, one for each corridor on each floor, so that a shard's chunk sections are mostly shared. Returns a list of shards in chest_iter order, each a tuple of Chest records."""
+    return [corridor for y, floor in sorted(cloud_layout().floors.items()) for x, corridor in sorted(floor.items())]
+
+def _verify_shard(shard, allow_cache=True, store=CHEST_STORE, world=None, hopper_graph=None):
+    if world is None:
+        world = alltheitems.world.World()
+    if hopper_graph is None:
+        hopper_graph = HopperGraph(world)
+    results = []
+    for chest in shard:
+        try:
+            state = chest_state(chest, world=world, hopper_graph=hopper_graph, store=store, allow_cache=allow_cache)
+        except Exception as e:
+            state = 'red', 'Error while checking this chest: {}'.format(xml.sax.saxutils.escape('{}: {}'.format(e.__class__.__name__, e))), None
+        results.append((chest.coords, state))
+    return results
+
+def verify_iter(workers=None, *, allow_cache=True, store=CHEST_STORE):
+    """Computes the state of every chest, yielding tuples (coords, (color, message, fill_level)) in chest_iter order. An exception while checking a chest is reported as a red state.
+
+    The chests are split into cloud_shards and, if workers is not 1, checked in that many processes (defaults to the number of CPUs). Error check results are written to store by the process which computed them. A HopperGraph is shared by all chests checked in the same process.
+    """
+    shards = cloud_shards()
+    if workers == 1:
+        world = alltheitems.world.World()
+        hopper_graph = HopperGraph(world)
+        for shard in shards:
+            yield from _verify_shard(shard, allow_cache, store, world, hopper_graph)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            for results in executor.map(_verify_shard, shards, itertools.repeat(allow_cache), itertools.repeat(store)):
+                yield from results
+
+def verify_all(workers=None, *, allow_cache=True, store=CHEST_STORE):
+    """Returns the results of verify_iter as a list."""
+    return list(verify_iter(workers, allow_cache=allow_cache, store=store))
+
+class CloudSnapshot:
+    """An immutable snapshot of the states of the Cloud chests.
+
+    states is a read-only mapping from chest coords (x, y, z) to tuples (color, message, fill_level, timestamp), where the first three values are as returned by chest_state and timestamp is the datetime (in UTC) at which they were determined. Chests which haven't been checked yet are missing. timestamp is the time at which the snapshot was published, or None for the empty snapshot. complete is False until the first full refresh has finished.
+    """
+
+    __slots__ = ('states', 'timestamp', 'complete')
+
+    def __init__(self, states, timestamp=None, *, complete=False):
+        object.__setattr__(self, 'states', types.MappingProxyType(dict(states)))
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, 'complete', complete)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CloudSnapshot objects are immutable')
+
+class CloudRefresher:
+    """Computes the state of every Cloud chest in a background thread, at most every interval seconds, and publishes the results as a CloudSnapshot in the store.
+
+    Every process reading the snapshot runs a refresher thread, but only one process of the deployment refreshes at a time, coordinated through CHECK_FLIGHTS, and the others skip a refresh if the published snapshot is recent enough. workers is passed to verify_iter; the default of 2 keeps the world reads out of the web server process.
+
+    Web requests only read the snapshot attribute, so they never wait for the world to be read.
+    """
+
+    def __init__(self, *, interval=300.0, workers=2, store=CHEST_STORE, check_interval=1.0):
+        self.interval = interval
+        self.workers = workers
+        self.store = store
+        self.check_interval = check_interval
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._snapshot = None, CloudSnapshot({}) # (version, snapshot) as last read from the store
+        self._last_check = None
+        self._last_refresh = None # time.monotonic() of the last refresh in this process
+
+    @property
+    def snapshot(self):
+        """The CloudSnapshot last published by any process, reloaded from the store at most every check_interval seconds if it has changed. Reading it starts the refresher thread in this process if it isn't running."""
+        self.ensure_running()
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return self._snapshot[1]
+        self._last_check = now
+        version, snapshot = self._snapshot
+        info = self.store.snapshot_info()
+        if info is not None and info[0] != version:
+            snapshot = self.store.snapshot()
+            if snapshot is not None:
+                self._snapshot = info[0], snapshot
+        return self._snapshot[1]
+
+    def ensure_running(self):
+        """Starts the background thread in the current process if it isn't running. Threads don't survive a fork, so this is called from the snapshot property rather than on import, so each worker process of a preforking server gets its own thread."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='CloudRefresher', daemon=True)
+                self._thread.start()
+
+    def _seconds_until_due(self):
+        info = self.store.snapshot_info()
+        if info is None:
+            # nothing published, either because nothing has been checked yet or because the store is unavailable
+            return 0.0 if self._last_refresh is None else self.interval - (time.monotonic() - self._last_refresh)
+        if not info[2]:
+            return 0.0
+        return self.interval - (datetime.datetime.utcnow() - info[1]).total_seconds()
+
+    def refresh(self):
+        """Computes the state of every chest once. The states of each floor are published as soon as it has been checked, so pages can show partial results while the first refresh is running."""
+        states = {}
+        floor_states = {}
+        current_y = None
+        for (x, y, z), (color, state_message, fill_level) in verify_iter(self.workers, store=self.store):
+            if y != current_y and current_y is not None:
+                self.store.publish_states(floor_states)
+                floor_states = {}
+            current_y = y
+            states[x, y, z] = floor_states[x, y, z] = color, state_message, fill_level, datetime.datetime.utcnow()
+        self.store.publish_states(states, complete=True, replace=True)
+        if self.store.snapshot_info() is None:
+            # the store is unavailable, so only this process gets to see the results
+            self._snapshot = None, CloudSnapshot(states, datetime.datetime.utcnow(), complete=True)
+        self._last_refresh = time.monotonic()
+        self.refreshes += 1
+
+    def _refresh_if_due(self):
+        # another process may have finished a refresh while this one was waiting for the lock
+        if self._seconds_until_due() <= 0:
+            self.refresh()
+
+    def run(self):
+        while True:
+            try:
+                if self._seconds_until_due() <= 0:
+                    CHECK_FLIGHTS.run(('refresh',), self._refresh_if_due, stale=None) # skip if another process is refreshing
+            except Exception:
+                traceback.print_exc()
+            try:
+                time.sleep(min(self.interval, max(self._seconds_until_due(), 10.0)))
+            except Exception:
+                traceback.print_exc()
+                time.sleep(self.interval)
+
+REFRESHER = CloudRefresher()
+
+def _cell_appearance(state):
+    """Returns a tuple (color, fill bar width) describing how a chest with the given state is shown on the Cloud index page. The fill bar width is None if no fill bar is shown."""
+    if state is None:
+        return 'pending', None
+    color, _, fill_level, _ = state
+    if fill_level is None or fill_level.is_full():
+        return color, None
+    return color, 0 if fill_level.is_empty() else 2 + int(fill_level.fraction * 13) * 2
+
+def cell_from_chest(item_stub, state, *, colors_to_explain=None):
+    """Returns the table cell for a chest on the Cloud index page. state is the chest's entry in a CloudSnapshot, or None if it hasn't been checked yet."""
+    color, fill_bar_width = _cell_appearance(state)
     if colors_to_explain is not None:
         colors_to_explain.add(color)
-    if fill_level is None or fill_level.is_full():
-        return '<td style="background-color: {};">{}</td>'.format(HTML_COLORS[color], alltheitems.item.Item(item_stub, items_data=items_data).image())
+    if fill_bar_width is None:
+        return '<td style="background-color: {};">{}</td>'.format(HTML_COLORS[color], alltheitems.item.Item(item_stub).image())
     else:
-        return '<td style="background-color: {};">{}<div class="durability"><div style="background-color: #f0f; width: {}px;"></div></div></td>'.format(HTML_COLORS[color], alltheitems.item.Item(item_stub, items_data=items_data).image(), 0 if fill_level.is_empty() else 2 + int(fill_level.fraction * 13) * 2)
+        return '<td style="background-color: {};">{}<div class="durability"><div style="background-color: #f0f; width: {}px;"></div></div></td>'.format(HTML_COLORS[color], alltheitems.item.Item(item_stub).image(), fill_bar_width)
+
+def floor_table(y, floor, snapshot):
+    """Renders the table for one floor of the Cloud index page, without the heading. floor is the floor's entry in CloudLayout.floors. Returns a tuple (html, colors), where colors is the set of chest colors used."""
+    colors = set()
+
+    def cell(chest):
+        return cell_from_chest(chest.item_stub, snapshot.states.get(chest.coords), colors_to_explain=colors)
+
+    html = bottle.template("""
+        %import itertools
+        <table class="item-table" style="margin-left: auto; margin-right: auto;">
+            %for x in range(-3, 4):
+                %if x > -3:
+                    <colgroup class="left-sep">
+                        <col />
+                        <col />
+                    </colgroup>
+                %else:
+                    <colgroup>
+                        <col />
+                        <col />
+                    </colgroup>
+                %end
+            %end
+            <tbody>
+                %for z_left, z_right in zip(itertools.count(step=2), itertools.count(start=1, step=2)):
+                    %found = False
+                    <tr>
+                        %for x in range(-3, 4):
+                            %if x not in floor:
+                                <td></td>
+                                <td></td>
+                                %continue
+                            %end
+                            %corridor = floor[x]
+                            %if len(corridor) > z_right:
+                                {{!cell(corridor[z_right])}}
+                            %else:
+                                <td></td>
+                            %end
+                            %if len(corridor) > z_left:
+                                {{!cell(corridor[z_left])}}
+                                %found = True
+                            %else:
+                                <td></td>
+                            %end
+                        %end
+                    </tr>
+                    %if not found:
+                        %break
+                    %end
+                %end
+            </tbody>
+        </table>
+    """, cell=cell, floor=floor)
+    return html, frozenset(colors)
 
-def index(allow_cache=True):
+class FloorFragmentCache:
+    """Caches the rendered floor tables of the Cloud index page.
+
+    Each table is stored with a digest of everything it depends on: the versions of cloud.json and items.json and how each of the floor's chests is shown. A table is only rendered again when its digest changes.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fragments = {} # maps floor y coordinates to (digest, html, colors)
+
+    def fragment(self, y, floor, snapshot):
+        """Returns a tuple (html, colors) like floor_table, using the cached table if the floor is unchanged."""
+        appearances = [(chest.coords, _cell_appearance(snapshot.states.get(chest.coords))) for corridor in floor.values() for chest in corridor]
+        digest = hashlib.blake2b(repr((CLOUD_JSON.versioned()[0], alltheitems.item.ITEMS_DATA.versioned()[0], appearances)).encode(), digest_size=16).digest()
+        with self._lock:
+            cached = self._fragments.get(y)
+            if cached is not None and cached[0] == digest:
+                self.hits += 1
+                return cached[1:]
+            self.misses += 1
+        html, colors = floor_table(y, floor, snapshot)
+        with self._lock:
+            self._fragments[y] = digest, html, colors
+        return html, colors
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+FLOOR_FRAGMENTS = FloorFragmentCache()
+
+COLOR_EXPLANATIONS = collections.OrderedDict([
+    ('red', 'A red background means that there is something wrong with the chest. See the item info page for details.'),
+    ('gray', "A gray background means that the chest hasn't been built yet or is still located somewhere else."),
+    ('orange', "An orange background means that the chest doesn't have a SmartChest yet. It can only store 54 stacks."),
+    ('yellow', "A yellow background means that the chest doesn't have a sorter yet."),
+    ('cyan', 'A cyan background means that the chest has no sorter because it stores an unstackable item. These items should not be automatically <a href="//wiki.wurstmineberg.de/Soup#Cloud">sent</a> to the Cloud.'),
+    (None, 'A white background means that everything is okay: the chest has a SmartChest, a sorter, and overflow protection.'),
+    ('pending', "A light gray background means that the chest hasn't been checked since the server was restarted.")
+])
+
+def floor_page(y):
+    """The table for one floor of the Cloud, as loaded by the Cloud index page. The colors used are listed in the data-colors attribute of the wrapping div, with none standing for a white background."""
+    layout = cloud_layout()
+    if y not in layout.floors:
+        bottle.abort(404, 'There is no Cloud floor with the y coordinate {}.'.format(y))
+    html, colors = FLOOR_FRAGMENTS.fragment(y, layout.floors[y], REFRESHER.snapshot)
+    return '<div class="cloud-floor-table" data-colors="{}">{}</div>'.format(' '.join('none' if color is None else color for color in colors), html)
+
+def index():
+    """The Cloud index page. Only the headings are rendered here, each floor's table is loaded from the floor route, so the floors load independently."""
     yield ati.header(title='Cloud')
     def body():
         yield '<p>The <a href="//wiki.{host}/Cloud">Cloud</a> is the public item storage on <a href="//{host}/">Wurstmineberg</a>, consisting of 6 underground floors with <a href="//wiki.{host}/SmartChest">SmartChests</a> in them.</p>'.format(host=ati.host)
@@ -920,106 +1630,38 @@ def index(allow_cache=True):
                 z-index: 1;
             }
         </style>"""
-        chunk_cache = {}
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
-        cache_path = ati.cache_root / 'cloud-chests.json'
-        if cache_path.exists():
-            try:
-                with cache_path.open() as cache_f:
-                    cache = json.load(cache_f)
-            except ValueError:
-                # cache JSON is corrupted, probably because of a full disk, try without cache
-                cache_path.unlink()
-                cache = None
-        else:
-            cache = None
-        colors_to_explain = set()
-        floors = {}
-        for x, corridor, y, floor, z, chest in chest_iter():
-            if y not in floors:
-                floors[y] = floor
-        for y, floor in sorted(floors.items(), key=lambda tup: tup[0]):
-            def cell(coords, item_stub, corridor):
-                if isinstance(item_stub, str):
-                    item_stub = {'id': item_stub}
-                    item_name = None
-                    pre_sorter = None
-                else:
-                    item_stub = item_stub.copy()
-                    if 'name' in item_stub:
-                        item_name = item_stub['name']
-                        del item_stub['name']
-                    else:
-                        item_name = None
-                    if 'sorter' in item_stub:
-                        pre_sorter = item_stub['sorter']
-                        del item_stub['sorter']
-                    else:
-                        pre_sorter = None
-                return cell_from_chest(coords, item_stub, len(corridor), item_name, pre_sorter, chunk_cache=chunk_cache, colors_to_explain=colors_to_explain, items_data=items_data, cache=cache, allow_cache=allow_cache)
-
+        if not REFRESHER.snapshot.complete:
+            yield '<p class="muted">The Cloud is still being checked after a server restart, so some chests are not shown with their current state yet. Reload the page in a few minutes.</p>'
+        for y in sorted(cloud_layout().floors):
             yield bottle.template("""
-                %import itertools
                 <h2 id="floor{{y}}">{{y}}{{ordinal(y)}} floor (y={{73 - 10 * y}})</h2>
-                <table class="item-table" style="margin-left: auto; margin-right: auto;">
-                    %for x in range(-3, 4):
-                        %if x > -3:
-                            <colgroup class="left-sep">
-                                <col />
-                                <col />
-                            </colgroup>
-                        %else:
-                            <colgroup>
-                                <col />
-                                <col />
-                            </colgroup>
-                        %end
-                    %end
-                    <tbody>
-                        %for z_left, z_right in zip(itertools.count(step=2), itertools.count(start=1, step=2)):
-                            %found = False
-                            <tr>
-                                %for x in range(-3, 4):
-                                    %if str(x) not in floor:
-                                        <td></td>
-                                        <td></td>
-                                        %continue
-                                    %end
-                                    %corridor = floor[str(x)]
-                                    %if len(corridor) > z_right:
-                                        {{!cell((x, y, z_right), corridor[z_right], corridor)}}
-                                    %else:
-                                        <td></td>
-                                    %end
-                                    %if len(corridor) > z_left:
-                                        {{!cell((x, y, z_left), corridor[z_left], corridor)}}
-                                        %found = True
-                                    %else:
-                                        <td></td>
-                                    %end
-                                %end
-                            </tr>
-                            %if not found:
-                                %break
-                            %end
-                        %end
-                    </tbody>
-                </table>
-            """, ordinal=alltheitems.util.ordinal, cell=cell, floor=floor, y=y)
-        color_explanations = collections.OrderedDict([
-            ('red', '<p>A red background means that there is something wrong with the chest. See the item info page for details.</p>'),
-            ('gray', "<p>A gray background means that the chest hasn't been built yet or is still located somewhere else.</p>"),
-            ('orange', "<p>An orange background means that the chest doesn't have a SmartChest yet. It can only store 54 stacks.</p>"),
-            ('yellow', "<p>A yellow background means that the chest doesn't have a sorter yet.</p>"),
-            ('cyan', '<p>A cyan background means that the chest has no sorter because it stores an unstackable item. These items should not be automatically <a href="//wiki.wurstmineberg.de/Soup#Cloud">sent</a> to the Cloud.</p>'),
-            (None, '<p>A white background means that everything is okay: the chest has a SmartChest, a sorter, and overflow protection.</p>')
-        ])
-        for chest_color in sorted(colors_to_explain, key=list(color_explanations.keys()).index):
-            if chest_color is not None or len(colors_to_explain) > 1:
-                yield color_explanations[chest_color]
+                <div class="cloud-floor" data-floor="{{y}}">
+                    <p class="muted"><a href="/cloud/floor/{{y}}">Loading…</a></p>
+                </div>
+            """, ordinal=alltheitems.util.ordinal, y=y)
+        for chest_color, explanation in COLOR_EXPLANATIONS.items():
+            yield '<p class="color-explanation hidden" data-color="{}">{}</p>'.format('none' if chest_color is None else chest_color, explanation)
     yield from ati.html_exceptions(body())
-    yield ati.footer(linkify_headers=True)
+    yield ati.footer(linkify_headers=True, additional_js="""
+        var cloudColors = {};
+        $('.cloud-floor').each(function() {
+            var container = $(this);
+            $.get('/cloud/floor/' + container.attr('data-floor'), function(html) {
+                container.html(html);
+                initializeTooltips();
+                _.each(container.children('.cloud-floor-table').attr('data-colors').split(' '), function(color) {
+                    cloudColors[color] = true;
+                });
+                var colors = _.keys(cloudColors);
+                $('.color-explanation').each(function() {
+                    var color = $(this).attr('data-color');
+                    $(this).toggleClass('hidden', !_.contains(colors, color) || color === 'none' && colors.length < 2);
+                });
+            }).fail(function() {
+                container.html('<p class="muted">Could not load this floor. <a href="/cloud/floor/' + container.attr('data-floor') + '">Try again</a>.</p>');
+            });
+        });
+    """)
 
 def todo():
     yield ati.header(title='Cloud by priority')
@@ -1063,46 +1705,21 @@ def todo():
             color, _, fill_level, _ = state
             return header_indexes[color], None if fill_level is None else fill_level.fraction * (-1 if color == 'orange' else 1), y * (-1 if color == 'orange' else 1), x if y % 2 == 0 else -x, z
 
-        chunk_cache = {}
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
-        cache_path = ati.cache_root / 'cloud-chests.json'
-        if cache_path.exists():
-            try:
-                with cache_path.open() as cache_f:
-                    cache = json.load(cache_f)
-            except ValueError:
-                # cache JSON is corrupted, probably because of a full disk, try without cache
-                cache_path.unlink()
-                cache = None
-        else:
-            cache = None
+        snapshot = REFRESHER.snapshot
+        if not snapshot.complete:
+            yield '<p class="muted">The Cloud is still being checked after a server restart, so this list is incomplete. Reload the page in a few minutes.</p>'
         states = {}
         current_color = None
-        for x, corridor, y, _, z, item_stub in chest_iter():
-            if isinstance(item_stub, str):
-                item_stub = {'id': item_stub}
-                item_name = None
-                pre_sorter = None
-            else:
-                item_stub = item_stub.copy()
-                if 'name' in item_stub:
-                    item_name = item_stub['name']
-                    del item_stub['name']
-                else:
-                    item_name = None
-                if 'sorter' in item_stub:
-                    pre_sorter = item_stub['sorter']
-                    del item_stub['sorter']
-                else:
-                    pre_sorter = None
-            color, state_message, fill_level = chest_state((x, y, z), item_stub, len(corridor), item_name, pre_sorter, items_data=items_data, chunk_cache=chunk_cache, cache=cache)
+        for chest in cloud_layout().chests:
+            if chest.coords not in snapshot.states:
+                continue
+            color, state_message, fill_level, _ = snapshot.states[chest.coords]
             if color is None:
                 color = 'white'
             if color in ('cyan', 'white') and not fill_level.is_empty():
                 color += '2'
             if fill_level is None or not fill_level.is_full() or color not in ('cyan', 'white', 'cyan2', 'white2'):
-                states[x, y, z] = color, state_message, fill_level, alltheitems.item.Item(item_stub, items_data=items_data)
+                states[chest.coords] = color, state_message, fill_level, chest.item
         for coords, state in sorted(states.items(), key=priority):
             x, y, z = coords
             color, state_message, fill_level, item = state
@@ -1122,6 +1739,24 @@ def todo():
                     <td style="background-color: {{color}}">{{!fill_level if color in ('#0ff', '#fff') else state_message}}</td>
                 </tr>
             """, x=x, y=y, z=z, item=item, color=HTML_COLORS[color], fill_level=fill_level, state_message=state_message)
-        yield '</tbody></table>'
+        if current_color is not None:
+            yield '</tbody></table>'
     yield from ati.html_exceptions(body())
     yield ati.footer(linkify_headers=True)
+
+if __name__ == '__main__':
+    # benchmark a full check of the Cloud, without cached results, with different numbers of worker processes
+    import tempfile
+
+    results = None
+    baseline = None
+    for workers in (1, 2, 4, 8):
+        alltheitems.world.CHUNK_CACHE.clear()
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as store_dir: # don't overwrite the live check results
+            worker_results = verify_all(workers, allow_cache=False, store=ChestStore(pathlib.Path(store_dir) / 'cloud.sqlite3'))
+        seconds = time.perf_counter() - start
+        if results is None:
+            results, baseline = worker_results, seconds
+        assert [(coords, state[:2]) for coords, state in worker_results] == [(coords, state[:2]) for coords, state in results]
+        print('{} worker{}: {} chests in {:.2f}s ({:.1f}x)'.format(workers, '' if workers == 1 else 's', len(worker_results), seconds, baseline / seconds))
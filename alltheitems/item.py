@@ -2,12 +2,16 @@ import alltheitems.__main__ as ati
 
 import enum
 import functools
-import json
+import itertools
 import re
+import types
+import weakref
 import xml.sax.saxutils
 
 import alltheitems.util
 
+ITEMS_DATA = alltheitems.util.FileCache(ati.assets_root / 'json' / 'items.json') # the decoded contents of items.json, shared by the whole process
+
 NUM_SLOTS = {
     'minecraft:furnace': 3,
     'minecraft:lit_furnace': 3,
@@ -28,137 +32,127 @@ class Renewability(alltheitems.util.OrderedEnum):
     automatic = 4
     fully_automatic = 5
 
+STUB_KEYS = ( # the keys of an item stub that are kept by Item, in canonical order
+    'id',
+    'damage',
+    'effect',
+    'tagValue',
+    'consumed',
+    'amount'
+)
+
 @functools.total_ordering
 class Item:
-    def __init__(self, item_stub, *, items_data=None):
+    """An immutable block or item stub.
+
+    Instances are interned: constructing the same stub twice returns the same object as long as the first one is still referenced. Equality, hashing, and ordering use the variant key (ID plus damage/effect/tag value), which is computed once on construction.
+    """
+
+    __slots__ = ('_stub', 'key', '_hash', '_slot_matcher', '__weakref__')
+
+    _instances = weakref.WeakValueDictionary()
+
+    def __new__(cls, item_stub):
+        if item_stub.__class__ is cls:
+            return item_stub
         if isinstance(item_stub, Item):
-            self.stub = item_stub.stub
+            stub = item_stub._stub
         elif isinstance(item_stub, str):
-            self.stub = {'id': item_stub}
+            stub = {'id': item_stub}
         elif isinstance(item_stub, dict):
             if 'id' not in item_stub:
                 raise ValueError('Missing item ID')
-            self.stub = item_stub
+            stub = {key: item_stub[key] for key in STUB_KEYS if key in item_stub}
+            if 'tagValue' in stub and stub['tagValue'] is not None:
+                stub['tagValue'] = str(stub['tagValue'])
         else:
             raise TypeError('Cannot create an item from {}'.format(type(item_stub)))
-        allowed_keys = {
-            'id',
-            'damage',
-            'effect',
-            'tagValue',
-            'consumed',
-            'amount'
-        }
-        self.stub = {key: value for key, value in self.stub.items() if key in allowed_keys}
-        if 'tagValue' in self.stub and self.stub['tagValue'] is not None:
-            self.stub['tagValue'] = str(self.stub['tagValue'])
-        if items_data is None and isinstance(item_stub, Item) and item_stub.items_data is not None:
-            self.items_data = item_stub.items_data
-        elif items_data is None:
-            with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-                self.items_data = json.load(items_file)
+        try:
+            intern_key = (cls,) + tuple(stub.items())
+            hash(intern_key)
+        except TypeError:
+            intern_key = None # stub has unhashable extra fields, don't intern
         else:
-            self.items_data = items_data
+            result = cls._instances.get(intern_key)
+            if result is not None:
+                return result
+        self = super().__new__(cls)
+        self._stub = stub
+        self.key = stub_key(stub)
+        self._slot_matcher = None, None
+        self._hash = hash(self.key)
+        if intern_key is not None:
+            self = cls._instances.setdefault(intern_key, self)
+        return self
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_hash'):
+            raise AttributeError('{} objects are immutable'.format(self.__class__.__name__))
+        super().__setattr__(name, value)
+
+    def __reduce__(self):
+        return self.__class__, (self._stub,)
 
     def __eq__(self, other):
-        if not isinstance(other, Item):
-            try:
-                other = Item(other)
-            except TypeError:
-                return False
-        if self.stub['id'] != other.stub['id']:
+        if isinstance(other, Item):
+            return self.key == other.key
+        try:
+            return self.key == stub_key(other)
+        except TypeError:
             return False
-        for attr in ('damage', 'effect', 'tagValue'):
-            if attr in self.stub:
-                if attr not in other.stub:
-                    return False
-                if self.stub[attr] != other.stub[attr]:
-                    return False
-            else:
-                if attr in other.stub:
-                    return False
-        return True
 
     def __hash__(self):
-        return hash(self.stub['id'])
+        return self._hash
 
     def __lt__(self, other):
-        if not isinstance(other, Item):
-            try:
-                other = Item(other)
-            except TypeError:
-                return NotImplemented
-        if self.stub['id'] < other.stub['id']:
-            return True
-        if self.stub['id'] > other.stub['id']:
-            return False
-        for attr in ('damage', 'effect', 'tagValue'):
-            if attr in self.stub:
-                if attr not in other.stub:
-                    return False
-                if self.stub[attr] < other.stub[attr]:
-                    return True
-                if self.stub[attr] > other.stub[attr]:
-                    return False
-            else:
-                if attr in other.stub:
-                    return True
-        return False
+        if isinstance(other, Item):
+            return self.key < other.key
+        try:
+            return self.key < stub_key(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self._stub)
 
     def __str__(self):
         info = self.info()
         if 'name' in info:
             return info['name']
-        if self.stub['id'].startswith('minecraft:'):
-            item_id = self.stub['id'][len('minecraft:'):]
+        if self._stub['id'].startswith('minecraft:'):
+            item_id = self._stub['id'][len('minecraft:'):]
         else:
-            item_id = self.stub['id']
-        if len(self.stub) == 1:
+            item_id = self._stub['id']
+        if len(self._stub) == 1:
             return item_id
-        if len(self.stub) == 2:
-            if 'damage' in self.stub:
-                return '{}/{}'.format(item_id, self.stub['damage'])
-            if 'effect' in self.stub:
-                if self.stub['effect'].startswith('minecraft:'):
-                    return '{} of {}'.format(item_id, self.stub['effect'][len('minecraft:'):])
+        if len(self._stub) == 2:
+            if 'damage' in self._stub:
+                return '{}/{}'.format(item_id, self._stub['damage'])
+            if 'effect' in self._stub:
+                if self._stub['effect'].startswith('minecraft:'):
+                    return '{} of {}'.format(item_id, self._stub['effect'][len('minecraft:'):])
                 else:
-                    return '{} with effect {}'.format(item_id, self.stub['effect'])
-            if 'tagValue' in self.stub:
-                if self.stub['tagValue'] is None:
+                    return '{} with effect {}'.format(item_id, self._stub['effect'])
+            if 'tagValue' in self._stub:
+                if self._stub['tagValue'] is None:
                     return '{} without tag'.format(item_id)
                 else:
-                    return '{} with tag {}'.format(item_id, self.stub['tagValue'])
-        return str(self.stub)
+                    return '{} with tag {}'.format(item_id, self._stub['tagValue'])
+        return str(self._stub)
 
     @classmethod
-    def from_slot(cls, slot, *, items_data=None):
-        if items_data is None:
-            with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-                items_data = json.load(items_file)
-        item_stub = {
-            'id': slot['id'],
-            'count': slot['Count']
-        }
-        plugin, string_id = slot['id'].split(':', 1)
-        data_type = stub_data_type(plugin, string_id, items_data=items_data)
-        if data_type is None:
-            pass
-        elif data_type == 'damage':
-            item_stub['damage'] = slot['Damage']
-        elif data_type == 'effect':
-            item_stub['effect'] = slot.get('tag', {}).get('Potion', 'minecraft:water')
-        elif data_type == 'tagValue':
-            tag_path = items_data[plugin][string_id]['tagPath']
-            try:
-                tag = slot['tag']
-                for tag_path_elt in tag_path:
-                    tag = tag[tag_path_elt]
-                item_stub['tagValue'] = tag
-            except (IndexError, KeyError):
-                item_stub['tagValue'] = None
-        else:
-            raise NotImplementedError('Unknown data type: {!r}'.format(data_type))
-        return cls(item_stub, items_data=items_data)
+    def from_slot(cls, slot):
+        return info_index().slot_resolver(cls, slot['id'])(slot)
+
+    @classmethod
+    def from_slots(cls, slots):
+        """Returns a list of items for a list of inventory slots, such as the Items list of a tile entity."""
+        index = info_index()
+        return [index.slot_resolver(cls, slot['id'])(slot) for slot in slots]
+
+    def first_mismatched_slot(self, slots):
+        """Returns the first of the given inventory slots which does not match this item (see matches_slot), or None if all slots match."""
+        return next(itertools.filterfalse(self.slot_matcher, slots), None)
 
     def image(self, link=True, tooltip=True, slot=False):
         """Generates an image of this item.
@@ -171,93 +165,50 @@ class Item:
         Returns:
         HTML code for displaying the specified image.
         """
-        return image_from_info(self.stub['id'].split(':', 1)[0], self.stub['id'].split(':', 1)[1], self.info(), block=self.is_block, link=self.link(link), tooltip=tooltip, count=self.stub.get('amount', 1) if slot else None)
+        return image_from_info(self._stub['id'].split(':', 1)[0], self._stub['id'].split(':', 1)[1], self.info(), block=self.is_block, link=self.link(link), tooltip=tooltip, count=self._stub.get('amount', 1) if slot else None)
 
     def info(self):
-        plugin_id, item_name = self.stub['id'].split(':', 1)
-        item_info = self.items_data[plugin_id][item_name].copy()
-        if self.is_block and 'blockID' not in item_info:
-            raise ValueError('There is no block with the ID {}. There is however an item with that ID.'.format(self.stub['id']))
-        if not self.is_block and 'itemID' not in item_info:
-            raise ValueError('There is no item with the ID {}. There is however a block with that ID.'.format(self.stub['id']))
-        if 'damage' in self.stub:
-            if 'effect' in self.stub:
-                raise ValueError('Tried to make an info page for {} with both damage and effect.'.format('a block' if self.is_block else 'an item'))
-            elif 'tagValue' in self.stub:
-                raise ValueError('Tried to make an info page for {} with both damage and tag.'.format('a block' if self.is_block else 'an item'))
-            elif 'damageValues' in item_info:
-                if str(self.stub['damage']) in item_info['damageValues']:
-                    item_info.update(item_info['damageValues'][str(self.stub['damage'])])
-                    del item_info['damageValues']
-                else:
-                    raise ValueError('The {} {} does not occur with the damage value {!r}.'.format('block' if self.is_block else 'item', self.stub['id'], self.stub['damage']))
-            else:
-                raise ValueError('The {} {} has no damage values.'.format('block' if self.is_block else 'item', self.stub['id']))
-        elif 'effect' in self.stub:
-            effect_plugin, effect_id = self.stub['effect'].split(':')
-            if 'tagValue' in self.stub:
-                raise ValueError('Tried to make an info page for {} with both effect and tag.'.format('a block' if self.is_block else 'an item'))
-            elif 'effects' in item_info:
-                if effect_plugin in item_info['effects'] and effect_id in item_info['effects'][effect_plugin]:
-                    item_info.update(item_info['effects'][effect_plugin][effect_id])
-                    del item_info['effects']
-                else:
-                    raise ValueError('The {} {} does not occur with the effect {!r}.'.format('block' if self.is_block else 'item', self.stub['id'], self.stub['effect']))
-            else:
-                raise ValueError('The {} {} has no effect values.'.format('block' if self.is_block else 'item', self.stub['id']))
-        elif 'tagValue' in self.stub:
-            if 'tagPath' in item_info:
-                if self.stub['tagValue'] is None:
-                    if '' in item_info['tagVariants']:
-                        item_info.update(item_info['tagVariants'][''])
-                        del item_info['tagPath']
-                        del item_info['tagVariants']
-                    else:
-                        raise ValueError('The {} {} does not occur with the empty tag variant.'.format('block' if self.is_block else 'item', self.stub['id']))
-                else:
-                    if str(self.stub['tagValue']) in item_info['tagVariants']:
-                        item_info.update(item_info['tagVariants'][str(self.stub['tagValue'])])
-                        del item_info['tagPath']
-                        del item_info['tagVariants']
-                    else:
-                        raise ValueError('The {} {} does not occur with the tag variant {!r}.'.format('block' if self.is_block else 'item', self.stub['id'], self.stub['tagValue']))
-            else:
-                raise ValueError('The {} {} has no tag variants.'.format('block' if self.is_block else 'item', self.stub['id']))
-        elif 'damageValues' in item_info:
-            raise ValueError('Must specify damage for {}'.format(self.stub['id']))
-        elif 'effects' in item_info:
-            raise ValueError('Must specify effect for {}'.format(self.stub['id']))
-        elif 'tagPath' in item_info:
-            raise ValueError('Must specify tag value for {}'.format(self.stub['id']))
-        return item_info
+        """Returns the fully resolved items.json entry for this block or item variant, as a read-only mapping.
+
+        Raises:
+        KeyError -- if the ID does not exist in items.json.
+        ValueError -- if the stub does not describe a valid variant of this block or item.
+        """
+        return info_index().info(self._stub, is_block=self.is_block)
 
     @property
     def is_block(self):
         return False
 
+    @property
+    def slot_matcher(self):
+        """A function which takes an inventory slot and returns whether it contains this item. Compiled once per items.json version."""
+        version, matcher = self._slot_matcher
+        if version != ITEMS_DATA.version:
+            matcher = info_index().slot_matcher(self)
+            object.__setattr__(self, '_slot_matcher', (ITEMS_DATA.version, matcher))
+        return matcher
+
+    @property
+    def stub(self):
+        """A copy of the item stub, as a dict."""
+        return dict(self._stub)
+
     @property
     def is_generic(self):
         """Returns True if the item stub is missing damage/effect/tag value."""
-        plugin_id, item_name = self.stub['id'].split(':', 1)
-        item_info = self.items_data[plugin_id][item_name].copy()
-        if 'damageValues' in item_info:
-            return 'damage' not in self.stub
-        elif 'effects' in item_info:
-            return 'effect' not in self.stub
-        elif 'tagPath' in item_info:
-            return 'tagValue' not in self.stub
-        else:
-            return False
+        data_type = info_index().data_types[self._stub['id']]
+        return data_type is not None and data_type not in self._stub
 
     def link(self, link=True):
         if link is True:
             # derive link from item stub
-            if 'damage' in self.stub:
-                link = self.stub['damage']
-            elif 'effect' in self.stub:
-                link = self.stub['effect']
-            elif 'tagValue' in self.stub:
-                link = {'tagValue': self.stub['tagValue']}
+            if 'damage' in self._stub:
+                link = self._stub['damage']
+            elif 'effect' in self._stub:
+                link = self._stub['effect']
+            elif 'tagValue' in self._stub:
+                link = {'tagValue': self._stub['tagValue']}
             else:
                 link = None # base item
         return link
@@ -266,37 +217,11 @@ class Item:
         link = self.link(link)
         if text is None:
             text = str(self)
-        plugin, string_id = self.stub['id'].split(':', 1)
+        plugin, string_id = self._stub['id'].split(':', 1)
         return linkify(plugin, string_id, text if raw_html else xml.sax.saxutils.escape(text), link, block=self.is_block)
 
     def matches_slot(self, slot):
-        if slot['id'] != self.stub['id']:
-            return False
-        if 'damage' in self.stub:
-            if slot['Damage'] != self.stub['damage']:
-                return False
-        if 'effect' in self.stub:
-            if slot.get('tag', {}).get('Potion', 'minecraft:water') != self.stub['effect']:
-                return False
-        if 'tagValue' in self.stub:
-            if 'tag' in slot:
-                plugin, item_id = self.stub['id'].split(':', 1)
-                tag = slot['tag']
-                for tag_path_elt in self.items_data[plugin][item_id]['tagPath']:
-                    try:
-                        tag = tag[tag_path_elt]
-                    except (KeyError, IndexError):
-                        return False
-                if self.stub['tagValue'] is None:
-                    if tag is not None:
-                        return False
-                else:
-                    if str(tag) != self.stub['tagValue']:
-                        return False
-            else:
-                if self.stub['tagValue'] is not None:
-                    return False
-        return True
+        return self.slot_matcher(slot)
 
     @property
     def max_stack_size(self):
@@ -327,16 +252,16 @@ class Item:
     def variants(self):
         """Yields all possible damage/effect/tag variants of this item."""
         def variant_item(variant_data):
-            result = {'id': self.stub['id']}
-            if 'amount' in self.stub:
-                result['amount'] = self.stub['amount']
-            if 'consumed' in self.stub:
-                result['consumed'] = self.stub['consumed']
+            result = {'id': self._stub['id']}
+            if 'amount' in self._stub:
+                result['amount'] = self._stub['amount']
+            if 'consumed' in self._stub:
+                result['consumed'] = self._stub['consumed']
             result.update(variant_data)
-            return self.__class__(result, items_data=self.items_data)
+            return self.__class__(result)
 
-        plugin_id, item_name = self.stub['id'].split(':', 1)
-        item_info = self.items_data[plugin_id][item_name].copy()
+        plugin_id, item_name = self._stub['id'].split(':', 1)
+        item_info = ITEMS_DATA()[plugin_id][item_name]
         if 'damageValues' in item_info:
             for damage_value in sorted(int(damage) for damage in item_info['damageValues']):
                 yield variant_item({'damage': damage_value})
@@ -356,14 +281,14 @@ class Item:
 
 class Block(Item):
     @classmethod
-    def from_chunk(cls, chunk_block, *, items_data=None):
+    def from_chunk(cls, chunk_block):
         """Parses block info as returned by the api.v2.api_chunk_info_<dimension> endpoints"""
         try:
             item_stub = {'id': chunk_block['id']}
         except:
-            return cls('minecraft:air', items_data=items_data)
+            return cls('minecraft:air')
         plugin, string_id = chunk_block['id'].split(':', 1)
-        data_type = stub_data_type(plugin, string_id, items_data=items_data)
+        data_type = stub_data_type(plugin, string_id)
         if data_type is None:
             pass
         elif data_type == 'damage':
@@ -374,17 +299,21 @@ class Block(Item):
             raise NotImplementedError('Parsing block info with tag variants not implemented')
         else:
             raise NotImplementedError('Unknown data type: {!r}'.format(data_type))
-        return cls(item_stub, items_data=items_data)
+        return cls(item_stub)
 
     @classmethod
     def from_slot(cls, slot):
         raise NotImplementedError('Cannot create a block from a slot')
 
+    @classmethod
+    def from_slots(cls, slots):
+        raise NotImplementedError('Cannot create a block from a slot')
+
     @property
     def is_block(self):
         return True
 
-def comparator_signal(block, other_block=None, *, items_data=None):
+def comparator_signal(block, other_block=None):
     """Calculates the redstone signal strength a comparator attached to this block would produce.
 
     Required arguments:
@@ -393,9 +322,6 @@ def comparator_signal(block, other_block=None, *, items_data=None):
     Optional arguments:
     other_block -- A dict in the same format as block, used to measure double chests and double trapped chests.
 
-    Keyword-only arguments:
-    items_data -- The JSON-decoded contents of assets.wurstmineberg.de/json/items.json — will be decoded from disk if omitted.
-
     Returns:
     An integer in range(16). 0 is no redstone signal, and 15 is the strongest possible signal.
 
@@ -404,29 +330,18 @@ def comparator_signal(block, other_block=None, *, items_data=None):
     KeyError -- if the jukebox contains an unknown music disc, or the block data is formatted incorrectly.
     NotImplementedError -- if the block is not a known container block.
     """
-    if items_data is None:
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
     if other_block is not None:
         assert block['id'] == other_block['id']
         assert other_block['id'] in ('minecraft:chest', 'minecraft:trapped_chest')
-        def fullness(slot):
-            item = Item.from_slot(slot, items_data=items_data)
-            return slot['Count'] / item.max_stack_size
-
         inventory = block['tileEntity']['Items'] + other_block['tileEntity']['Items']
         if sum(item['Count'] for item in inventory) == 0:
             return 0
-        return int(1 + 14 * sum(map(fullness, inventory)) / 54)
+        return int(1 + 14 * sum(slot['Count'] / item.max_stack_size for slot, item in zip(inventory, Item.from_slots(inventory))) / 54)
     elif block['id'] in NUM_SLOTS:
-        def fullness(slot):
-            item = Item.from_slot(slot, items_data=items_data)
-            return slot['Count'] / item.max_stack_size
-
         inventory = block['tileEntity']['Items']
         if sum(item['Count'] for item in inventory) == 0:
             return 0
-        return int(1 + 14 * sum(map(fullness, inventory)) / NUM_SLOTS[block['id']])
+        return int(1 + 14 * sum(slot['Count'] / item.max_stack_size for slot, item in zip(inventory, Item.from_slots(inventory))) / NUM_SLOTS[block['id']])
     elif block['id'] == 'minecraft:cake':
         return 14 - 2 * block['damage']
     elif block['id'] == 'minecraft:cauldron':
@@ -456,17 +371,262 @@ def comparator_signal(block, other_block=None, *, items_data=None):
     else:
         raise NotImplementedError('Comparator signal for {} NYI'.format(block['id'])) #TODO detector rail, item frame
 
-def stub_data_type(plugin, string_id, *, items_data=None):
-    if items_data is None:
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
-    item_info = items_data[plugin][string_id]
-    if 'damageValues' in item_info:
-        return 'damage'
-    if 'effects' in item_info:
-        return 'effect'
-    if 'tagPath' in item_info:
-        return 'tagValue'
+def stub_key(item_stub):
+    """Returns the variant key of an item stub, used for hashing, equality, and ordering.
+
+    The stub can be an Item, a string ID, or a raw stub dict such as a cloud.json entry; extra fields are ignored and no Item is constructed. The key is a tuple of the ID followed by one tuple each for damage, effect, and tag value, which is empty if the stub doesn't specify that field. This way stubs without a field sort before stubs with it.
+
+    Raises:
+    TypeError -- if item_stub is not a valid stub type.
+    ValueError -- if item_stub is a dict without an ID.
+    """
+    if isinstance(item_stub, Item):
+        return item_stub.key
+    if isinstance(item_stub, str):
+        return item_stub, (), (), ()
+    if not isinstance(item_stub, dict):
+        raise TypeError('Cannot create an item from {}'.format(type(item_stub)))
+    if 'id' not in item_stub:
+        raise ValueError('Missing item ID')
+    if 'tagValue' not in item_stub:
+        tag_key = ()
+    elif item_stub['tagValue'] is None:
+        tag_key = (False, '')
+    else:
+        tag_key = (True, str(item_stub['tagValue']))
+    return (
+        item_stub['id'],
+        (item_stub['damage'],) if 'damage' in item_stub else (),
+        (item_stub['effect'],) if 'effect' in item_stub else (),
+        tag_key
+    )
+
+def stub_data_type(plugin, string_id):
+    return info_index().data_types['{}:{}'.format(plugin, string_id)]
+
+class InfoIndex:
+    """Fully resolved info for every block and item variant in one version of items.json.
+
+    Positive entries are built up front. Stubs which do not describe a valid variant are resolved the slow way on first lookup, and the resulting error is cached as a negative entry.
+    """
+
+    def __init__(self, items_data):
+        self.items_data = items_data
+        self.data_types = {} # maps item IDs to the stub key used to distinguish their variants, or None
+        self.infos = {} # maps (is_block, item ID, data type, variant key) to read-only info mappings
+        self.errors = {} # maps (is_block, raw stub key) to the exception raised by an invalid stub
+        self.slot_matchers = {} # maps items to compiled slot matchers
+        self.slot_resolvers = {} # maps (class, item ID) to compiled functions from inventory slots to items
+        self.tag_paths = {} # maps IDs of items with tag variants to their tag paths as tuples
+        for plugin_name, plugin in items_data.items():
+            for string_id, item_info in plugin.items():
+                item_id = '{}:{}'.format(plugin_name, string_id)
+                if 'damageValues' in item_info:
+                    self.data_types[item_id] = 'damage'
+                elif 'effects' in item_info:
+                    self.data_types[item_id] = 'effect'
+                elif 'tagPath' in item_info:
+                    self.data_types[item_id] = 'tagValue'
+                    self.tag_paths[item_id] = tuple(item_info['tagPath'])
+                else:
+                    self.data_types[item_id] = None
+                for is_block in (False, True):
+                    if ('blockID' if is_block else 'itemID') not in item_info:
+                        continue
+                    if self.data_types[item_id] is None:
+                        self.infos[is_block, item_id, None, None] = types.MappingProxyType(item_info.copy())
+                    for damage, variant_info in item_info.get('damageValues', {}).items():
+                        self.infos[is_block, item_id, 'damage', damage] = _resolved_info(item_info, variant_info, 'damageValues')
+                    for effect_plugin, effects in item_info.get('effects', {}).items():
+                        for effect_id, variant_info in effects.items():
+                            self.infos[is_block, item_id, 'effect', '{}:{}'.format(effect_plugin, effect_id)] = _resolved_info(item_info, variant_info, 'effects')
+                    if 'tagPath' in item_info:
+                        for tag_value, variant_info in item_info['tagVariants'].items():
+                            self.infos[is_block, item_id, 'tagValue', tag_value] = _resolved_info(item_info, variant_info, 'tagPath', 'tagVariants')
+
+    def info(self, item_stub, *, is_block=False):
+        """Looks up the resolved info for an item stub (a dict as stored in Item.stub). See Item.info."""
+        if 'damage' in item_stub:
+            key = 'damage', str(item_stub['damage'])
+            if 'effect' in item_stub or 'tagValue' in item_stub:
+                key = None
+        elif 'effect' in item_stub:
+            key = 'effect', item_stub['effect']
+            if 'tagValue' in item_stub:
+                key = None
+        elif 'tagValue' in item_stub:
+            key = 'tagValue', '' if item_stub['tagValue'] is None else str(item_stub['tagValue'])
+        else:
+            key = None, None
+        if key is not None:
+            result = self.infos.get((is_block, item_stub['id']) + key)
+            if result is not None:
+                return result
+        error_key = is_block, tuple((attr, item_stub[attr]) for attr in ('id', 'damage', 'effect', 'tagValue') if attr in item_stub)
+        error = self.errors.get(error_key)
+        if error is None:
+            try:
+                return types.MappingProxyType(_resolve_info_uncached(self.items_data, item_stub, is_block=is_block))
+            except (KeyError, ValueError) as e:
+                error = self.errors[error_key] = e
+        raise error.__class__(*error.args)
+
+    def slot_matcher(self, item):
+        """Returns the compiled slot matcher for an item. See Item.slot_matcher."""
+        try:
+            return self.slot_matchers[item]
+        except KeyError:
+            pass
+        item_stub = item._stub
+        item_id = item_stub['id']
+        variant_attrs = [attr for attr in ('damage', 'effect', 'tagValue') if attr in item_stub]
+        if len(variant_attrs) == 0:
+            matcher = lambda slot: slot['id'] == item_id
+        elif variant_attrs == ['damage']:
+            damage = item_stub['damage']
+            matcher = lambda slot: slot['id'] == item_id and slot['Damage'] == damage
+        elif variant_attrs == ['effect']:
+            effect = item_stub['effect']
+            matcher = lambda slot: slot['id'] == item_id and slot.get('tag', {}).get('Potion', 'minecraft:water') == effect
+        elif variant_attrs == ['tagValue']:
+            check_tag = _compile_tag_check(self.tag_paths[item_id], item_stub['tagValue'])
+            matcher = lambda slot: slot['id'] == item_id and check_tag(slot)
+        else:
+            # invalid stub with multiple variant fields, check all of them
+            matchers = [self.slot_matcher(Item({'id': item_id, attr: item_stub[attr]})) for attr in variant_attrs]
+            matcher = lambda slot: all(attr_matcher(slot) for attr_matcher in matchers)
+        self.slot_matchers[item] = matcher
+        return matcher
+
+    def slot_resolver(self, cls, item_id):
+        """Returns a compiled function which takes an inventory slot containing the item with the given ID and returns the corresponding instance of cls. See Item.from_slot."""
+        try:
+            return self.slot_resolvers[cls, item_id]
+        except KeyError:
+            pass
+        data_type = self.data_types[item_id]
+        variants = {} # resolved items by variant, to skip the stub normalization for repeated slots
+        if data_type is None:
+            item = cls(item_id)
+            resolver = lambda slot: item
+        elif data_type == 'damage':
+            def resolver(slot):
+                damage = slot['Damage']
+                try:
+                    return variants[damage]
+                except KeyError:
+                    return variants.setdefault(damage, cls({'id': item_id, 'damage': damage}))
+        elif data_type == 'effect':
+            def resolver(slot):
+                effect = slot.get('tag', {}).get('Potion', 'minecraft:water')
+                try:
+                    return variants[effect]
+                except KeyError:
+                    return variants.setdefault(effect, cls({'id': item_id, 'effect': effect}))
+        elif data_type == 'tagValue':
+            tag_path = self.tag_paths[item_id]
+
+            def resolver(slot):
+                try:
+                    tag = slot['tag']
+                    for tag_path_elt in tag_path:
+                        tag = tag[tag_path_elt]
+                except (IndexError, KeyError):
+                    tag_value = None
+                else:
+                    tag_value = None if tag is None else str(tag)
+                try:
+                    return variants[tag_value]
+                except KeyError:
+                    return variants.setdefault(tag_value, cls({'id': item_id, 'tagValue': tag_value}))
+        else:
+            raise NotImplementedError('Unknown data type: {!r}'.format(data_type))
+        self.slot_resolvers[cls, item_id] = resolver
+        return resolver
+
+info_index = ITEMS_DATA.derive(InfoIndex)
+
+def _compile_tag_check(tag_path, tag_value):
+    def check(slot):
+        try:
+            tag = slot['tag']
+        except KeyError:
+            return tag_value is None
+        try:
+            for tag_path_elt in tag_path:
+                tag = tag[tag_path_elt]
+        except (KeyError, IndexError):
+            return False
+        if tag_value is None:
+            return tag is None
+        return str(tag) == tag_value
+
+    return check
+
+def _resolved_info(item_info, variant_info, *variant_keys):
+    result = item_info.copy()
+    result.update(variant_info)
+    for variant_key in variant_keys:
+        del result[variant_key]
+    return types.MappingProxyType(result)
+
+def _resolve_info_uncached(items_data, item_stub, *, is_block=False):
+    plugin_id, item_name = item_stub['id'].split(':', 1)
+    item_info = items_data[plugin_id][item_name].copy()
+    if is_block and 'blockID' not in item_info:
+        raise ValueError('There is no block with the ID {}. There is however an item with that ID.'.format(item_stub['id']))
+    if not is_block and 'itemID' not in item_info:
+        raise ValueError('There is no item with the ID {}. There is however a block with that ID.'.format(item_stub['id']))
+    if 'damage' in item_stub:
+        if 'effect' in item_stub:
+            raise ValueError('Tried to make an info page for {} with both damage and effect.'.format('a block' if is_block else 'an item'))
+        elif 'tagValue' in item_stub:
+            raise ValueError('Tried to make an info page for {} with both damage and tag.'.format('a block' if is_block else 'an item'))
+        elif 'damageValues' in item_info:
+            if str(item_stub['damage']) in item_info['damageValues']:
+                item_info.update(item_info['damageValues'][str(item_stub['damage'])])
+                del item_info['damageValues']
+            else:
+                raise ValueError('The {} {} does not occur with the damage value {!r}.'.format('block' if is_block else 'item', item_stub['id'], item_stub['damage']))
+        else:
+            raise ValueError('The {} {} has no damage values.'.format('block' if is_block else 'item', item_stub['id']))
+    elif 'effect' in item_stub:
+        effect_plugin, effect_id = item_stub['effect'].split(':')
+        if 'tagValue' in item_stub:
+            raise ValueError('Tried to make an info page for {} with both effect and tag.'.format('a block' if is_block else 'an item'))
+        elif 'effects' in item_info:
+            if effect_plugin in item_info['effects'] and effect_id in item_info['effects'][effect_plugin]:
+                item_info.update(item_info['effects'][effect_plugin][effect_id])
+                del item_info['effects']
+            else:
+                raise ValueError('The {} {} does not occur with the effect {!r}.'.format('block' if is_block else 'item', item_stub['id'], item_stub['effect']))
+        else:
+            raise ValueError('The {} {} has no effect values.'.format('block' if is_block else 'item', item_stub['id']))
+    elif 'tagValue' in item_stub:
+        if 'tagPath' in item_info:
+            if item_stub['tagValue'] is None:
+                if '' in item_info['tagVariants']:
+                    item_info.update(item_info['tagVariants'][''])
+                    del item_info['tagPath']
+                    del item_info['tagVariants']
+                else:
+                    raise ValueError('The {} {} does not occur with the empty tag variant.'.format('block' if is_block else 'item', item_stub['id']))
+            else:
+                if str(item_stub['tagValue']) in item_info['tagVariants']:
+                    item_info.update(item_info['tagVariants'][str(item_stub['tagValue'])])
+                    del item_info['tagPath']
+                    del item_info['tagVariants']
+                else:
+                    raise ValueError('The {} {} does not occur with the tag variant {!r}.'.format('block' if is_block else 'item', item_stub['id'], item_stub['tagValue']))
+        else:
+            raise ValueError('The {} {} has no tag variants.'.format('block' if is_block else 'item', item_stub['id']))
+    elif 'damageValues' in item_info:
+        raise ValueError('Must specify damage for {}'.format(item_stub['id']))
+    elif 'effects' in item_info:
+        raise ValueError('Must specify effect for {}'.format(item_stub['id']))
+    elif 'tagPath' in item_info:
+        raise ValueError('Must specify tag value for {}'.format(item_stub['id']))
+    return item_info
 
 def linkify(plugin, string_id, html, link, *, block=False):
     if link is False:
@@ -529,26 +689,56 @@ def image_from_info(plugin, string_id, item_info, *, classes=None, tint=None, st
         ret = '<span class="use-tooltip" title="{}">{}</span>'.format(item_info['name'], ret)
     return linkify(plugin, string_id, ret, link, block=block)
 
-def all(items_data=None):
+def all():
     """Yields (Block, Item) tuples for each distinct type of block and item. Yields (NoneType, Item) for non-block items, and (Block, NoneType) for non-item blocks."""
-    if items_data is None:
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
+    items_data = ITEMS_DATA()
     for plugin_name, plugin in items_data.items():
         for item_id, item_info in plugin.items():
             if 'damageValues' in item_info:
                 for damage_str in item_info['damageValues']:
                     stub = {'id': '{}:{}'.format(plugin_name, item_id), 'damage': int(damage_str)}
-                    yield (Block(stub, items_data=items_data) if 'blockID' in item_info else None, Item(stub, items_data=items_data) if 'itemID' in item_info else None)
+                    yield (Block(stub) if 'blockID' in item_info else None, Item(stub) if 'itemID' in item_info else None)
             elif 'effects' in item_info:
                 for effect_plugin_name, effect_plugin in item_info['effects'].items():
                     for effect_id in effect_plugin:
                         stub = {'id': '{}:{}'.format(plugin_name, item_id), 'effect': '{}:{}'.format(effect_plugin_name, effect_id)}
-                        yield (Block(stub, items_data=items_data) if 'blockID' in item_info else None, Item(stub, items_data=items_data) if 'itemID' in item_info else None)
+                        yield (Block(stub) if 'blockID' in item_info else None, Item(stub) if 'itemID' in item_info else None)
             elif 'tagPath' in item_info:
                 for tag_value in item_info['tagVariants']:
                     stub = {'id': '{}:{}'.format(plugin_name, item_id), 'tagValue': tag_value}
-                    yield (Block(stub, items_data=items_data) if 'blockID' in item_info else None, Item(stub, items_data=items_data) if 'itemID' in item_info else None)
+                    yield (Block(stub) if 'blockID' in item_info else None, Item(stub) if 'itemID' in item_info else None)
             else:
                 stub = {'id': '{}:{}'.format(plugin_name, item_id)}
-                yield (Block(stub, items_data=items_data) if 'blockID' in item_info else None, Item(stub, items_data=items_data) if 'itemID' in item_info else None)
+                yield (Block(stub) if 'blockID' in item_info else None, Item(stub) if 'itemID' in item_info else None)
+
+if __name__ == '__main__':
+    import time
+
+    # benchmark the compiled slot matchers and resolvers with one slot for every item variant in items.json
+    slots = []
+    for _, item in all():
+        if item is None:
+            continue
+        item_stub = item.stub
+        slot = {'id': item_stub['id'], 'Count': 1, 'Damage': item_stub.get('damage', 0)}
+        if 'effect' in item_stub:
+            slot['tag'] = {'Potion': item_stub['effect']}
+        elif item_stub.get('tagValue'):
+            tag = slot['tag'] = {}
+            *tag_path, last_elt = info_index().tag_paths[item_stub['id']]
+            for tag_path_elt in tag_path:
+                tag = tag.setdefault(tag_path_elt, {})
+            tag[last_elt] = int(item_stub['tagValue']) if alltheitems.util.is_int_str(item_stub['tagValue']) else item_stub['tagValue']
+        slots.append((item, slot))
+    matchers = [(item.slot_matcher, slot) for item, slot in slots]
+    for name, f in [
+        ('matches_slot', lambda: [item.matches_slot(slot) for item, slot in slots]),
+        ('slot_matcher', lambda: [matcher(slot) for matcher, slot in matchers]),
+        ('first_mismatched_slot', lambda: [item.first_mismatched_slot([slot]) for item, slot in slots]),
+        ('from_slot', lambda: [Item.from_slot(slot) for _, slot in slots]),
+        ('from_slots', lambda: Item.from_slots(slot for _, slot in slots))
+    ]:
+        start = time.perf_counter()
+        for _ in range(100):
+            f()
+        print('{}: {:.0f} slots/s'.format(name, 100 * len(slots) / (time.perf_counter() - start)))
@@ -145,7 +145,7 @@ def item_page(item_stub, block=False):
                 </div>
             """, host=ati.host) #TODO
         else:
-            coords, corridor_length, item_name, pre_sorter = alltheitems.cloud.chest_coords(item_stub, include_meta=True)
+            coords = alltheitems.cloud.chest_coords(item_stub)
             color_map = {
                 'cyan': 'class="text-info"',
                 'gray': 'class="muted"',
@@ -161,16 +161,21 @@ def item_page(item_stub, block=False):
                         <p>{{item_info['name']}} is not available in the <a href="/cloud">Cloud</a>.</p>
                     %else:
                         <p>The <a href="/cloud">Cloud</a> chest for {{item_info['name']}} is located on the {{coords[1]}}{{ordinal(coords[1])}} floor, in the {{'central' if coords[0] == 0 else '{}{}'.format(abs(coords[0]), ordinal(abs(coords[0])))}} corridor{{' to the left' if coords[0] > 0 else ' to the right' if coords[0] < 0 else ''}}. It is the {{coords[2] // 2 + 1}}{{ordinal(coords[2] // 2 + 1)}} chest on the {{'left' if coords[2] % 2 == 0 else 'right'}} wall.</p>
-                        %color, state_message, fill_level = chest_state()
-                        <p {{!color_map[color]}}>{{!state_message}}</p>
-                        %if fill_level is not None:
-                            <p {{!color_map[color]}}>{{fill_level}}</p>
+                        %state = chest_state()
+                        %if state is None:
+                            <p class="muted">This chest hasn't been checked since the server was restarted. Reload the page in a few minutes.</p>
+                        %else:
+                            %color, state_message, fill_level, _ = state
+                            <p {{!color_map[color]}}>{{!state_message}}</p>
+                            %if fill_level is not None:
+                                <p {{!color_map[color]}}>{{fill_level}}</p>
+                            %end
                         %end
                     %end
                     <h2>Latency-induced Atomic Genesis</h2>
                     <p><a href="//wiki.{{host}}/Latency-induced_Atomic_Genesis">LAG</a> legality info coming <a href="//wiki.{{host}}/Soon™">soon™</a>.</p>
                 </div>
-            """, host=ati.host, ordinal=alltheitems.util.ordinal, item_info=item_info, coords=coords, chest_state=lambda: alltheitems.cloud.chest_state(coords, item_stub, corridor_length, item_name, pre_sorter), color_map=color_map) #TODO LAG info
+            """, host=ati.host, ordinal=alltheitems.util.ordinal, item_info=item_info, coords=coords, chest_state=lambda: alltheitems.cloud.REFRESHER.snapshot.states.get(coords), color_map=color_map) #TODO LAG info
         # obtaining
         yield bottle.template("""
             %import json
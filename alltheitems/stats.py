@@ -7,13 +7,171 @@ sys.path.append('/opt/py')
 import alltheitems.__main__ as ati
 
 import bottle
+import collections
 import datetime
 import json
+import numpy
+import os
+import sqlite3
+import threading
 
 import alltheitems.item
 import alltheitems.util
 
-def index():
+COUNT_COLUMNS = ('blocks', 'inventories', 'containers', 'dropped', 'other') # the count columns of item-counts.json and of the count store, in display order
+
+class CountStore:
+    """Stores the history of item-counts.json in an SQLite database, one snapshot per run of the stats generator.
+
+    Item stubs are stored once in the items table, as JSON. The counts table has one row per item per snapshot, with one integer column per name from COUNT_COLUMNS; items which are not counted at all are left out, and read as zeroes. Rows are keyed by (snapshot, item), so reading or comparing snapshots only reads the rows of those snapshots. Like alltheitems.cloud.ChestStore, the database is in write-ahead logging mode, and nothing is stored if its parent directory doesn't exist.
+
+    To keep the history compact, a run whose counts are the same as the latest snapshot's only updates that snapshot's confirmed timestamp, and older snapshots are thinned out according to RETENTION whenever a snapshot is added.
+
+    Snapshots are (snapshot_id, timestamp, confirmed) tuples, where timestamp is the time the counts were first seen and confirmed is the time they were last seen, both naive datetimes in UTC.
+    """
+
+    TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    RETENTION = ( # (age, bucket length) pairs: snapshots older than age are thinned out to the first snapshot in each bucket, given as the length of the timestamp prefix identifying it
+        (datetime.timedelta(days=1), len('YYYY-MM-DD HH')), # hourly
+        (datetime.timedelta(days=7), len('YYYY-MM-DD')) # daily
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        if not self.path.parent.exists():
+            return None
+        connection = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, confirmed TEXT)')
+            if 'confirmed' not in {column_info[1] for column_info in connection.execute('PRAGMA table_info(snapshots)')}:
+                connection.execute('ALTER TABLE snapshots ADD COLUMN confirmed TEXT')
+            connection.execute('CREATE INDEX IF NOT EXISTS snapshots_timestamp ON snapshots (timestamp)')
+            connection.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, stub TEXT NOT NULL UNIQUE)')
+            connection.execute('CREATE TABLE IF NOT EXISTS counts (snapshot INTEGER NOT NULL, item INTEGER NOT NULL, {}, PRIMARY KEY (snapshot, item)) WITHOUT ROWID'.format(', '.join('{} INTEGER NOT NULL'.format(column_name) for column_name in COUNT_COLUMNS)))
+            self._migrate(connection)
+        self._local.connection = connection
+        self._local.pid = os.getpid() # connections must not be shared with forked processes
+        return connection
+
+    def _migrate(self, connection):
+        """Imports item-counts.json as the first snapshot if the store is empty, so the stats page has something to show before the next run of the stats generator."""
+        counts_path = self.path.parent / 'item-counts.json'
+        if not counts_path.exists() or connection.execute('SELECT 1 FROM snapshots LIMIT 1').fetchone() is not None:
+            return
+        try:
+            with counts_path.open() as counts_f:
+                entries = json.load(counts_f)
+        except ValueError:
+            return # counts JSON is corrupted, wait for the next run
+        self._insert_snapshot(connection, entries, datetime.datetime.utcfromtimestamp(counts_path.stat().st_mtime))
+
+    def _insert_snapshot(self, connection, entries, timestamp):
+        """Inserts a snapshot unless its counts are the same as the latest snapshot's, in which case only that one's confirmed timestamp is updated. Returns the ID of the inserted or confirmed snapshot."""
+        rows = set()
+        for entry in entries:
+            stub = json.dumps(entry['itemStub'], sort_keys=True)
+            connection.execute('INSERT OR IGNORE INTO items (stub) VALUES (?)', (stub,))
+            counts = tuple(entry[column_name] for column_name in COUNT_COLUMNS)
+            if any(counts):
+                rows.add((stub,) + counts)
+        latest = connection.execute('SELECT id FROM snapshots ORDER BY id DESC LIMIT 1').fetchone()
+        if latest is not None and set(connection.execute('SELECT items.stub, {} FROM counts JOIN items ON items.id = counts.item WHERE counts.snapshot = ?'.format(', '.join('counts.{}'.format(column_name) for column_name in COUNT_COLUMNS)), latest)) == rows:
+            connection.execute('UPDATE snapshots SET confirmed = ? WHERE id = ?', (timestamp.strftime(self.TIMESTAMP_FORMAT), latest[0]))
+            return latest[0]
+        snapshot_id = connection.execute('INSERT INTO snapshots (timestamp, confirmed) VALUES (?, ?)', (timestamp.strftime(self.TIMESTAMP_FORMAT), timestamp.strftime(self.TIMESTAMP_FORMAT))).lastrowid
+        connection.executemany('INSERT INTO counts (snapshot, item, {}) VALUES (?, (SELECT id FROM items WHERE stub = ?), {})'.format(', '.join(COUNT_COLUMNS), ', '.join('?' for _ in COUNT_COLUMNS)), ((snapshot_id,) + row for row in rows))
+        return snapshot_id
+
+    def _thin_out(self, connection, now):
+        """Deletes the snapshots which are not kept according to RETENTION. The latest snapshot is always kept."""
+        latest = connection.execute('SELECT id FROM snapshots ORDER BY id DESC LIMIT 1').fetchone()
+        for i, (age, bucket_length) in enumerate(self.RETENTION):
+            end = (now - age).strftime(self.TIMESTAMP_FORMAT)
+            start = (now - self.RETENTION[i + 1][0]).strftime(self.TIMESTAMP_FORMAT) if i + 1 < len(self.RETENTION) else ''
+            doomed = [snapshot_id for snapshot_id, in connection.execute('SELECT id FROM snapshots WHERE timestamp >= ? AND timestamp < ? AND id != ? AND id NOT IN (SELECT min(id) FROM snapshots WHERE timestamp >= ? AND timestamp < ? GROUP BY substr(timestamp, 1, ?))', (start, end, latest[0], start, end, bucket_length))]
+            for snapshot_id in doomed:
+                connection.execute('DELETE FROM counts WHERE snapshot = ?', (snapshot_id,))
+                connection.execute('DELETE FROM snapshots WHERE id = ?', (snapshot_id,))
+
+    def add_snapshot(self, entries, timestamp=None):
+        """Stores a new snapshot in a single transaction and returns its ID, or None if nothing is stored. entries is a list of dicts in the format of item-counts.json. If the counts are the same as in the latest snapshot, that snapshot is confirmed and its ID is returned instead."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        if timestamp is None:
+            timestamp = datetime.datetime.utcnow()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            snapshot_id = self._insert_snapshot(connection, entries, timestamp)
+            self._thin_out(connection, timestamp)
+        return snapshot_id
+
+    def _snapshot(self, row):
+        if row is None:
+            return None
+        snapshot_id, timestamp, confirmed = row
+        timestamp = datetime.datetime.strptime(timestamp, self.TIMESTAMP_FORMAT)
+        return snapshot_id, timestamp, timestamp if confirmed is None else datetime.datetime.strptime(confirmed, self.TIMESTAMP_FORMAT)
+
+    def snapshot(self, snapshot_id=None):
+        """Returns the snapshot with the given ID, or the latest snapshot if snapshot_id is None. Returns None if there is no such snapshot."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        if snapshot_id is None:
+            return self._snapshot(connection.execute('SELECT id, timestamp, confirmed FROM snapshots ORDER BY id DESC LIMIT 1').fetchone())
+        return self._snapshot(connection.execute('SELECT id, timestamp, confirmed FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone())
+
+    def snapshot_before(self, timestamp):
+        """Returns the latest snapshot taken at or before the given naive UTC datetime, or None."""
+        connection = self._connection()
+        if connection is None:
+            return None
+        return self._snapshot(connection.execute('SELECT id, timestamp, confirmed FROM snapshots WHERE timestamp <= ? ORDER BY timestamp DESC, id DESC LIMIT 1', (timestamp.strftime(self.TIMESTAMP_FORMAT),)).fetchone())
+
+    def changes(self, snapshot_id, since_id):
+        """Yields (item_stub, counts, changes) tuples for all items ever stored, where counts is a tuple with the item's counts in the snapshot with ID snapshot_id and changes is a tuple with the differences to the snapshot with ID since_id, both in the order of COUNT_COLUMNS. If since_id is None, all changes are zero."""
+        connection = self._connection()
+        if connection is None:
+            return
+        query = 'SELECT items.stub, {}, {} FROM items LEFT JOIN counts AS new ON new.snapshot = ? AND new.item = items.id LEFT JOIN counts AS old ON old.snapshot = ? AND old.item = items.id'.format(
+            ', '.join('coalesce(new.{}, 0)'.format(column_name) for column_name in COUNT_COLUMNS),
+            ', '.join('coalesce(new.{0}, 0) - coalesce(old.{0}, 0)'.format(column_name) for column_name in COUNT_COLUMNS)
+        )
+        num_columns = len(COUNT_COLUMNS)
+        for row in connection.execute(query, (snapshot_id, snapshot_id if since_id is None else since_id)):
+            yield json.loads(row[0]), row[1:num_columns + 1], row[num_columns + 1:]
+
+COUNT_STORE = CountStore(ati.cache_root / 'item-counts.sqlite3')
+
+def format_change(number):
+    """Formats a difference between two counts with an explicit sign."""
+    if number == 0:
+        return '\u00b10'
+    return ('+' if number > 0 else '\u2212') + alltheitems.util.format_num(abs(number))
+
+def index(since=None):
+    """The stats page. If since is given, it is the ID of an earlier snapshot as a string, and the change of each count since that snapshot is shown as well."""
+    snapshot = COUNT_STORE.snapshot()
+    if since is None or snapshot is None:
+        since_snapshot = None
+    else:
+        try:
+            since_snapshot = COUNT_STORE.snapshot(int(since))
+        except ValueError:
+            bottle.abort(400, 'The since parameter must be a snapshot number.')
+        if since_snapshot is None:
+            bottle.abort(404, 'There is no item count snapshot with the number {}.'.format(since))
     yield ati.header(title='Item stats')
     def body():
         yield """<style type="text/css">
@@ -32,10 +190,26 @@ def index():
                 text-align: right;
             }
         </style>"""
+        if snapshot is None:
+            yield '<p>Block and item counts on the main world have not been recorded yet.</p>'
+            return
+        snapshot_id, timestamp, confirmed = snapshot
+        yield '<p>Block and item counts on the main world as of {:%Y-%m-%d %H:%M:%S} UTC'.format(confirmed)
+        if since_snapshot is None:
+            yield ':</p>'
+        else:
+            yield ', with the changes since {:%Y-%m-%d %H:%M:%S} UTC:</p>'.format(since_snapshot[1])
+        since_links = []
+        for link_text, since_timestamp in (('the previous count', timestamp - datetime.timedelta(seconds=1)), ('a day ago', timestamp - datetime.timedelta(days=1)), ('a week ago', timestamp - datetime.timedelta(days=7)), ('30 days ago', timestamp - datetime.timedelta(days=30))):
+            link_snapshot = COUNT_STORE.snapshot_before(since_timestamp)
+            if link_snapshot is not None and link_snapshot[0] != snapshot_id:
+                since_links.append('<a href="/stats?since={}">{}</a>'.format(link_snapshot[0], link_text))
+        if len(since_links) > 0:
+            yield '<p>Show changes since {}{}.</p>'.format(', '.join(since_links), '' if since_snapshot is None else ', or <a href="/stats">hide changes</a>')
 
-        def sort_key(pair):
-            (block, item), counts = pair
-            return -sum(counts), block if item is None else item
+        def sort_key(row):
+            (block, item), counts, changes = row
+            return -abs(sum(changes)), -sum(counts), (block if item is None else item).key
 
         yield """<table class="stats-table table table-responsive">
             <thead>
@@ -51,93 +225,322 @@ def index():
                 </tr>
             </thead>
             <tbody>"""
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
-        cache_path = ati.cache_root / 'item-counts.json'
-        yield '<p>Block and item counts on the main world as of {:%Y-%m-%d %H:%M:%S} UTC:</p>'.format(datetime.datetime.utcfromtimestamp(cache_path.stat().st_mtime))
-        with cache_path.open() as cache_f:
-            cache = json.load(cache_f)
-        counts = {}
-        for entry in cache:
+        rows = []
+        for stub, counts, changes in COUNT_STORE.changes(snapshot_id, None if since_snapshot is None else since_snapshot[0]):
             try:
-                item = alltheitems.item.Item(entry['itemStub'], items_data=items_data)
+                item = alltheitems.item.Item(stub)
                 item.info()
-            except ValueError:
+            except (KeyError, ValueError):
                 item = None
             try:
-                block = alltheitems.item.Block(entry['itemStub'], items_data=items_data)
+                block = alltheitems.item.Block(stub)
                 block.info()
-            except ValueError:
+            except (KeyError, ValueError):
                 block = None
-            key = (block, item)
-            counts[key] = (entry['blocks'], entry['inventories'], entry['containers'], entry['dropped'], entry['other'])
-        for (block, item), (blocks, inventories, containers, dropped, other) in sorted(counts.items(), key=sort_key):
+            if block is None and item is None:
+                continue # removed from items.json since it was counted
+            rows.append(((block, item), counts + (sum(counts),), changes + (sum(changes),)))
+        for (block, item), counts, changes in sorted(rows, key=sort_key):
             yield bottle.template("""
                 <tr>
                     <td class="item-image">{{!item.image()}}</td>
                     <td class="item-name">{{!item.link_text()}}</td>
-                    <td class="count{{' muted' if blocks == 0 else ''}}">{{format_num(blocks)}}</td>
-                    <td class="count{{' muted' if inventories == 0 else ''}}">{{format_num(inventories)}}</td>
-                    <td class="count{{' muted' if containers == 0 else ''}}">{{format_num(containers)}}</td>
-                    <td class="count{{' muted' if dropped == 0 else ''}}">{{format_num(dropped)}}</td>
-                    <td class="count{{' muted' if other == 0 else ''}}">{{format_num(other)}}</td>
-                    <td class="count{{' muted' if total == 0 else ''}}">{{format_num(total)}}</td>
+                    % for count, change in zip(counts, changes):
+                        <td class="count{{' muted' if count == 0 and change == 0 else ''}}">{{format_num(count)}}
+                        % if show_changes:
+                            <br /><small class="{{'text-success' if change > 0 else 'text-danger' if change < 0 else 'muted'}}">{{format_change(change)}}</small>
+                        % end
+                        </td>
+                    % end
                 </tr>
-            """, format_num=alltheitems.util.format_num, item=block if item is None else item, blocks=blocks, inventories=inventories, containers=containers, dropped=dropped, other=other, total=blocks + inventories + containers + dropped + other)
+            """, format_num=alltheitems.util.format_num, format_change=format_change, item=block if item is None else item, counts=counts, changes=changes, show_changes=since_snapshot is not None)
         yield '</tbody></table>'
     yield from ati.html_exceptions(body())
     yield ati.footer()
 
+def region_shards(chunk_overview):
+    """Groups the chunk columns from api.v2.api_chunk_overview by region file. Returns a list of (dimension, columns) tuples."""
+    shards = collections.OrderedDict()
+    for dimension, columns in chunk_overview.items():
+        for column in columns:
+            shards.setdefault((dimension, column['x'] >> 5, column['z'] >> 5), []).append(column)
+    return [(dimension, columns) for (dimension, _, _), columns in shards.items()]
+
+ITEM_COLUMNS = ('containers', 'dropped', 'other') # the columns of item-counts.json which are counted from tile entities and entities
+
+ENTITY_ITEMS = { # maps entity IDs, both in the pre-1.11 and the namespaced form, to the items they're made from, for the other column
+    'ArmorStand': 'minecraft:armor_stand',
+    'minecraft:armor_stand': 'minecraft:armor_stand',
+    'Boat': 'minecraft:boat',
+    'minecraft:boat': 'minecraft:boat',
+    'EnderCrystal': 'minecraft:end_crystal',
+    'minecraft:ender_crystal': 'minecraft:end_crystal',
+    'ItemFrame': 'minecraft:item_frame',
+    'minecraft:item_frame': 'minecraft:item_frame',
+    'LeashKnot': 'minecraft:lead',
+    'minecraft:leash_knot': 'minecraft:lead',
+    'MinecartChest': 'minecraft:chest_minecart',
+    'minecraft:chest_minecart': 'minecraft:chest_minecart',
+    'MinecartCommandBlock': 'minecraft:command_block_minecart',
+    'minecraft:commandblock_minecart': 'minecraft:command_block_minecart',
+    'MinecartFurnace': 'minecraft:furnace_minecart',
+    'minecraft:furnace_minecart': 'minecraft:furnace_minecart',
+    'MinecartHopper': 'minecraft:hopper_minecart',
+    'minecraft:hopper_minecart': 'minecraft:hopper_minecart',
+    'MinecartRideable': 'minecraft:minecart',
+    'minecraft:minecart': 'minecraft:minecart',
+    'MinecartTNT': 'minecraft:tnt_minecart',
+    'minecraft:tnt_minecart': 'minecraft:tnt_minecart',
+    'Painting': 'minecraft:painting',
+    'minecraft:painting': 'minecraft:painting'
+}
+
+BOAT_ITEMS = { # boat items by the Type tag of boat entities
+    'oak': 'minecraft:boat',
+    'spruce': 'minecraft:spruce_boat',
+    'birch': 'minecraft:birch_boat',
+    'jungle': 'minecraft:jungle_boat',
+    'acacia': 'minecraft:acacia_boat',
+    'dark_oak': 'minecraft:dark_oak_boat'
+}
+
+CONTAINER_ENTITIES = {'MinecartChest', 'minecraft:chest_minecart', 'MinecartHopper', 'minecraft:hopper_minecart'} # entities whose Items count as containers rather than mob inventories
+DROPPED_ITEM_ENTITIES = {'Item', 'minecraft:item'}
+ITEM_FRAME_ENTITIES = {'ItemFrame', 'minecraft:item_frame'}
+
+def _nbt_to_python(tag):
+    import nbt.nbt
+
+    if isinstance(tag, nbt.nbt.TAG_Compound):
+        return {child.name: _nbt_to_python(child) for child in tag.tags}
+    if isinstance(tag, nbt.nbt.TAG_List):
+        return [_nbt_to_python(child) for child in tag.tags]
+    return tag.value
+
+def _count_slots(counts, slots):
+    """Adds the items in the given inventory slots to a Counter mapping Items to numbers of items. Empty slots and unknown items are skipped."""
+    for slot in slots:
+        if not slot or 'id' not in slot:
+            continue # empty equipment slot
+        try:
+            item = alltheitems.item.Item.from_slot(slot)
+        except Exception:
+            continue # unknown or malformed item
+        counts[item] += slot.get('Count', 1)
+
+def count_entity(item_counts, entity):
+    """Adds the items in and of an entity (as stored in the Entities list of a chunk) to the given dict mapping the names from ITEM_COLUMNS to Counters."""
+    entity_id = entity.get('id')
+    if entity_id in DROPPED_ITEM_ENTITIES:
+        _count_slots(item_counts['dropped'], [entity.get('Item')])
+        return
+    if entity_id in ENTITY_ITEMS:
+        item_id = BOAT_ITEMS.get(entity.get('Type'), 'minecraft:boat') if ENTITY_ITEMS[entity_id] == 'minecraft:boat' else ENTITY_ITEMS[entity_id]
+        _count_slots(item_counts['other'], [{'id': item_id, 'Damage': 0, 'Count': 1}])
+    if entity_id in ITEM_FRAME_ENTITIES:
+        _count_slots(item_counts['containers'], [entity.get('Item')])
+    _count_slots(item_counts['containers' if entity_id in CONTAINER_ENTITIES else 'other'], entity.get('Items', []))
+    # mob equipment, armor stands, and horse saddles and armor
+    for equipment in ('Equipment', 'ArmorItems', 'HandItems'):
+        _count_slots(item_counts['other'], entity.get(equipment, []))
+    _count_slots(item_counts['other'], [entity.get('SaddleItem'), entity.get('ArmorItem')])
+    for passenger in entity.get('Passengers', []):
+        count_entity(item_counts, passenger)
+
+COUNT_CACHE_VERSION = 1 # bump this whenever the way chunks are counted changes, to discard the partial counts in the count cache
+
+def count_cache_path(dimension, region_x, region_z):
+    """Returns the path to the file caching the partial counts of the chunk columns in a region file."""
+    return ati.cache_root / 'item-counts' / '{}.r.{}.{}.json'.format(dimension.value, region_x, region_z)
+
+def _load_count_cache(path, items_mtime):
+    """Returns the partial counts from a count cache file, as a dict mapping 'x,z' chunk coordinates to partial counts, or an empty dict if the file is missing, outdated, or unreadable."""
+    try:
+        with path.open() as cache_f:
+            cache = json.load(cache_f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if cache.get('version') != COUNT_CACHE_VERSION or cache.get('itemsMtime') != items_mtime:
+        return {} # counted with a different item resolution
+    return cache['chunks']
+
+def _count_column(world, dimension, column, region):
+    """Counts the blocks and the items in tile entities and entities in one chunk column. The entities are read from the given nbt.region.RegionFile, which may be None if the region file does not exist.
+
+    Returns a tuple (partial, complete). partial is a partial count as stored in the count cache: a dict with the number of sections, the block counts as a list of [block ID, damage value, count] triples, and a list of [item stub, count] pairs for each of the names from ITEM_COLUMNS. complete is False if the chunk's entities could not be read, e.g. because the server was saving the region file, in which case the partial count must not be cached.
+    """
+    import api.v2
+    import nbt.region
+    import alltheitems.world
+
+    histogram = numpy.zeros(0, dtype=numpy.int64) # indexed by 256 * palette code + damage value, the palette is local to this process
+    item_counts = {column_name: collections.Counter() for column_name in ITEM_COLUMNS}
+    for chunk_y in range(16):
+        section = alltheitems.world.Section.from_api(api.v2.api_chunk_info(world, dimension, column['x'], chunk_y, column['z']))
+        section_histogram = numpy.bincount(section.ids.astype(numpy.int64) << 8 | section.damage)
+        if len(section_histogram) > len(histogram):
+            histogram = numpy.concatenate((histogram, numpy.zeros(len(section_histogram) - len(histogram), dtype=numpy.int64)))
+        histogram[:len(section_histogram)] += section_histogram
+        for tile_entity in section.tile_entities.values():
+            _count_slots(item_counts['containers'], tile_entity.get('Items', []))
+            _count_slots(item_counts['containers'], [tile_entity.get('RecordItem')])
+    # entities are not part of the chunk API, read them from the region file
+    complete = True
+    if region is not None:
+        try:
+            chunk = region.get_nbt(column['x'] & 31, column['z'] & 31)
+        except LookupError:
+            pass # chunk not generated
+        except nbt.region.RegionFileFormatError:
+            complete = False # probably being written
+        else:
+            if 'Entities' in chunk['Level']:
+                for entity in chunk['Level']['Entities'].tags:
+                    count_entity(item_counts, _nbt_to_python(entity))
+    palette_ids = alltheitems.world.PALETTE.ids
+    partial = {
+        'sections': 16,
+        'blocks': [[palette_ids[code >> 8], code & 0xff, int(histogram[code])] for code in numpy.flatnonzero(histogram).tolist()]
+    }
+    for column_name, column_counts in item_counts.items():
+        partial[column_name] = [[item.stub, count] for item, count in column_counts.items()]
+    return partial, complete
+
+def count_region(dimension, columns):
+    """Counts the blocks and the items in tile entities and entities in the given chunk columns, which should all be in the same region file.
+
+    Partial counts are cached per chunk column in a file per region (see count_cache_path), keyed by the chunk's last modification time from the region header, so only chunk columns which have changed since the last run are decoded again.
+
+    Returns a tuple (block_counts, item_counts, num_sections, num_cached), where block_counts is a collections.Counter mapping (block ID, damage value) pairs to numbers of blocks, item_counts is a dict mapping the names from ITEM_COLUMNS to Counters mapping Items to numbers of items, num_sections is the number of sections decoded, and num_cached is the number of chunk columns whose counts were taken from the cache.
+    """
+    import api.util2
+    import minecraft
+    import nbt.region
+    import alltheitems.world
+
+    world = minecraft.World()
+    region_dimension = dimension if isinstance(dimension, api.util2.Dimension) else api.util2.Dimension[dimension]
+    region_x, region_z = columns[0]['x'] >> 5, columns[0]['z'] >> 5
+    cache_path = count_cache_path(region_dimension, region_x, region_z)
+    items_mtime = (ati.assets_root / 'json' / 'items.json').stat().st_mtime_ns
+    cache = _load_count_cache(cache_path, items_mtime)
+    timestamps = alltheitems.world.region_timestamps(world, region_dimension, region_x, region_z) # read before decoding, so chunks saved during the run are decoded again next time
+    new_cache = {}
+    block_counts = collections.Counter()
+    item_counts = {column_name: collections.Counter() for column_name in ITEM_COLUMNS}
+    num_sections = 0
+    num_cached = 0
+    region = None
+    region_error = False
+    for column in columns:
+        key = '{},{}'.format(column['x'], column['z'])
+        timestamp = 0 if timestamps is None else timestamps[(column['x'] & 31) + 32 * (column['z'] & 31)]
+        partial = cache.get(key)
+        if timestamp and partial is not None and partial['timestamp'] == timestamp:
+            num_cached += 1
+        else:
+            if region is None and timestamps is not None and not region_error:
+                try:
+                    region = nbt.region.RegionFile(str(alltheitems.world.region_path(world, region_dimension, column['x'], column['z'])))
+                except nbt.region.RegionFileFormatError:
+                    region_error = True # probably being written, count without entities
+            partial, complete = _count_column(world, dimension, column, region)
+            if region_error or not complete:
+                timestamp = 0 # don't cache counts without entities, so the chunk is counted again next time
+            partial['timestamp'] = timestamp
+            num_sections += partial['sections']
+        if timestamp:
+            new_cache[key] = partial
+        for block_id, damage, count in partial['blocks']:
+            block_counts[block_id, damage] += count
+        for column_name in ITEM_COLUMNS:
+            for stub, count in partial[column_name]:
+                item_counts[column_name][alltheitems.item.Item(stub)] += count
+    if region is not None:
+        region.close()
+    if num_cached < len(new_cache) or len(new_cache) < len(cache):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp{}'.format(os.getpid()))
+        with tmp_path.open('w') as cache_f:
+            json.dump({'version': COUNT_CACHE_VERSION, 'itemsMtime': items_mtime, 'chunks': new_cache}, cache_f)
+        os.replace(str(tmp_path), str(cache_path))
+    return block_counts, item_counts, num_sections, num_cached
+
+def count_world(chunk_overview, *, workers=None):
+    """Counts the blocks and the items in tile entities and entities in all chunk columns from api.v2.api_chunk_overview, one region file per task in a pool of worker processes (defaults to the number of CPUs). Chunk columns which have not changed since the last run are not decoded again, see count_region.
+
+    Returns a tuple (block_counts, item_counts), where block_counts is a dict mapping Block objects to numbers of blocks and item_counts is a dict mapping the names from ITEM_COLUMNS to Counters mapping Items to numbers of items.
+    """
+    import concurrent.futures
+    import time
+
+    shards = region_shards(chunk_overview)
+    counts = collections.Counter()
+    item_counts = {column_name: collections.Counter() for column_name in ITEM_COLUMNS}
+    num_sections = 0
+    num_cached = 0
+    start = last_report = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(count_region, dimension, columns) for dimension, columns in shards]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            region_counts, region_item_counts, region_sections, region_cached = future.result()
+            counts.update(region_counts)
+            for column_name, column_counts in region_item_counts.items():
+                item_counts[column_name].update(column_counts)
+            num_sections += region_sections
+            num_cached += region_cached
+            now = time.perf_counter()
+            if now - last_report >= 10 or i == len(futures) - 1:
+                print('counting blocks and entities: {} of {} regions, {} sections decoded, {:.0f} sections/s, {} chunk columns unchanged'.format(i + 1, len(futures), num_sections, num_sections / max(now - start, 1e-9), num_cached), flush=True)
+                last_report = now
+    return resolve_block_counts(counts), item_counts
+
+def resolve_block_counts(counts):
+    """Takes a mapping from (block ID, damage value) pairs to numbers of blocks, as returned by count_region. Returns a dict mapping Block objects to numbers of blocks, resolving each pair only once."""
+    block_counts = collections.defaultdict(lambda: 0)
+    for (block_id, damage), count in counts.items():
+        block_counts[alltheitems.item.Block.from_chunk({'id': block_id, 'damage': damage})] += count
+    return block_counts
+
+def item_count_rows(block_counts, inv_counts, item_counts):
+    """Returns the rows of item-counts.json, one for each block and item from alltheitems.item.all. block_counts and inv_counts map Blocks and Items to numbers, item_counts maps the names from ITEM_COLUMNS to such mappings."""
+    counts = []
+    for block, item in alltheitems.item.all():
+        counts.append({
+            'itemStub': (block if item is None else item).stub,
+            'blocks': block_counts.get(block, 0),
+            'inventories': inv_counts.get(item, 0),
+            'containers': item_counts['containers'].get(item, 0),
+            'dropped': item_counts['dropped'].get(item, 0),
+            'other': item_counts['other'].get(item, 0)
+        })
+    return counts
+
 if __name__ == '__main__':
     import api.util2
     import api.v2
-    import collections
     import minecraft
     import pathlib
+    import time
 
     out_file = pathlib.Path(sys.argv[1])
-    with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-        items_data = json.load(items_file)
-    block_counts = collections.defaultdict(lambda: 0)
-    for dimension, columns in api.v2.api_chunk_overview(minecraft.World()).items():
-        for i, column in enumerate(columns):
-            print('counting blocks: {} column {} of {}'.format(dimension, i + 1, len(columns)), end='\r', flush=True)
-            chunk_x = column['x']
-            chunk_z = column['z']
-            for chunk_y in range(16):
-                section = api.v2.api_chunk_info(minecraft.World(), dimension, chunk_x, chunk_y, chunk_z)
-                for layer in section:
-                    for row in layer:
-                        for block_info in row:
-                            block = alltheitems.item.Block.from_chunk(block_info, items_data=items_data)
-                            block_counts[block] += 1
-        print(flush=True)
-    print('counting player inventories', end='\r', flush=True)
+    block_counts, item_counts = count_world(api.v2.api_chunk_overview(minecraft.World()), workers=int(sys.argv[2]) if len(sys.argv) > 2 else None)
     inv_counts = collections.defaultdict(lambda: 0)
-    for player_data_file in (minecraft.World().world_path / 'playerdata').iterdir():
+    player_data_files = list((minecraft.World().world_path / 'playerdata').iterdir())
+    start = time.perf_counter()
+    for player_data_file in player_data_files:
         player_data = api.util2.nbtfile_to_dict(player_data_file)
         for inventory_type in ('Inventory', 'EnderItems'):
             for slot in player_data[inventory_type]:
                 try:
-                    item = alltheitems.item.Item.from_slot(slot, items_data=items_data)
+                    item = alltheitems.item.Item.from_slot(slot)
                 except:
                     continue
                 inv_counts[item] += slot['Count']
-    print(flush=True)
-    counts = []
-    for block, item in alltheitems.item.all():
-        blocks = block_counts[block]
-        inventories = inv_counts[item]
-        containers = 0 #TODO
-        dropped = 0 #TODO
-        other = 0 #TODO
-        counts.append({
-            'itemStub': (block if item is None else item).stub,
-            'blocks': blocks,
-            'inventories': inventories,
-            'containers': containers,
-            'dropped': dropped,
-            'other': other
-        })
-    with out_file.open('w') as f:
+    print('counting player inventories: {} players, {:.0f} players/s'.format(len(player_data_files), len(player_data_files) / max(time.perf_counter() - start, 1e-9)), flush=True)
+    counts = item_count_rows(block_counts, inv_counts, item_counts)
+    COUNT_STORE.add_snapshot(counts) # before writing item-counts.json, so a new store imports the previous run's counts rather than this run's
+    tmp_file = out_file.with_name(out_file.name + '.tmp')
+    with tmp_file.open('w') as f:
         json.dump(counts, f, sort_keys=True, indent=4)
+    os.replace(str(tmp_file), str(out_file)) # the stats page may be reading the old file
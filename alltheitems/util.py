@@ -1,8 +1,17 @@
 import alltheitems.__main__ as ati
 
+import contextlib
 import enum
+import fcntl
+import functools
 import json
 import more_itertools
+import os
+import threading
+import time
+import zlib
+
+MISSING = object() # sentinel for values which may be None
 
 class OrderedEnum(enum.Enum):
     def __ge__(self, other):
@@ -25,18 +34,183 @@ class OrderedEnum(enum.Enum):
             return self.value < other.value
         return NotImplemented
 
+class FileCache:
+    """A value loaded from a file once per process and reloaded when the file's modification time changes.
+
+    Required arguments:
+    path -- A pathlib.Path pointing to the file.
+    load -- A function which is called with the opened file and returns the value to cache. Defaults to json.load.
+
+    Keyword-only arguments:
+    check_interval -- Minimum number of seconds between two checks of the file's modification time. Defaults to 1 second, so hot loops can call this without a stat per call.
+    """
+
+    def __init__(self, path, load=json.load, *, check_interval=1.0):
+        self.path = path
+        self.load = load
+        self.check_interval = check_interval
+        self.hits = 0
+        self.reloads = 0
+        self.version = 0 # changes whenever the value is reloaded
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = None
+        self._state = 0, None
+
+    def __call__(self):
+        """Returns the cached value, reloading it from disk first if the file has changed."""
+        return self.versioned()[1]
+
+    def versioned(self):
+        """Returns a (version, value) tuple, where version changes whenever the value is reloaded."""
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            self.hits += 1
+            return self._state
+        with self._lock:
+            mtime = self.path.stat().st_mtime_ns
+            if self._mtime == mtime:
+                self.hits += 1
+            else:
+                with self.path.open() as f:
+                    value = self.load(f)
+                self._mtime = mtime
+                self.reloads += 1
+                self._state = self.reloads, value
+                self.version = self.reloads
+            self._last_check = now
+            return self._state
+
+    def derive(self, f):
+        """Decorator for a function of the cached value. The decorated function takes no arguments and is only recomputed after the file has been reloaded."""
+        memo = None, None
+
+        @functools.wraps(f)
+        def wrapper():
+            nonlocal memo
+            version, value = self.versioned()
+            memo_version, result = memo
+            if memo_version != version:
+                result = f(value)
+                memo = version, result
+            return result
+
+        return wrapper
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'reloads': self.reloads
+        }
+
+class SingleFlight:
+    """Makes sure that only one thread in one process computes a given value at a time.
+
+    Each key maps to an offset derived from the key. Across processes, such as the workers of a preforking server, a computation locks the byte at that offset of a shared lock file. Since these locks belong to the process rather than to a thread, threads within a process first take a thread lock for the offset, so only one thread per process ever holds or releases a given byte. Different keys may share an offset, which only means they are computed one after the other. If the lock file's directory doesn't exist, values are only coalesced within the process.
+
+    Required arguments:
+    lock_path -- A pathlib.Path pointing to the lock file. It is created if it doesn't exist.
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        self.computed = 0
+        self.waited = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._locks = None # maps lock file offsets to thread locks
+        self._fd = None
+
+    def _thread_lock(self, offset):
+        with self._lock:
+            if self._pid != os.getpid():
+                # locks held by other threads at the time of a fork are never released in the child
+                self._pid = os.getpid()
+                self._locks = {}
+                self._fd = None
+            lock = self._locks.get(offset)
+            if lock is None:
+                lock = self._locks[offset] = threading.Lock()
+            if self._fd is None and self.lock_path.parent.exists():
+                # the file is never closed, since closing any descriptor of a file releases all of the process's locks on it
+                self._fd = os.open(str(self.lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+            return lock, self._fd
+
+    @contextlib.contextmanager
+    def _locked(self, key, *, blocking):
+        offset = zlib.crc32(repr(key).encode())
+        lock, fd = self._thread_lock(offset)
+        if not lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fd is not None:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                except (BlockingIOError, PermissionError):
+                    # another process holds the lock, only raised in non-blocking mode. Other errors, such as running out of locks, are raised rather than computing without the lock.
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+            else:
+                yield True
+        finally:
+            lock.release()
+
+    def run(self, key, compute, *, recheck=None, stale=MISSING):
+        """Returns the result of compute() for the given key, unless another thread or process is already computing it.
+
+        Required arguments:
+        key -- Identifies the value. Must be hashable and have a stable repr.
+        compute -- A function which takes no arguments and computes the value, including storing it wherever other processes will look for it.
+
+        Keyword-only arguments:
+        recheck -- A function which takes no arguments and returns the stored value if it's now up to date, or MISSING. It is called after waiting for another computation of the same key, and compute is only called if it returns MISSING.
+        stale -- If given, this value is returned right away instead of waiting for another computation of the same key.
+
+        Raises:
+        OSError -- if the lock file can't be locked for a reason other than another process holding the lock.
+        """
+        with self._locked(key, blocking=False) as acquired:
+            if acquired:
+                self.computed += 1
+                return compute()
+        if stale is not MISSING:
+            self.stale += 1
+            return stale
+        with self._locked(key, blocking=True) as acquired:
+            if not acquired:
+                raise RuntimeError('Failed to lock {!r} for computing it'.format(key))
+            self.waited += 1
+            if recheck is not None:
+                value = recheck()
+                if value is not MISSING:
+                    return value
+            self.computed += 1
+            return compute()
+
+    @property
+    def stats(self):
+        return {
+            'computed': self.computed,
+            'waited': self.waited,
+            'stale': self.stale
+        }
+
 def format_num(number, ord=False):
     result = ''.join(list(reversed('\u202f'.join(''.join(l) for l in more_itertools.chunked(reversed(str(number)), 3)))))
     if ord:
         result += ordinal(number)
     return result
 
-def inventory_table(rows, *, table_id=None, style=None, items_data=None):
+def inventory_table(rows, *, table_id=None, style=None):
     import alltheitems.item
 
-    if items_data is None:
-        with (ati.assets_root / 'json' / 'items.json').open() as items_file:
-            items_data = json.load(items_file)
     result = '<table class="inventory-table"'
     if table_id is not None:
         result += ' id="{}"'.format(table_id)
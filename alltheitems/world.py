@@ -2,11 +2,227 @@ import alltheitems.__main__ as ati
 
 import api.util2
 import api.v2
+import collections
+import contextlib
 import enum
 import minecraft
+import numpy
+import threading
+import time
+
+TILE_ENTITY_SIZE_ESTIMATE = 1024 # approximate memory used by one decoded tile entity, in bytes
+
+class Palette:
+    """Interns block IDs as small integers for the ID arrays of sections. Shared by the whole process."""
+
+    def __init__(self):
+        self.codes = {}
+        self.ids = []
+        self._lock = threading.Lock()
+
+    def code(self, block_id):
+        try:
+            return self.codes[block_id]
+        except KeyError:
+            with self._lock:
+                if block_id not in self.codes:
+                    self.ids.append(block_id)
+                    self.codes[block_id] = len(self.ids) - 1
+                return self.codes[block_id]
+
+PALETTE = Palette()
+
+class Section:
+    """A compact 16×16×16 chunk section.
+
+    Block IDs are stored as a flat uint16 array of PALETTE codes and damage values as a flat uint8 array, both indexed by 256 * y + 16 * z + x in local coordinates. Tile entities are kept in a sparse dict keyed by the same index.
+    """
+
+    __slots__ = ('ids', 'damage', 'tile_entities')
+
+    def __init__(self, ids, damage, tile_entities):
+        self.ids = ids
+        self.damage = damage
+        self.tile_entities = tile_entities
+
+    @classmethod
+    def from_api(cls, section_info):
+        """Converts a section as returned by api.v2.api_chunk_info (nested lists of block dicts, indexed [y][z][x])."""
+        code = PALETTE.code
+        blocks = [block_info for layer in section_info for row in layer for block_info in row]
+        ids = numpy.fromiter((code(block_info.get('id', 'minecraft:air')) for block_info in blocks), dtype=numpy.uint16, count=4096)
+        damage = numpy.fromiter((block_info.get('damage', 0) for block_info in blocks), dtype=numpy.uint8, count=4096)
+        tile_entities = {index: block_info['tileEntity'] for index, block_info in enumerate(blocks) if 'tileEntity' in block_info}
+        return cls(ids, damage, tile_entities)
+
+    def __getitem__(self, local_coords):
+        """Returns a BlockView for the given local (x, y, z) coordinates."""
+        x, y, z = local_coords
+        return BlockView(self, 256 * y + 16 * z + x)
+
+    @property
+    def size(self):
+        """Approximate memory used by this section, in bytes."""
+        return self.ids.nbytes + self.damage.nbytes + TILE_ENTITY_SIZE_ESTIMATE * len(self.tile_entities)
+
+class BlockView:
+    """A read-only view of one block in a Section, supporting the same lookups as the block dicts returned by api.v2.api_chunk_info: block['id'], block['damage'], and block['tileEntity']."""
+
+    __slots__ = ('section', 'index')
+
+    def __init__(self, section, index):
+        self.section = section
+        self.index = index
+
+    def __contains__(self, key):
+        return key in ('id', 'damage') or key == 'tileEntity' and self.index in self.section.tile_entities
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return PALETTE.ids[self.section.ids[self.index]]
+        elif key == 'damage':
+            return int(self.section.damage[self.index])
+        elif key == 'tileEntity':
+            return self.section.tile_entities[self.index]
+        else:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return 'BlockView({!r})'.format(dict(self.items()))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        for key in ('id', 'damage', 'tileEntity'):
+            if key in self:
+                yield key, self[key]
+
+def region_path(world, dimension, chunk_x, chunk_z):
+    """Returns the path to the region file containing the given chunk column."""
+    if dimension.value == 0:
+        region_dir = world.world_path / 'region'
+    else:
+        region_dir = world.world_path / 'DIM{}'.format(dimension.value) / 'region'
+    return region_dir / 'r.{}.{}.mca'.format(chunk_x >> 5, chunk_z >> 5)
+
+def chunk_timestamp(world, dimension, chunk_x, chunk_z):
+    """Returns the last modification time of a chunk column as stored in the region file header, or None if the chunk has not been generated."""
+    try:
+        with region_path(world, dimension, chunk_x, chunk_z).open('rb') as region_file:
+            region_file.seek(4096 + 4 * ((chunk_x & 31) + 32 * (chunk_z & 31)))
+            timestamp = int.from_bytes(region_file.read(4), 'big')
+    except FileNotFoundError:
+        return None
+    return timestamp or None
+
+def region_timestamps(world, dimension, region_x, region_z):
+    """Returns the last modification times of all chunk columns in a region file as stored in its header, as a list of 1024 ints indexed by (chunk_x & 31) + 32 * (chunk_z & 31), with 0 for chunks which have not been generated. Returns None if the region file does not exist."""
+    try:
+        with region_path(world, dimension, region_x << 5, region_z << 5).open('rb') as region_file:
+            region_file.seek(4096)
+            header = region_file.read(4096)
+    except FileNotFoundError:
+        return None
+    header = header.ljust(4096, b'\0')
+    return [int.from_bytes(header[i:i + 4], 'big') for i in range(0, 4096, 4)]
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class ChunkCache:
+    """A process-wide LRU cache of decoded chunk sections.
+
+    Sections are keyed by (world path, dimension, chunk x, chunk y, chunk z). A cached section is revalidated at most every revalidate_after seconds: if the region file's modification time has changed, the chunk's timestamp in the region header is compared, and the section is fetched again if that has changed too.
+
+    Keyword-only arguments:
+    max_bytes -- The memory budget. Least recently used sections are evicted when the sections in the cache exceed it. Defaults to 64 MiB.
+    revalidate_after -- Number of seconds after which a cached section is checked against the region file again. Defaults to 5 seconds.
+    """
+
+    def __init__(self, *, max_bytes=64 * 1024 * 1024, revalidate_after=5.0):
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.size = 0
+        self._lock = threading.Lock()
+        self._sections = collections.OrderedDict() # maps keys to [section, size, region mtime, chunk timestamp, last validation time]
+
+    def section(self, world, dimension, chunk_x, chunk_y, chunk_z):
+        """Returns the Section at the given chunk coordinates, fetching it through api.v2.api_chunk_info if it is not cached or out of date."""
+        return self.section_with_timestamp(world, dimension, chunk_x, chunk_y, chunk_z)[0]
+
+    def section_with_timestamp(self, world, dimension, chunk_x, chunk_y, chunk_z):
+        """Like section, but returns a tuple (section, timestamp), where timestamp is the chunk_timestamp read before the section was fetched."""
+        key = str(world.world_path), dimension, chunk_x, chunk_y, chunk_z
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sections.get(key)
+            if entry is not None:
+                section, _, region_mtime, timestamp, checked_at = entry
+                if now - checked_at < self.revalidate_after:
+                    self._sections.move_to_end(key)
+                    self.hits += 1
+                    return section, timestamp
+        if entry is not None:
+            current_mtime = _mtime(region_path(world, dimension, chunk_x, chunk_z))
+            if current_mtime == region_mtime or chunk_timestamp(world, dimension, chunk_x, chunk_z) == timestamp:
+                with self._lock:
+                    entry[2] = current_mtime
+                    entry[4] = now
+                    if key in self._sections:
+                        self._sections.move_to_end(key)
+                    self.hits += 1
+                return section, timestamp
+            with self._lock:
+                self.invalidations += 1
+        # read the region metadata before the section so a concurrent write invalidates the entry on the next check
+        region_mtime = _mtime(region_path(world, dimension, chunk_x, chunk_z))
+        timestamp = chunk_timestamp(world, dimension, chunk_x, chunk_z)
+        section = Section.from_api(api.v2.api_chunk_info(world, dimension, chunk_x, chunk_y, chunk_z))
+        size = section.size
+        with self._lock:
+            self.misses += 1
+            old_entry = self._sections.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+            self._sections[key] = [section, size, region_mtime, timestamp, now]
+            self.size += size
+            while self.size > self.max_bytes and len(self._sections) > 1:
+                _, (_, evicted_size, _, _, _) = self._sections.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+        return section, timestamp
+
+    def clear(self):
+        with self._lock:
+            self._sections.clear()
+            self.size = 0
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'sections': len(self._sections),
+            'bytes': self.size
+        }
+
+CHUNK_CACHE = ChunkCache()
 
 class World:
-    def __init__(self, world=None):
+    def __init__(self, world=None, *, chunk_cache=CHUNK_CACHE):
         if world is None:
             self.world = minecraft.World()
         elif isinstance(world, minecraft.World):
@@ -15,13 +231,125 @@ class World:
             self.world = minecraft.World(world)
         else:
             raise TypeError('Invalid world type: {}'.format(type(world)))
+        self.chunk_cache = chunk_cache
+        self._recordings = []
 
-    def block_at(self, x, y, z, dimension=api.util2.Dimension.overworld, *, chunk_cache=None):
-        if chunk_cache is None:
-            chunk_cache = {}
+    def block_at(self, x, y, z, dimension=api.util2.Dimension.overworld):
         chunk_x, block_x = divmod(x, 16)
         chunk_y, block_y = divmod(y, 16)
         chunk_z, block_z = divmod(z, 16)
-        if (chunk_x, chunk_y, chunk_z) not in chunk_cache:
-            chunk_cache[chunk_x, chunk_y, chunk_z] = api.v2.api_chunk_info(self.world, dimension, chunk_x, chunk_y, chunk_z)
-        return chunk_cache[chunk_x, chunk_y, chunk_z][block_y][block_z][block_x]
+        return self.section(chunk_x, chunk_y, chunk_z, dimension)[block_x, block_y, block_z]
+
+    def section(self, chunk_x, chunk_y, chunk_z, dimension=api.util2.Dimension.overworld):
+        if not self._recordings:
+            return self.chunk_cache.section(self.world, dimension, chunk_x, chunk_y, chunk_z)
+        section, timestamp = self.chunk_cache.section_with_timestamp(self.world, dimension, chunk_x, chunk_y, chunk_z)
+        for sections in self._recordings:
+            sections.setdefault((dimension.value, chunk_x, chunk_y, chunk_z), timestamp)
+        return section
+
+    @contextlib.contextmanager
+    def recording(self, sections):
+        """Records the sections read through this World within the context into the given dict, mapping (dimension, chunk_x, chunk_y, chunk_z) keys to the chunk timestamp of the section as it was read. dimension is the dimension's value."""
+        self._recordings.append(sections)
+        try:
+            yield sections
+        finally:
+            self._recordings.pop()
+
+    def record(self, sections):
+        """Adds the given sections, a dict as filled by recording, to the active recordings. Used by callers which memoize data read through this World."""
+        for recording in self._recordings:
+            for key, timestamp in sections.items():
+                recording.setdefault(key, timestamp)
+
+    def chunk_timestamps(self, sections):
+        """Takes an iterable of section keys as recorded by recording. Returns a dict mapping each key to the chunk_timestamp of its chunk column, reading each column's timestamp only once."""
+        columns = {}
+        result = {}
+        for dimension, chunk_x, chunk_y, chunk_z in sections:
+            if (dimension, chunk_x, chunk_z) not in columns:
+                columns[dimension, chunk_x, chunk_z] = chunk_timestamp(self.world, api.util2.Dimension(dimension), chunk_x, chunk_z)
+            result[dimension, chunk_x, chunk_y, chunk_z] = columns[dimension, chunk_x, chunk_z]
+        return result
+
+    def blocks_at(self, coords, dimension=api.util2.Dimension.overworld):
+        """Returns a list of BlockViews for an iterable of (x, y, z) coordinates, in the same order. Each chunk section is looked up only once."""
+        coords = list(coords)
+        result = [None] * len(coords)
+        by_section = collections.defaultdict(list)
+        for i, (x, y, z) in enumerate(coords):
+            by_section[x >> 4, y >> 4, z >> 4].append(i)
+        for (chunk_x, chunk_y, chunk_z), indexes in by_section.items():
+            section = self.section(chunk_x, chunk_y, chunk_z, dimension)
+            for i in indexes:
+                x, y, z = coords[i]
+                result[i] = BlockView(section, 256 * (y & 15) + 16 * (z & 15) + (x & 15))
+        return result
+
+    def box(self, x0, y0, z0, x1, y1, z1, dimension=api.util2.Dimension.overworld):
+        """Returns a Box with the blocks between the two given corners (inclusive)."""
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        z0, z1 = sorted((z0, z1))
+        box = Box((x0, y0, z0), (x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1))
+        for chunk_y in range(y0 >> 4, (y1 >> 4) + 1):
+            for chunk_z in range(z0 >> 4, (z1 >> 4) + 1):
+                for chunk_x in range(x0 >> 4, (x1 >> 4) + 1):
+                    box.paste(self.section(chunk_x, chunk_y, chunk_z, dimension), chunk_x, chunk_y, chunk_z)
+        return box
+
+class Box:
+    """A cuboid of blocks copied out of one or more sections.
+
+    ids and damage are flat arrays like those of a Section, indexed by (y * size_z + z) * size_x + x relative to origin; ids3d and damage3d are the same arrays shaped [y][z][x]. Indexing with absolute (x, y, z) coordinates returns a BlockView.
+    """
+
+    __slots__ = ('origin', 'shape', 'ids', 'damage', 'tile_entities')
+
+    def __init__(self, origin, size):
+        self.origin = origin
+        size_x, size_y, size_z = size
+        self.shape = size_y, size_z, size_x
+        self.ids = numpy.zeros(size_x * size_y * size_z, dtype=numpy.uint16)
+        self.damage = numpy.zeros(size_x * size_y * size_z, dtype=numpy.uint8)
+        self.tile_entities = {}
+
+    def __getitem__(self, coords):
+        return BlockView(self, self.index(*coords))
+
+    @property
+    def damage3d(self):
+        return self.damage.reshape(self.shape)
+
+    @property
+    def ids3d(self):
+        return self.ids.reshape(self.shape)
+
+    def index(self, x, y, z):
+        """Returns the flat array index for the given absolute coordinates."""
+        origin_x, origin_y, origin_z = self.origin
+        size_y, size_z, size_x = self.shape
+        local_x, local_y, local_z = x - origin_x, y - origin_y, z - origin_z
+        if not (0 <= local_x < size_x and 0 <= local_y < size_y and 0 <= local_z < size_z):
+            raise IndexError('Coordinates {} {} {} are outside of the box'.format(x, y, z))
+        return (local_y * size_z + local_z) * size_x + local_x
+
+    def paste(self, section, chunk_x, chunk_y, chunk_z):
+        """Copies the part of a section which overlaps this box into it."""
+        origin_x, origin_y, origin_z = self.origin
+        size_y, size_z, size_x = self.shape
+        # overlap in absolute coordinates
+        x0, x1 = max(origin_x, 16 * chunk_x), min(origin_x + size_x, 16 * chunk_x + 16)
+        y0, y1 = max(origin_y, 16 * chunk_y), min(origin_y + size_y, 16 * chunk_y + 16)
+        z0, z1 = max(origin_z, 16 * chunk_z), min(origin_z + size_z, 16 * chunk_z + 16)
+        if x0 >= x1 or y0 >= y1 or z0 >= z1:
+            return
+        box_slice = slice(y0 - origin_y, y1 - origin_y), slice(z0 - origin_z, z1 - origin_z), slice(x0 - origin_x, x1 - origin_x)
+        section_slice = slice(y0 & 15, (y1 - 1 & 15) + 1), slice(z0 & 15, (z1 - 1 & 15) + 1), slice(x0 & 15, (x1 - 1 & 15) + 1)
+        self.ids3d[box_slice] = section.ids.reshape(16, 16, 16)[section_slice]
+        self.damage3d[box_slice] = section.damage.reshape(16, 16, 16)[section_slice]
+        for index, tile_entity in section.tile_entities.items():
+            x, y, z = 16 * chunk_x + (index & 15), 16 * chunk_y + (index >> 8), 16 * chunk_z + (index >> 4 & 15)
+            if x0 <= x < x1 and y0 <= y < y1 and z0 <= z < z1:
+                self.tile_entities[((y - origin_y) * size_z + z - origin_z) * size_x + x - origin_x] = tile_entity
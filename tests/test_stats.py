@@ -0,0 +1,82 @@
+import collections
+import json
+import random
+
+import api.util2
+import api.v2
+import pytest
+
+import alltheitems.item
+import alltheitems.stats
+
+BLOCK_IDS = ( # stone has damage variants, the others use their damage values for orientation only
+    'minecraft:stone',
+    'minecraft:crafting_table',
+    'minecraft:chest',
+    'minecraft:hopper',
+    'minecraft:air'
+)
+
+COLUMNS = [{'x': 0, 'z': 0}, {'x': 1, 'z': -3}, {'x': -7, 'z': 4}]
+
+def random_block(rng):
+    block_id = rng.choice(BLOCK_IDS + (None,))
+    if block_id is None:
+        return {} # blocks without an ID are counted as air
+    if block_id == 'minecraft:stone':
+        return {'id': block_id, 'damage': rng.randrange(7)}
+    return {'id': block_id, 'damage': rng.randrange(16)}
+
+@pytest.fixture
+def sections(monkeypatch):
+    rng = random.Random(0)
+    sections = {}
+    for column in COLUMNS:
+        for chunk_y in range(16):
+            if chunk_y % 4 == 3:
+                section = [[[{'id': 'minecraft:air'} for x in range(16)] for z in range(16)] for y in range(16)]
+            else:
+                section = [[[random_block(rng) for x in range(16)] for z in range(16)] for y in range(16)]
+            sections[column['x'], chunk_y, column['z']] = section
+    monkeypatch.setattr(api.v2, 'api_chunk_info', lambda world, dimension, x, y, z: sections[x, y, z])
+    return sections
+
+def old_block_counts(sections):
+    """The per-block loop the stats generator used before sections were counted with numpy.bincount."""
+    block_counts = collections.defaultdict(lambda: 0)
+    for section in sections.values():
+        for layer in section:
+            for row in layer:
+                for block_info in row:
+                    block_counts[alltheitems.item.Block.from_chunk(block_info)] += 1
+    return block_counts
+
+def new_block_counts():
+    counts = collections.Counter()
+    for column in COLUMNS:
+        partial, _ = alltheitems.stats._count_column(None, api.util2.Dimension.overworld, column, None)
+        for block_id, damage, count in partial['blocks']:
+            counts[block_id, damage] += count
+    return alltheitems.stats.resolve_block_counts(counts)
+
+def test_bincount_matches_per_block_loop(sections):
+    old = old_block_counts(sections)
+    new = new_block_counts()
+    assert dict(new) == dict(old)
+    assert sum(new.values()) == 4096 * 16 * len(COLUMNS)
+
+def test_item_counts_rows_unchanged(sections):
+    no_items = {column_name: {} for column_name in alltheitems.stats.ITEM_COLUMNS}
+    old_rows = []
+    old = old_block_counts(sections)
+    for block, item in alltheitems.item.all():
+        old_rows.append({
+            'itemStub': (block if item is None else item).stub,
+            'blocks': old[block],
+            'inventories': 0,
+            'containers': 0,
+            'dropped': 0,
+            'other': 0
+        })
+    new_rows = alltheitems.stats.item_count_rows(new_block_counts(), {}, no_items)
+    assert json.dumps(new_rows, sort_keys=True, indent=4) == json.dumps(old_rows, sort_keys=True, indent=4)
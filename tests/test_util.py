@@ -0,0 +1,65 @@
+import errno
+import fcntl
+import os
+import threading
+
+import pytest
+
+import alltheitems.util
+
+def byte_locked_elsewhere(path, offset):
+    """Checks from a forked child process whether another process holds the lock on the given byte of the file."""
+    pid = os.fork()
+    if pid == 0:
+        fd = os.open(str(path), os.O_RDWR)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+        except OSError:
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    return os.WEXITSTATUS(status) == 1
+
+def test_single_flight_colliding_offsets(tmp_path, monkeypatch):
+    monkeypatch.setattr(alltheitems.util.zlib, 'crc32', lambda data: 42) # every key shares one offset
+    flights = alltheitems.util.SingleFlight(tmp_path / 'test.lock')
+    first_started = threading.Event()
+    first_done = threading.Event()
+    release_first = threading.Event()
+    events = []
+
+    def compute_first():
+        first_started.set()
+        release_first.wait(5)
+        events.append('first done')
+        first_done.set()
+        return 1
+
+    def compute_second():
+        events.append('second started')
+        events.append(('second holds byte', byte_locked_elsewhere(tmp_path / 'test.lock', 42)))
+        return 2
+
+    first = threading.Thread(target=flights.run, args=('first', compute_first))
+    first.start()
+    assert first_started.wait(5)
+    assert flights.run('second', compute_second, stale=None) is None # the offset is busy, so the stale value is returned
+    second = threading.Thread(target=flights.run, args=('second', compute_second))
+    second.start()
+    release_first.set()
+    first.join(5)
+    second.join(5)
+    assert events == ['first done', 'second started', ('second holds byte', True)]
+    assert not byte_locked_elsewhere(tmp_path / 'test.lock', 42)
+
+def test_single_flight_lock_error(tmp_path, monkeypatch):
+    flights = alltheitems.util.SingleFlight(tmp_path / 'test.lock')
+
+    def lockf(fd, cmd, *args):
+        raise OSError(errno.ENOLCK, 'No locks available')
+
+    monkeypatch.setattr(alltheitems.util.fcntl, 'lockf', lockf)
+    computed = []
+    with pytest.raises(OSError):
+        flights.run('key', lambda: computed.append(True))
+    assert computed == []